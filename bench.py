@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+import os
+import sys
+import csv
+import time
+import random
+import sqlite3
+import numpy as np
+from lib_glv import Curve256GLV
+from lib_sig import pubkey, schnorr_sign, schnorr_verify, schnorr_batch_verify, ecdsa_sign, ecdsa_verify
+from lib_scores import update_scores, top_scores
+from lib_nt import BENCHMARKS, Kernel
+
+SECP256K1_P = 2**256 - 2**32 - 977
+SECP256K1_B = 7
+SECP256K1_N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+
+KERNEL_BENCH_CSV = 'data/kernel-bench.csv'
+KERNEL_BENCH_FIELDS = ['kernel', 'backend', 'bitlen', 'count', 'seconds', 'ns_per_item', 'agree']
+
+def bench_ns(fn, inputs, warmup:int):
+    """Time fn(x) for each input, the first `warmup` calls are discarded. Returns (samples_ns, outputs)"""
+    samples = []
+    outputs = []
+    for i, x in enumerate(inputs):
+        start = time.perf_counter_ns()
+        result = fn(x)
+        elapsed = time.perf_counter_ns() - start
+        outputs.append(result)
+        if i >= warmup:
+            samples.append(elapsed)
+    return samples, outputs
+
+def bench_stats(samples:list[int]) -> dict[str,float]:
+    x = np.array(samples, dtype=np.float64)
+    p50, p90, p99 = np.percentile(x, [50, 90, 99])
+    return {
+        'trials': len(samples),
+        'min_ns': int(x.min()),
+        'p50_ns': int(p50),
+        'p90_ns': int(p90),
+        'p99_ns': int(p99),
+        'max_ns': int(x.max()),
+        'mean_ns': float(x.mean()),
+        'stdev_ns': float(x.std()),
+    }
+
+def create_benchmark_table(conn:sqlite3.Connection, bitsize:int):
+    table_name = f"benchmark_2p{bitsize}"
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            run_id INTEGER NOT NULL,
+            label TEXT NOT NULL,
+            mx INTEGER,
+            suite TEXT NOT NULL,
+            operation TEXT NOT NULL,
+            warmup INTEGER NOT NULL,
+            trials INTEGER NOT NULL,
+            min_ns INTEGER NOT NULL,
+            p50_ns INTEGER NOT NULL,
+            p90_ns INTEGER NOT NULL,
+            p99_ns INTEGER NOT NULL,
+            max_ns INTEGER NOT NULL,
+            mean_ns REAL NOT NULL,
+            stdev_ns REAL NOT NULL,
+            PRIMARY KEY (run_id, label, suite, operation)
+        )
+    """)
+    conn.commit()
+    return table_name
+
+def store_benchmark(conn:sqlite3.Connection, table_name:str, run_id:int, label:str, mx, suite:str, warmup:int, results:dict[str,dict]):
+    conn.executemany(f"""INSERT OR REPLACE INTO {table_name}
+        (run_id, label, mx, suite, operation, warmup, trials,
+         min_ns, p50_ns, p90_ns, p99_ns, max_ns, mean_ns, stdev_ns)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", [
+        (run_id, label, mx, suite, operation, warmup, s['trials'],
+         s['min_ns'], s['p50_ns'], s['p90_ns'], s['p99_ns'], s['max_ns'], s['mean_ns'], s['stdev_ns'])
+        for operation, s in results.items()
+    ])
+    conn.commit()
+
+def benchmark_curves(conn:sqlite3.Connection, bitsize:int, top_n:int):
+    """Yields (label, mx, p, b, q) for secp256k1 followed by the top-N ranked curves"""
+    from results import get_curves_by_mx, curve_params
+    yield 'secp256k1', (977 if bitsize == 256 else None), SECP256K1_P, SECP256K1_B, SECP256K1_N
+    update_scores(conn, bitsize)
+    for mx, _ in top_scores(conn, bitsize, top_n):
+        for row in get_curves_by_mx(conn, bitsize, mx):
+            p, b, q = curve_params(row)
+            yield f"2^{bitsize}-2^32-{mx} g^{row['generator_power']}", mx, p, b, q
+
+def bench_signatures(curve:Curve256GLV, warmup:int, trials:int, batch_size:int, seed:int=0) -> dict[str,dict]:
+    """Keygen, sign, verify & batch-verify timings for Schnorr and ECDSA"""
+    rng = random.Random(seed)
+    count = warmup + trials
+    secrets = [rng.randint(1, curve.n - 1) for _ in range(count)]
+    msgs = [rng.randbytes(32) for _ in range(count)]
+    results = {}
+
+    samples, pubs = bench_ns(lambda d: pubkey(curve, d), secrets, warmup)
+    results['keygen'] = bench_stats(samples)
+
+    samples, sigs = bench_ns(lambda x: schnorr_sign(curve, *x), zip(secrets, pubs, msgs), warmup)
+    results['schnorr_sign'] = bench_stats(samples)
+    items = list(zip(pubs, msgs, sigs))
+    samples, ok = bench_ns(lambda x: schnorr_verify(curve, *x), items, warmup)
+    assert all(ok)
+    results['schnorr_verify'] = bench_stats(samples)
+    batches = [[items[(i * batch_size + j) % count] for j in range(batch_size)] for i in range(count)]
+    samples, ok = bench_ns(lambda x: schnorr_batch_verify(curve, x, rng), batches, warmup)
+    assert all(ok)
+    results[f'schnorr_batch_verify_{batch_size}'] = bench_stats(samples)
+
+    samples, sigs = bench_ns(lambda x: ecdsa_sign(curve, *x), zip(secrets, msgs), warmup)
+    results['ecdsa_sign'] = bench_stats(samples)
+    samples, ok = bench_ns(lambda x: ecdsa_verify(curve, *x), zip(pubs, msgs, sigs), warmup)
+    assert all(ok)
+    results['ecdsa_verify'] = bench_stats(samples)
+    return results
+
+def timing_scalars(n:int, count:int, rng:random.Random) -> dict[str,list[int]]:
+    """Scalar classes whose bit patterns should expose data-dependent timing"""
+    L = n.bit_length()
+    def low_weight():
+        k = 0
+        for i in rng.sample(range(L - 1), 8):
+            k |= 1 << i
+        return k
+    return {
+        'low_weight': [low_weight() for _ in range(count)],
+        'near_n': [n - rng.randint(1, 2**16) for _ in range(count)],
+        'near_half_n': [n // 2 + rng.randint(-2**16, 2**16) for _ in range(count)],
+        'random': [rng.randint(1, n - 1) for _ in range(count)],
+    }
+
+def bench_timing(curve:Curve256GLV, warmup:int, trials:int, seed:int=0) -> dict[str,dict]:
+    """Per scalar-class timings of k·G for double-and-add, GLV and the co-Z ladder"""
+    rng = random.Random(seed)
+    methods = {
+        'double_and_add': curve.scalar_mul,
+        'glv': curve.scalar_mul_glv,
+        'ladder': curve.scalar_mul_ladder,
+    }
+    results = {}
+    for cls_name, scalars in timing_scalars(int(curve.n), warmup + trials, rng).items():
+        expected = None
+        for method_name, fn in methods.items():
+            samples, outputs = bench_ns(lambda k: fn(curve.G, k), scalars, warmup)
+            if expected is None:
+                expected = outputs
+            assert outputs == expected
+            results[f'{method_name}/{cls_name}'] = bench_stats(samples)
+    return results
+
+def timing_dispersion(results:dict[str,dict]) -> dict[str,float]:
+    """Spread of the median across scalar classes per method, max(p50)/min(p50) - 1"""
+    by_method = {}
+    for operation, s in results.items():
+        method_name = operation.split('/')[0]
+        by_method.setdefault(method_name, []).append(s['p50_ns'])
+    return {k: max(v) / min(v) - 1 for k, v in by_method.items()}
+
+def run_timing(bitsize:int, top_n:int=3, trials:int=25, warmup:int=5):
+    # results needs Sage, imported here so `bench.py kernels` runs without it
+    from results import db_open
+    conn = db_open(bitsize)
+    if conn is None:
+        return 1
+    table_name = create_benchmark_table(conn, bitsize)
+    run_id = int(time.time())
+    for label, mx, p, b, q in benchmark_curves(conn, bitsize, top_n):
+        curve = Curve256GLV.from_params(p, b, q)
+        results = bench_timing(curve, warmup, trials)
+        store_benchmark(conn, table_name, run_id, label, mx, 'timing', warmup, results)
+        print(label)
+        for operation, s in results.items():
+            cv = s['stdev_ns'] / s['mean_ns']
+            print(f"\t{operation:>28}: p50={s['p50_ns']/1e3:.1f}us p99={s['p99_ns']/1e3:.1f}us stdev={s['stdev_ns']/1e3:.1f}us cv={cv:.3f}")
+        for method_name, spread in timing_dispersion(results).items():
+            print(f"\t{method_name:>28}: p50 spread across scalar classes {spread*100:.1f}%")
+        print()
+    conn.close()
+    return 0
+
+def run_signatures(bitsize:int, top_n:int=3, trials:int=25, warmup:int=5, batch_size:int=8):
+    from results import db_open
+    conn = db_open(bitsize)
+    if conn is None:
+        return 1
+    table_name = create_benchmark_table(conn, bitsize)
+    run_id = int(time.time())
+    baseline = None
+    for label, mx, p, b, q in benchmark_curves(conn, bitsize, top_n):
+        curve = Curve256GLV.from_params(p, b, q)
+        results = bench_signatures(curve, warmup, trials, batch_size)
+        store_benchmark(conn, table_name, run_id, label, mx, 'signatures', warmup, results)
+        if baseline is None:
+            baseline = results
+        print(label)
+        for operation, s in results.items():
+            ratio = s['p50_ns'] / baseline[operation]['p50_ns']
+            print(f"\t{operation:>24}: p50={s['p50_ns']/1e3:.1f}us p90={s['p90_ns']/1e3:.1f}us p99={s['p99_ns']/1e3:.1f}us stdev={s['stdev_ns']/1e3:.1f}us  x{ratio:.3f} vs secp256k1")
+        print()
+    conn.close()
+    return 0
+
+def kernel_backends(kernel:Kernel, inputs:list[tuple]) -> dict:
+    """Callables running every input through each form of the kernel, scalar first"""
+    backends = {'scalar': lambda: [kernel.scalar(*x) for x in inputs]}
+    if kernel.batch is not None:
+        backends['batch'] = lambda: list(kernel.batch(*(list(_) for _ in zip(*inputs))))
+    if kernel.reference is not None:
+        backends['sage'] = lambda: [kernel.reference(*x) for x in inputs]
+    return backends
+
+def bench_kernel(kernel:Kernel, bitlen:int, count:int, repeat:int=3, seed:int=0) -> list[dict]:
+    """Best of `repeat` timings of each backend on the same inputs, checked against the scalar outputs"""
+    inputs = kernel.inputs(bitlen, count, random.Random(seed))
+    rows = []
+    expected = None
+    for backend, fn in kernel_backends(kernel, inputs).items():
+        try:
+            seconds = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                outputs = fn()
+                seconds.append(time.perf_counter() - start)
+        except ImportError:
+            # No Sage here, only the backends which don't need it are timed
+            continue
+        if expected is None:
+            expected = outputs
+        rows.append({
+            'kernel': kernel.name,
+            'backend': backend,
+            'bitlen': bitlen,
+            'count': len(inputs),
+            'seconds': min(seconds),
+            'ns_per_item': int(min(seconds) * 1e9 / max(len(inputs), 1)),
+            'agree': int(outputs == expected),
+        })
+    return rows
+
+def load_kernel_bench(path:str=KERNEL_BENCH_CSV) -> dict[tuple,dict]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as handle:
+        return {(row['kernel'], row['backend'], int(row['bitlen'])): row for row in csv.DictReader(handle)}
+
+def store_kernel_bench(rows:dict[tuple,dict], path:str=KERNEL_BENCH_CSV):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', newline='') as handle:
+        writer = csv.DictWriter(handle, KERNEL_BENCH_FIELDS)
+        writer.writeheader()
+        for key in sorted(rows):
+            writer.writerow(rows[key])
+
+def run_kernels(bitlen_min:int=32, bitlen_max:int=512, step:int=32, count:int=50):
+    """Times every kernel in lib_nt.BENCHMARKS per bit length, merged into data/kernel-bench.csv"""
+    rows = load_kernel_bench()
+    for bitlen in range(bitlen_min, bitlen_max + 1, step):
+        for kernel in BENCHMARKS.values():
+            results = bench_kernel(kernel, bitlen, count)
+            for row in results:
+                rows[(row['kernel'], row['backend'], row['bitlen'])] = row
+            print(f"{bitlen:>4} {kernel.name:>24}: " + '  '.join(
+                f"{row['backend']}={row['ns_per_item']/1e3:.1f}us{'' if row['agree'] else ' (DISAGREES)'}" for row in results))
+        # Written per bit length, so an interrupted run keeps what it has
+        store_kernel_bench(rows)
+    return 0 if all(int(row['agree']) for row in rows.values()) else 1
+
+def main():
+    commands = {'signatures': run_signatures, 'timing': run_timing}
+    if len(sys.argv) >= 2 and sys.argv[1] == 'kernels':
+        try:
+            extra = [int(_) for _ in sys.argv[2:6]]
+        except ValueError:
+            print("Bit lengths, step and count must be integers")
+            sys.exit(1)
+        sys.exit(run_kernels(*extra))
+    if len(sys.argv) < 3 or sys.argv[1] not in commands:
+        print("Usage: python bench.py <signatures|timing> <bitsize> [top_n] [trials]")
+        print("       python bench.py kernels [bitlen_min] [bitlen_max] [step] [count]")
+        print("Example: python bench.py signatures 256 3 25")
+        print("Example: python bench.py timing 256 3 50")
+        print("Example: python bench.py kernels 32 512 32 50")
+        sys.exit(1)
+    try:
+        bitsize = int(sys.argv[2])
+        if not (33 <= bitsize <= 512):
+            print("Bitsize must be between 33 and 512")
+            sys.exit(1)
+        extra = [int(_) for _ in sys.argv[3:5]]
+    except ValueError:
+        print("Bitsize, top_n and trials must be integers")
+        sys.exit(1)
+    sys.exit(commands[sys.argv[1]](bitsize, *extra))
+
+if __name__ == "__main__":
+    main()
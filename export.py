@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# Exports each step's table to Parquet, so a range of mx can be read without decompressing everything
+#
+# data/{bitsize}.sqlite3.xz is one xz stream, looking at one curve means unpacking gigabytes.
+# Here every table becomes data/{bitsize}.parquet/{step}.parquet, zstd compressed, sorted by
+# mx with one row group per bucket of 2^BUCKET_BITS mx (the same buckets as the manifest). The
+# min/max statistics of each row group let a reader skip straight to the ones it needs, and
+# the manifest digest of the table is kept in the file metadata to compare against.
+#
+# Needs pyarrow (pip install pyarrow)
+
+import os
+import sys
+import sqlite3
+import pyarrow as pa
+import pyarrow.parquet as pq
+from lib_manifest import BUCKET_BITS, MANIFEST_STEPS, manifest_tables, manifest_root, manifest_count
+
+ARROW_TYPES = {'INTEGER': pa.int64(), 'REAL': pa.float64(), 'TEXT': pa.string()}
+
+def export_path(bitsize:int, step:str) -> str:
+    return f"data/{bitsize}.parquet/{step}.parquet"
+
+def table_schema(conn:sqlite3.Connection, table_name:str) -> pa.Schema:
+    return pa.schema([(name, ARROW_TYPES[kind.upper()]) for _, name, kind, _, _, _ in conn.execute(f"PRAGMA table_info({table_name})")])
+
+def export_table(conn:sqlite3.Connection, table_name:str, path:str) -> tuple[int,int]:
+    """Write one table to path, returns (rows, row groups)"""
+    schema = table_schema(conn, table_name)
+    rows, buckets, digest = manifest_root(conn, table_name)
+    # Only when the manifest covers the table, rows it leaves out are still exported
+    if rows == manifest_count(conn, table_name):
+        schema = schema.with_metadata({'manifest_digest': digest, 'manifest_bucket_bits': str(BUCKET_BITS)})
+    key = ', '.join(name for _, name, _, _, _, pk in sorted(conn.execute(f"PRAGMA table_info({table_name})"), key=lambda row: row[5]) if pk)
+    tmp_path = path + '.tmp'
+    rows = groups = 0
+    with pq.ParquetWriter(tmp_path, schema, compression='zstd') as writer:
+        for (bucket,) in conn.execute(f"SELECT DISTINCT mx >> {BUCKET_BITS} FROM {table_name} ORDER BY 1").fetchall():
+            cursor = conn.execute(f"SELECT * FROM {table_name} WHERE mx >= ? AND mx < ? ORDER BY {key}",
+                                  (bucket << BUCKET_BITS, (bucket + 1) << BUCKET_BITS))
+            columns = list(zip(*cursor.fetchall()))
+            group = pa.Table.from_arrays([pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema)
+            # Buckets are far below the default row group size, so each write is one row group
+            writer.write_table(group, row_group_size=len(group))
+            rows += len(group)
+            groups += 1
+    os.replace(tmp_path, path)
+    return rows, groups
+
+def export(bitsize:int):
+    db_path = f"data/{bitsize}.sqlite3"
+    if not os.path.exists(db_path):
+        print(f"Database {db_path} does not exist. Run the steps first.")
+        return 1
+    conn = sqlite3.connect(db_path)
+    os.makedirs(f"data/{bitsize}.parquet", exist_ok=True)
+    for table_name in manifest_tables(conn, bitsize):
+        step = table_name.split(f"_2p{bitsize}_")[0]
+        path = export_path(bitsize, step)
+        rows, groups = export_table(conn, table_name, path)
+        print(f"{path}: {rows} rows, {groups} row groups, {os.path.getsize(path)} bytes")
+    conn.close()
+    return 0
+
+def read_range(bitsize:int, step:str, mx_min:int, mx_max:int, columns:list[str]=None) -> pa.Table:
+    """Rows of a step with mx_min <= mx <= mx_max, only the row groups overlapping the range are read"""
+    return pq.read_table(export_path(bitsize, step), columns=columns,
+                         filters=[('mx', '>=', mx_min), ('mx', '<=', mx_max)])
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python export.py <bitsize>")
+        print("       python export.py <bitsize> <step> <mx_min> <mx_max>")
+        print("Example: python export.py 256 curves 977 977")
+        sys.exit(1)
+    bitsize = int(sys.argv[1])
+    if len(sys.argv) == 2:
+        sys.exit(export(bitsize))
+    step = sys.argv[2]
+    if step not in MANIFEST_STEPS:
+        print(f"Step must be one of: {', '.join(MANIFEST_STEPS)}")
+        sys.exit(1)
+    table = read_range(bitsize, step, int(sys.argv[3]), int(sys.argv[4]))
+    print('\t'.join(table.column_names))
+    for row in table.to_pylist():
+        print('\t'.join(str(value) for value in row.values()))
+
+if __name__ == "__main__":
+    main()
@@ -2,21 +2,29 @@
 Graphs performance of our curve order determination algorithm
 vs Sage's point counting algorithms,
 
-use lemma/*-eisenstein-mapping* to generate the raw data file
+uses data/kernel-bench.csv from `python bench.py kernels` when it has Sage timings,
+otherwise use lemma/*-eisenstein-mapping* to generate the raw data file
 """
 
+import os
 import matplotlib.pyplot as plt
 import pandas as pd
 
-# Load the data
-df = pd.read_csv('data/2-vs-sage.csv')
-
-# Calculate the ratio
-ratio = df['ours'] / df['sage']
-
-# Create the plot
 plt.figure(figsize=(10, 6))
-plt.plot(df['bitlen'], ratio)
+
+bench = pd.read_csv('data/kernel-bench.csv') if os.path.exists('data/kernel-bench.csv') else None
+if bench is not None and ((bench['kernel'] == 'curve_orders') & (bench['backend'] == 'sage')).any():
+    # One column per backend, per-item times at each bit length
+    df = bench[bench['kernel'] == 'curve_orders'].pivot(index='bitlen', columns='backend', values='ns_per_item')
+    for backend in ('scalar', 'batch'):
+        if backend in df:
+            plt.plot(df.index, df[backend] / df['sage'], label=f'Ours ({backend})')
+else:
+    # Load the data
+    df = pd.read_csv('data/2-vs-sage.csv')
+    # Calculate the ratio
+    ratio = df['ours'] / df['sage']
+    plt.plot(df['bitlen'], ratio, label='Ours')
 
 plt.xlabel('Bit Length')
 plt.ylabel('Ratio (Ours/Sage)')
@@ -3,12 +3,13 @@ Shows representations of GLV compatible curves in the coefficient space of the E
 Draws a lattice structure ontop
 """
 
+import os
+import sys
 import matplotlib.pyplot as plt
 import math
 from sage.all import GF, EllipticCurve, is_prime, next_prime, factor
-
-ZETA = lambda n,x,p: pow(x%p, ((p-1)//n), p)
-MODSQRT = lambda n, p: pow(n%p, (p + 1) // 4, p)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib_nt import ZETA_gmpy2 as ZETA, cornacchia_gmpy2 as cornacchia, make_norms_cd, ALL_SUB_PATTERNS
 
 def reduce_to_sublattice(arbitrary_c, arbitrary_d):
     # Force d to be even while preserving essential properties
@@ -32,7 +33,7 @@ def check_glv_endomorphism2(curve, p, n, g_base, generator=None):
             return {"supports_glv": False, "reason": "No generator specified and unable to find default generator"}
 
     beta_val_3rd = ZETA(3, g_base, p)
-    beta_vals = [pow(beta_val_3rd,i,p) for i in range(1, 3)]
+    beta_vals = [int(pow(beta_val_3rd,i,p)) for i in range(1, 3)]
 
     Fq = GF(n)
     #Fq_star = Fq.unit_group()
@@ -77,30 +78,6 @@ def check_glv_endomorphism2(curve, p, n, g_base, generator=None):
         "lambda_candidates": lambda_vals
     }
 
-def cornacchia(d, p):
-    """Standard Cornacchia algorithm for x^2 + d*y^2 = p"""
-    assert p % 12 == 7
-    if d <= 0 or d >= p:
-        raise ValueError("invalid input")
-    #if ZETA(2, -d, p) != 1: raise ValueError("no solution")
-    x0 = MODSQRT(-d, p)
-    # Choose the larger square root
-    if x0 < p // 2:
-        x0 = p - x0
-    # Extended Euclidean algorithm
-    a, b = p, x0
-    limit = math.isqrt(p) # Python 3.8+
-    while b > limit:
-        a, b = b, a % b
-        assert a > 0 and b > 0 # guaranteed positive integers
-    remainder = p - b * b
-    assert remainder % d == 0  # guaranteed congruence
-    c = remainder // d
-    t = math.isqrt(c) # Python 3.8+
-    assert t * t == c  # guaranteed exact squares
-    return b, t
-
-
 def is_perfect_square(n):
     """Check if n is a perfect square using integer square root."""
     if n < 0:
@@ -297,18 +274,6 @@ one = EisensteinInt(1, 0)  # 1 + 0*ω = 1
 
 j0curve_trace_coefficients = [(-2,1), (-1,-1), (1,-2), (2,-1), (1,1), (-1,2)]
 
-def make_norms_cd(c,d,p):
-    return [p + 1 + (x_0*c) + (x_1*d) for x_0, x_1 in [
-        (-2,1), (-1,-1), (1,-2), (2,-1), (1,1), (-1,2)
-    ]]
-
-ALL_SUB_PATTERNS = [
-    (0, 1, 2, 3, 4, 5),
-    (0, 5, 4, 3, 2, 1),
-    (3, 4, 5, 0, 1, 2),
-    (3, 2, 1, 0, 5, 4),
-]
-
 def is_diagonal_intersection(c, d):
     # Must be on grid (either coordinate ≡ 2 mod 4)
     if not (c % 4 == 2 or d % 4 == 2):
@@ -327,7 +292,7 @@ def calculate_curve_orders(p, g):
     assert c**2 - c*d + d**2 == p
     assert p + 1 + a - (3*b) == p + 1 + c - (2*d)
     u0 = ZETA(2,a*b*d,p)
-    u1 = int((ZETA(3,g,p) * c + d) == 0)
+    u1 = int((ZETA(3,g,p) * c + d) % p == 0)
     idx = (int(u0 == 1) * 2) + u1
     result = [0] * 6
     norms_cd = make_norms_cd(c,d,p)
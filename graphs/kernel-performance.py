@@ -0,0 +1,37 @@
+"""
+Per-item time of every pipeline kernel by bit length and backend,
+
+use `python bench.py kernels` to generate data/kernel-bench.csv
+"""
+
+import sys
+import os
+import matplotlib.pyplot as plt
+import pandas as pd
+
+if not os.path.exists('data/kernel-bench.csv'):
+    print("data/kernel-bench.csv does not exist, run: python bench.py kernels")
+    sys.exit(0)
+
+df = pd.read_csv('data/kernel-bench.csv')
+styles = {'scalar': '-', 'batch': '--', 'sage': ':'}
+
+plt.figure(figsize=(10, 6))
+for i, (kernel, rows) in enumerate(df.groupby('kernel')):
+    for backend, series in rows.groupby('backend'):
+        series = series.sort_values('bitlen')
+        plt.plot(series['bitlen'], series['ns_per_item'] / 1e3, styles.get(backend, '-.'), color=f'C{i}',
+                 label=f'{kernel} ({backend})')
+
+plt.xlabel('Bit Length')
+plt.ylabel('Time per item (us)')
+plt.title('Pipeline kernels by backend')
+plt.yscale('log')
+plt.legend(fontsize='small', ncol=2)
+plt.grid(True, alpha=0.3)
+
+plt.tight_layout()
+
+#plt.show()
+plt.savefig("graphs/kernel-performance.png", dpi=300)
+plt.savefig("graphs/kernel-performance.svg", dpi=300)
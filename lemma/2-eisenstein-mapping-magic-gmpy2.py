@@ -1,34 +1,10 @@
 from sage.all import random_prime, GF, EllipticCurve, GF, is_prime
+import os
+import sys
 import gmpy2
 import time
-ZETA = lambda n,x,p: gmpy2.powmod(x, ((p-1)//n), p)
-MODSQRT = lambda n, p: gmpy2.powmod(n, (p + 1) // 4, p)
-
-gmpy2.get_context().precision = 256
-
-def cornacchia(d, p):
-    """Standard Cornacchia algorithm for x^2 + d*y^2 = p"""
-    assert p % 12 == 7
-    if d <= 0 or d >= p:
-        raise ValueError("invalid input")
-    d = gmpy2.mpz(d)
-    #if ZETA(2, -d, p) != 1: raise ValueError("no solution")
-    x0 = MODSQRT(p-d, p)
-    # Choose the larger square root
-    if x0 < p // 2:
-        x0 = p - x0
-    # Extended Euclidean algorithm
-    a, b = p, x0
-    limit = gmpy2.isqrt(p) # Python 3.8+
-    while b > limit:
-        a, b = b, a % b
-        assert a > 0 and b > 0 # guaranteed positive integers
-    remainder = p - b * b
-    assert remainder % d == 0  # guaranteed congruence
-    c = remainder // d
-    t = gmpy2.isqrt(c) # Python 3.8+
-    assert t * t == c  # guaranteed exact squares
-    return b, t
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib_nt import cornacchia_gmpy2, calculate_curve_orders as calculate_curve_orders_abg, calculate_curve_orders_batch, find_generator
 
 def sample_primes(bitlen):
     while True:
@@ -36,57 +12,16 @@ def sample_primes(bitlen):
         if p % 12 == 7:
             yield p
 
-def make_norms_cd(c,d,p):
-    return [p + 1 + (x_0*c) + (x_1*d) for x_0, x_1 in [
-        (-2,1), (-1,-1), (1,-2), (2,-1), (1,1), (-1,2)
-    ]]
-
-ALL_SUB_PATTERNS = [
-    (0, 1, 2, 3, 4, 5),
-    (0, 5, 4, 3, 2, 1),
-    (3, 4, 5, 0, 1, 2),
-    (3, 2, 1, 0, 5, 4),
-]
-
 def calculate_curve_orders(p, g):
-    assert p % 12 == 7
-    g = gmpy2.mpz(g)
-    p = gmpy2.mpz(p)
-    a, b = cornacchia(3,p)
-    assert a%2 == 0 and b%2 == 1
-    c, d = a + b, 2 * b
-    assert c**2 - c*d + d**2 == p
-    assert p + 1 + a - (3*b) == p + 1 + c - (2*d)
-    #u0 = int(ZETA(2,a*b*d,p) == 1)
-    u0 = int(((c+d) % 3) == 2)
-    u1 = int(gmpy2.mod(gmpy2.fma(ZETA(3,g,p), c, d), p) == 0)
-    idx = (u0 * 2) + u1
-    result = [0] * 6
-    norms_cd = make_norms_cd(c,d,p)
-    for i,j in enumerate(ALL_SUB_PATTERNS[idx]):
-        result[i] = norms_cd[j]
-    return result
-
-def find_generator(g,p):
-    g = int(g)
-    x = 1
-    while True:
-        yy = (pow(x,3,p) + g) % p
-        y = MODSQRT(yy, p)
-        if (y*y) == yy:
-            if y & 1:
-                y = p - y
-            E = EllipticCurve(GF(p), [0, g])
-            if E.point((x,y)).order() == E.order():
-                return int(x),int(y)
-        x += 1
+    a, b = cornacchia_gmpy2(3, p)
+    return calculate_curve_orders_abg(p, g, a, b)
 
 def example_secp256k1():
     p = 115792089237316195423570985008687907853269984665640564039457584007908834671663
     F = GF(p)
     g = F.multiplicative_generator()
     q = 115792089237316195423570985008687907852837564279074904382605163141518161494337
-    G = find_generator(g, p)
+    G = find_generator(g, p, EllipticCurve(F, [0, g]))
     orders = calculate_curve_orders(p,g)
     assert orders.index(q) == 5
     print('secpk256k1')
@@ -104,25 +39,23 @@ def bitlen_tests():
     with open('data/2-vs-sage.csv', 'w') as handle:
         handle.write("bitlen,count,sage,ours\n")
         for bitlen in range(32,256):
-            i = 0
-            totals = [0,0,0]
+            primes = []
             for p in sample_primes(bitlen):
-                i += 1
-                if i > 50:
+                if len(primes) >= 50:
                     break
-                F = GF(p)
-                g = F.multiplicative_generator()
-                curves = [EllipticCurve(F, [0, g**i]) for i in range(6)]
-                start1 = time.perf_counter()
-                orders = [_.order() for _ in curves]
-                total1 = time.perf_counter() - start1
-                start2 = time.perf_counter()
-                predicted_orders = calculate_curve_orders(p,g)
-                total2 = time.perf_counter() - start2
-                assert predicted_orders == orders
-                totals[0] += 1
-                totals[1] += total1
-                totals[2] += total2
+                primes.append(p)
+            gens = [GF(p).multiplicative_generator() for p in primes]
+            start1 = time.perf_counter()
+            orders = [[EllipticCurve(GF(p), [0, g**i]).order() for i in range(6)] for p, g in zip(primes, gens)]
+            total1 = time.perf_counter() - start1
+            # One batched call for every prime of this bit length, timed with Cornacchia as before
+            start2 = time.perf_counter()
+            ab = [cornacchia_gmpy2(3, p) for p in primes]
+            predicted_orders, _, _ = calculate_curve_orders_batch(primes, [int(g) for g in gens],
+                                                                  [a for a, _ in ab], [b for _, b in ab])
+            total2 = time.perf_counter() - start2
+            assert predicted_orders == orders
+            totals = [len(primes), total1, total2]
             print('.', end='', flush=True)
             handle.write(f"{bitlen},{totals[0]},{totals[1]},{totals[2]}\n")
             handle.flush()
@@ -5,15 +5,11 @@ window, where c is less than 2**31.
 
 from sage.all import random_prime, is_prime, GF, EllipticCurve, factor
 from sage.rings.factorint import factor_trial_division
-from math import gcd, isqrt
-import gmpy2
-gmpy2.get_context().precision = 256
-
-ZETA = lambda n,x,p: pow(x%p, ((p-1)//n), p)
-MODSQRT = lambda n, p: pow(n%p, (p + 1) // 4, p)
-
-ZETA_gmpy2 = lambda n,x,p: pow(x%p, ((p-1)//n), p)
-MODSQRT_gmpy2 = lambda n, p: pow(n%p, (p + 1) // 4, p)
+from math import gcd
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib_nt import ZETA_gmpy2, cornacchia_gmpy2, make_norms_cd, ALL_SUB_PATTERNS
 
 MAX_C = 2**31
 #MAX_C = 2**16
@@ -29,7 +25,7 @@ def check_glv_endomorphism2(curve, p, n, g_base, generator=None):
 
     """
     # Find a cube root of unity in the base field
-    beta = ZETA(3, g_base, p) #g_base**((p-1)//3)
+    beta = ZETA_gmpy2(3, g_base, p) #g_base**((p-1)//3)
     # Verify beta is a non-trivial cube root of unity
     if beta == 1 or beta**3 != 1:
         assert False
@@ -39,9 +35,9 @@ def check_glv_endomorphism2(curve, p, n, g_base, generator=None):
     betas = [beta,beta**2]
     """
 
-    #beta_val_6th = ZETA(6, g_base, p) # g_base**((n-1)//6)
-    beta_val_3rd = ZETA(3, g_base, p) # g_base**((n-1)//3)
-    beta_vals = [pow(beta_val_3rd,i,p) for i in range(1, 3)] # + [pow(beta_val_6th, i, p) for i in range(1, 6)]
+    #beta_val_6th = ZETA_gmpy2(6, g_base, p) # g_base**((n-1)//6)
+    beta_val_3rd = ZETA_gmpy2(3, g_base, p) # g_base**((n-1)//3)
+    beta_vals = [int(pow(beta_val_3rd,i,p)) for i in range(1, 3)] # + [pow(beta_val_6th, i, p) for i in range(1, 6)]
 
     Fq = GF(n)
     Fq_star = Fq.unit_group()
@@ -91,51 +87,12 @@ def check_glv_endomorphism2(curve, p, n, g_base, generator=None):
         "lambda_candidates": lambda_vals
     }
 
-def cornacchia_gmpy2(d, p):
-    """Standard Cornacchia algorithm for x^2 + d*y^2 = p"""
-    assert p % 12 == 7
-    p = gmpy2.mpz(p)
-    if d <= 0 or d >= p:
-        raise ValueError("invalid input")
-    if ZETA_gmpy2(2, -d, p) != 1: raise ValueError("no solution")
-    x0 = MODSQRT_gmpy2(-d, p)
-    # Choose the larger square root
-    if x0 < p // 2:
-        x0 = p - x0
-    # Extended Euclidean algorithm
-    a, b = p, x0
-    limit = isqrt(p) # Python 3.8+
-    while b > limit:
-        a, b = b, a % b
-        assert a > 0 and b > 0 # guaranteed positive integers
-    remainder = p - b * b
-    assert remainder % d == 0  # guaranteed congruence
-    c = remainder // d
-    t = isqrt(c) # Python 3.8+
-    assert t * t == c  # guaranteed exact squares
-    return b, t
-
 def sample_primes(bitlen):
     while True:
         p = random_prime(2**bitlen, lbound=2**(bitlen-1))
         if p % 12 == 7:
             yield p
 
-def make_terms_cd(c,d):
-    return [(x_0*c) + (x_1*d) for x_0, x_1 in [
-        (-2,1), (-1,-1), (1,-2), (2,-1), (1,1), (-1,2)
-    ]]
-
-def make_norms_cd(c,d,p):
-    return [p + 1 + _ for _ in make_terms_cd(c,d)]
-
-ALL_SUB_PATTERNS = [
-    (0, 1, 2, 3, 4, 5),
-    (0, 5, 4, 3, 2, 1),
-    (3, 4, 5, 0, 1, 2),
-    (3, 2, 1, 0, 5, 4),
-]
-
 def calculate_curve_orders(p, g):
     assert p % 12 == 7
     a, b = cornacchia_gmpy2(3,p)
@@ -144,7 +101,7 @@ def calculate_curve_orders(p, g):
     assert c**2 - c*d + d**2 == p
     assert p + 1 + a - (3*b) == p + 1 + c - (2*d)
     u0 = ZETA_gmpy2(2,a*b*d,p)
-    u1 = int((ZETA_gmpy2(3,g,p) * c + d) == 0)
+    u1 = int((ZETA_gmpy2(3,g,p) * c + d) % p == 0)
     idx = (int(u0 == 1) * 2) + u1
     result = [0] * 6
     norms_cd = make_norms_cd(c,d,p)
@@ -1,11 +1,9 @@
-from sage.all import random_prime, is_prime
-from math import gcd
-
-def get_q_range(k, p_min, p_max):
-    q_min = (p_min - 1 + k - 1) // k  # Ceiling division trick
-    q_max = (p_max - 1) // k          # Floor division
-    if q_min <= q_max:
-        return q_min, q_max
+import os
+import sys
+import random
+from sage.all import is_prime
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib_nt import sieve_kq1, get_q_range, analyze_k
 
 def generate_k_values(B):
     k_values = {1}
@@ -19,30 +17,17 @@ def generate_k_values(B):
         k_values.update(new_values)
     return sorted(k_values)
 
-def analyze_k(k, m, r):
-    s = (r - 1) % m
-    d = gcd(k, m)
-    if s % d != 0:
-        return []
-    t = m // d
-    u = (pow(k // d, -1, t) * (s // d)) % t
-    a = [(u + i * t) % m for i in range(d)]
-    return [_ for _ in a if gcd(_,m) == 1]
-
-def emit_safeprimes(k, mod, target_residue, p_min, p_max, max_tries=1000):
+def emit_safeprimes(k, mod, target_residue, p_min, p_max, max_tries=100000, rng=random):
+    # q and k*q+1 are sieved together over the possible residue classes of q, see lib_nt.sieve_kq1
     possible_q_mods = analyze_k(k, mod, target_residue)
     q_min, q_max = get_q_range(k, p_min, p_max)
     assert q_min < q_max
-    i = 0
-    while i < max_tries:
-        q = random_prime(q_max, False, lbound=q_min)
-        i += 1
-        if q % mod not in possible_q_mods:
-            continue
-        p = k * q + 1
+    for p, q, i in sieve_kq1(k, mod, possible_q_mods, q_min, q_max, rng):
+        if i > max_tries:
+            break
         assert p_min <= p <= p_max
         assert p % mod == target_residue
-        if is_prime(p):
+        if is_prime(q) and is_prime(p):
             yield p,q,k,i
 
 def main():
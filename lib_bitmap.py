@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+# The step 1 prime set as a memory mapped bitmap, a bit per mx rather than a B-tree row
+#
+# p = 2^L - 2^32 - mx = 7 (mod 12) fixes mx mod 12 for a given L, so only every 12th mx can
+# be set and bit i is mx = residue + 12*i. Covering mx < 2^31 takes 2^31/12 bits, ~21 MiB.
+# Step 1 sets the bits of each batch before committing it to the primes table, so the
+# bitmap is never behind the table. Steps 2 & 3 take their work from it instead of joining
+# against the table. `python lib_bitmap.py <bitsize>` builds it for existing databases.
+
+import os
+import sys
+import sqlite3
+import numpy as np
+
+MX_LIMIT = 2**31
+
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+def bitmap_path(bitsize:int) -> str:
+    return f"data/{bitsize}.primes.bitmap"
+
+class MxBitmap:
+    def __init__(self, path:str, bitsize:int, mode:str='r'):
+        self.residue = (2**bitsize - 2**32 - 7) % 12
+        self.nbits = (MX_LIMIT - 1 - self.residue) // 12 + 1
+        nbytes = (self.nbits + 7) // 8
+        if mode == 'r+' and not os.path.exists(path):
+            with open(path, 'wb') as handle:
+                handle.truncate(nbytes)
+        self.bits = np.memmap(path, dtype=np.uint8, mode=mode, shape=(nbytes,))
+
+    def add(self, mxs):
+        mxs = np.asarray(mxs, dtype=np.int64)
+        assert np.all(mxs % 12 == self.residue), "p = 7 (mod 12) only"
+        i = (mxs - self.residue) // 12
+        np.bitwise_or.at(self.bits, i >> 3, (1 << (i & 7)).astype(np.uint8))
+
+    def flush(self):
+        self.bits.flush()
+
+    def __contains__(self, mx:int) -> bool:
+        if mx % 12 != self.residue or not (0 <= mx < MX_LIMIT):
+            return False
+        i = (mx - self.residue) // 12
+        return bool((self.bits[i >> 3] >> (i & 7)) & 1)
+
+    def iter_range(self, mx_min:int=1, mx_max:int=MX_LIMIT-1, chunk_bits:int=2**27):
+        """Arrays of the set mx where mx_min <= mx <= mx_max, ascending, chunk_bits of the bitmap at a time"""
+        i_lo, i_hi = self._index_range(mx_min, mx_max)
+        for start in range(i_lo, i_hi, chunk_bits):
+            end = min(start + chunk_bits, i_hi)
+            # Only unpack the non-zero bytes, most are zero
+            nonzero = np.flatnonzero(self.bits[start >> 3:(end + 7) >> 3]) + (start >> 3)
+            rows, cols = np.nonzero(np.unpackbits(self.bits[nonzero][:, None], axis=1, bitorder='little'))
+            i = nonzero[rows] * 8 + cols
+            yield self.residue + 12 * i[(i >= start) & (i < end)]
+
+    def count(self, mx_min:int=1, mx_max:int=MX_LIMIT-1) -> int:
+        i_lo, i_hi = self._index_range(mx_min, mx_max)
+        if i_hi - i_lo < 16:
+            return sum(len(mxs) for mxs in self.iter_range(mx_min, mx_max))
+        # Whole bytes by table lookup, the partial bytes either end bit by bit
+        b_lo, b_hi = (i_lo + 7) >> 3, i_hi >> 3
+        edges = [(i_lo, b_lo * 8), (b_hi * 8, i_hi)]
+        return int(POPCOUNT[self.bits[b_lo:b_hi]].sum(dtype=np.int64)) + sum(
+            len(mxs) for lo, hi in edges if lo < hi for mxs in self.iter_range(self.residue + 12 * lo, self.residue + 12 * (hi - 1)))
+
+    def _index_range(self, mx_min:int, mx_max:int) -> tuple[int,int]:
+        """Bits [i_lo, i_hi) covering mx_min <= mx <= mx_max"""
+        return max(0, -((self.residue - mx_min) // 12)), min(self.nbits, (mx_max - self.residue) // 12 + 1)
+
+def bitmap_pending(bitmap:MxBitmap, done) -> list[int]:
+    """Set mx which aren't in done, as python ints (p = base - mx doesn't fit in an int64)"""
+    mxs = np.concatenate(list(bitmap.iter_range()) or [np.zeros(0, dtype=np.int64)])
+    return np.setdiff1d(mxs, np.fromiter(done, dtype=np.int64), assume_unique=True).tolist()
+
+def open_bitmap(bitsize:int) -> MxBitmap:
+    """The bitmap for bitsize if step 1 has written one, otherwise None"""
+    path = bitmap_path(bitsize)
+    return MxBitmap(path, bitsize) if os.path.exists(path) else None
+
+def fill_from_table(conn:sqlite3.Connection, bitsize:int, bitmap:MxBitmap):
+    cursor = conn.execute(f"SELECT mx FROM primes_2p{bitsize}_m2p32_mx")
+    while rows := cursor.fetchmany(1000000):
+        bitmap.add([mx for (mx,) in rows])
+    bitmap.flush()
+
+def create_bitmap(conn:sqlite3.Connection, bitsize:int) -> MxBitmap:
+    """Writable bitmap for step 1, a new one starts with what's already in the primes table"""
+    path = bitmap_path(bitsize)
+    existed = os.path.exists(path)
+    bitmap = MxBitmap(path, bitsize, 'r+')
+    if not existed:
+        fill_from_table(conn, bitsize, bitmap)
+    return bitmap
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python lib_bitmap.py <bitsize>")
+        print("Example: python lib_bitmap.py 256")
+        sys.exit(1)
+    bitsize = int(sys.argv[1])
+    conn = sqlite3.connect(f"data/{bitsize}.sqlite3")
+    bitmap = MxBitmap(bitmap_path(bitsize), bitsize, 'r+')
+    fill_from_table(conn, bitsize, bitmap)
+    total = conn.execute(f"SELECT COUNT(*) FROM primes_2p{bitsize}_m2p32_mx").fetchone()[0]
+    print(f"{bitmap_path(bitsize)}: {bitmap.count()} set, {total} rows in primes_2p{bitsize}_m2p32_mx")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
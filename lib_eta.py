@@ -2,6 +2,8 @@
 
 import math
 import json
+import numpy as np
+from collections import namedtuple
 
 def avg(x):
     return sum(x) / len(x)
@@ -34,23 +36,103 @@ def eta_norm(x:dict[int,list[float]]):
         result[k] = [1-f if f < 0 else f for f in result[k]]
     return result
 
+# Columnar versions of the above, rows are curves/twists and columns are facets
+
+def eta_np(x:np.ndarray, axis=-1) -> np.ndarray:
+    return (np.sqrt(np.mean(x * x, axis=axis)) + np.mean(x, axis=axis)) / 2
+
+def eta_norm_np(x:np.ndarray, xmin:np.ndarray=None, xmax:np.ndarray=None) -> np.ndarray:
+    """Min-max normalise each facet column of a (rows, facets) array, same as eta_norm
+
+    Bounds default to the column min/max, pass them when scoring a subset of rows.
+    """
+    xmin = x.min(axis=0) if xmin is None else xmin
+    span = (x.max(axis=0) if xmax is None else xmax) - xmin
+    result = np.divide(x - xmin, span, out=np.zeros_like(x), where=span != 0)
+    return np.where(result < 0, 1 - result, result)
+
+def eta_groupby(keys:np.ndarray, values:np.ndarray) -> tuple[np.ndarray,np.ndarray]:
+    """eta() of values grouped by key, returns (sorted unique keys, eta of each group)"""
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse)
+    mean = np.bincount(inverse, weights=values) / counts
+    rms = np.sqrt(np.bincount(inverse, weights=values * values) / counts)
+    return uniq, (rms + mean) / 2
+
 def factors_str(factors:list[tuple[int,int]]):
     return ' * '.join([f'{prime if prime < 1000 else hex(prime)}' + ('' if power == 1 else f'^{power}') for prime,power in factors])
 
-def factors_metrics(factors:list[tuple[int,int]],bitsize:int):
-    return [
-            (math.log2(factors[-1][0]) * factors[-1][1]) / bitsize,
-            #-max([math.log2(prime**power) for prime, power in factors[:-1]]) if len(factors) > 1 else 0,
-            #float(len(factors)),
-            #bin(q).count('0')
-        ]
+# Named facets of a factorisation, ascending by prime as returned by Sage factor()
+# Each is oriented so that higher is better, bump the version when changing one
+# so cached values in the metrics table are recomputed.
+Metric = namedtuple('Metric', ['name', 'version', 'fn'])
+METRICS:dict[str,Metric] = {}
+DEFAULT_METRICS = ('largest_factor_ratio',)
+
+def metric(name:str, version:int=1):
+    def decorator(fn):
+        METRICS[name] = Metric(name, version, fn)
+        return fn
+    return decorator
+
+@metric('largest_factor_ratio', version=2)
+def metric_largest_factor_ratio(factors:list[tuple[int,int]], bitsize:int):
+    # Adequately factored, the largest prime is somewhere in the cofactor
+    if getattr(factors, 'largest_log2', None) is not None:
+        return factors.largest_log2 / bitsize
+    return (math.log2(factors[-1][0]) * factors[-1][1]) / bitsize
+
+@metric('second_largest_ratio')
+def metric_second_largest_ratio(factors:list[tuple[int,int]], bitsize:int):
+    return -max([math.log2(prime**power) for prime, power in factors[:-1]]) / bitsize if len(factors) > 1 else 0.0
+
+@metric('smallest_prime_ratio')
+def metric_smallest_prime_ratio(factors:list[tuple[int,int]], bitsize:int):
+    return math.log2(factors[0][0]) / bitsize
+
+@metric('avg_prime_ratio')
+def metric_avg_prime_ratio(factors:list[tuple[int,int]], bitsize:int):
+    return avg([math.log2(prime) for prime, _ in factors]) / bitsize
+
+@metric('n_factors')
+def metric_n_factors(factors:list[tuple[int,int]], bitsize:int):
+    return -float(sum(power for _, power in factors))
+
+@metric('entropy')
+def metric_entropy(factors:list[tuple[int,int]], bitsize:int):
+    total = sum(power for _, power in factors)
+    return sum((power/total) * math.log2(power/total) for _, power in factors)
+
+def factors_metrics(factors:list[tuple[int,int]], bitsize:int, names:tuple[str]=DEFAULT_METRICS):
+    return [METRICS[name].fn(factors, bitsize) for name in names]
 
 def factors_metrics_map(factors:dict[int,list[tuple[int,int]]], bitsize:int) -> dict[int,list[float]]:
     return {mx: factors_metrics(factors,bitsize) for mx, factors in factors.items()}
 
+def factors_metrics_np(factors:list[list[tuple[int,int]]], bitsize:int, names:tuple[str]=DEFAULT_METRICS) -> np.ndarray:
+    """factors_metrics for many factorisations as a (rows, facets) array"""
+    result = np.array([factors_metrics(_, bitsize, names) for _ in factors], dtype=np.float64)
+    return result.reshape(len(factors), -1)
+
 def factors_load(x:str) -> list[tuple[int,int]]:
     return [(int(prime), int(power)) for prime, power in json.loads(x)]
 
+class BoundedFactors(list):
+    """Factors where the last entry is an unsplit composite cofactor, other metrics treat it as a prime"""
+    def __init__(self, factors:list[tuple[int,int]], largest_log2:float):
+        super().__init__(factors)
+        self.largest_log2 = largest_log2
+
+def factors_load_bounded(x:str, cofactor:str=None, lower:float=None, upper:float=None) -> list[tuple[int,int]]:
+    """factors_load for a step 7 row which may only have been factored adequately"""
+    factors = factors_load(x)
+    if cofactor is None:
+        return factors
+    factors = sorted(factors + [(int(cofactor), 1)])
+    if factors[-1][0] != int(cofactor):
+        return factors
+    return BoundedFactors(factors, (lower + upper) / 2)
+
 def factors_to_int(factors:list[tuple[int,int]]) -> int:
     product = 1
     for prime,power in factors:
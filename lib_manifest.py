@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+# Canonical digests of each step's table, so two runs can be compared by a hash
+#
+# Parallel or sharded runs insert rows in any order, so rows are hashed in primary key
+# order and grouped into buckets of 2^BUCKET_BITS consecutive mx. Before committing a batch
+# a step re-hashes only the buckets the batch touched, in the same transaction so the
+# manifest never disagrees with the rows. The digest of a table is a hash over its bucket
+# digests. Two databases which agree on a bucket agree on every row in it, so a
+# partially complete run can still be compared bucket by bucket.
+#
+# Only the tables of steps 1 - 8 are covered. Shared factors, the factor cache, ECM
+# checkpoints & scores depend on what happened to be pending or random when they were
+# written. REAL columns are left out, they're derived from the TEXT & INTEGER columns of
+# the same row and log2 etc. may differ in the last bit between machines.
+#
+# Step 7 rows with a cofactor (from --adequate) are left out too. Where adequate
+# factorisation stops depends on which random ECM curves found a factor first and on the
+# time box, so two runs needn't agree on them. Fully factored rows are deterministic.
+
+import sys
+import json
+import sqlite3
+import hashlib
+
+BUCKET_BITS = 20
+
+MANIFEST_STEPS = ['primes', 'cornacchia', 'trial_division', 'generator', 'curves', 'glv', 'curvefactor', 'embedding']
+
+def create_manifest_table(conn:sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS manifest (
+            table_name TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            digest BLOB NOT NULL,
+            PRIMARY KEY (table_name, bucket)
+        )
+    """)
+
+def manifest_columns(conn:sqlite3.Connection, table_name:str) -> tuple[list[str],list[str]]:
+    """(hashed columns, primary key columns) of a table"""
+    info = conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+    columns = [name for _, name, kind, _, _, _ in info if kind.upper() != 'REAL']
+    key = [name for _, name, _, _, _, pk in sorted(info, key=lambda row: row[5]) if pk]
+    return columns, key
+
+def manifest_where(columns:list[str]) -> str:
+    """SQL condition on the rows covered by the manifest, see above"""
+    return "cofactor IS NULL" if 'cofactor' in columns else "1"
+
+def manifest_count(conn:sqlite3.Connection, table_name:str) -> int:
+    """Rows of a table which should be in the manifest"""
+    columns, _ = manifest_columns(conn, table_name)
+    return conn.execute(f"SELECT COUNT(*) FROM {table_name} WHERE {manifest_where(columns)}").fetchone()[0]
+
+def bucket_digest(conn:sqlite3.Connection, table_name:str, bucket:int, columns:list[str], key:list[str]) -> tuple[int,bytes]:
+    h = hashlib.sha256()
+    row_count = 0
+    cursor = conn.execute(f"""
+        SELECT {', '.join(columns)} FROM {table_name}
+         WHERE mx >= ? AND mx < ? AND {manifest_where(columns)}
+         ORDER BY {', '.join(key)}
+    """, (bucket << BUCKET_BITS, (bucket + 1) << BUCKET_BITS))
+    for row in cursor:
+        h.update(json.dumps(row, separators=(',', ':')).encode() + b'\n')
+        row_count += 1
+    return row_count, h.digest()
+
+def manifest_update(conn:sqlite3.Connection, table_name:str, mxs) -> int:
+    """Re-hash the buckets containing any of mxs, call before committing a batch of rows"""
+    create_manifest_table(conn)
+    columns, key = manifest_columns(conn, table_name)
+    buckets = sorted({int(mx) >> BUCKET_BITS for mx in mxs})
+    for bucket in buckets:
+        row_count, digest = bucket_digest(conn, table_name, bucket, columns, key)
+        if row_count:
+            conn.execute("INSERT OR REPLACE INTO manifest (table_name, bucket, row_count, digest) VALUES (?, ?, ?, ?)",
+                         (table_name, bucket, row_count, digest))
+        else:
+            conn.execute("DELETE FROM manifest WHERE table_name = ? AND bucket = ?", (table_name, bucket))
+    return len(buckets)
+
+def manifest_rebuild(conn:sqlite3.Connection, table_name:str) -> int:
+    """Re-hash every bucket of a table, e.g. one written before the manifest existed"""
+    create_manifest_table(conn)
+    conn.execute("DELETE FROM manifest WHERE table_name = ?", (table_name,))
+    buckets = [bucket << BUCKET_BITS for (bucket,) in conn.execute(f"SELECT DISTINCT mx >> {BUCKET_BITS} FROM {table_name}")]
+    return manifest_update(conn, table_name, buckets)
+
+def manifest_root(conn:sqlite3.Connection, table_name:str) -> tuple[int,int,str]:
+    """(rows, buckets, hex digest) of a table from its bucket digests"""
+    create_manifest_table(conn)
+    columns, key = manifest_columns(conn, table_name)
+    h = hashlib.sha256(json.dumps([columns, key, BUCKET_BITS]).encode())
+    rows = buckets = 0
+    for bucket, row_count, digest in conn.execute("SELECT bucket, row_count, digest FROM manifest WHERE table_name = ? ORDER BY bucket", (table_name,)):
+        h.update(bucket.to_bytes(8, 'big') + row_count.to_bytes(8, 'big') + digest)
+        rows += row_count
+        buckets += 1
+    return rows, buckets, h.hexdigest()
+
+def manifest_tables(conn:sqlite3.Connection, bitsize:int) -> list[str]:
+    existing = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return [f"{step}_2p{bitsize}_m2p32_mx" for step in MANIFEST_STEPS if f"{step}_2p{bitsize}_m2p32_mx" in existing]
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python lib_manifest.py <bitsize> [rebuild]")
+        print("Example: python lib_manifest.py 256")
+        sys.exit(1)
+    bitsize = int(sys.argv[1])
+    conn = sqlite3.connect(f"data/{bitsize}.sqlite3")
+    for table_name in manifest_tables(conn, bitsize):
+        if len(sys.argv) > 2 and sys.argv[2] == 'rebuild':
+            manifest_rebuild(conn, table_name)
+            conn.commit()
+        rows, buckets, digest = manifest_root(conn, table_name)
+        # Rows written before the manifest existed aren't in it
+        total = manifest_count(conn, table_name)
+        stale = f", {total - rows} rows missing, run with rebuild" if total != rows else ""
+        print(f"{digest}  {table_name} ({rows} rows, {buckets} buckets{stale})")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,690 @@
+# Number theory routines shared by the steps, results and search
+
+import json
+import math
+import time
+import sqlite3
+import hashlib
+import gmpy2
+import numpy as np
+from functools import lru_cache
+from collections import OrderedDict, namedtuple
+from lib_eta import factors_load
+
+gmpy2.get_context().precision = 256
+
+# Each kernel has a scalar form and a batched form taking a list per argument,
+# inputs(bitlen, count, rng) makes argument tuples to time & cross-check them with.
+# The reference, if any, is the Sage implementation the pipeline used before.
+Kernel = namedtuple('Kernel', ['name', 'scalar', 'batch', 'inputs', 'reference'])
+BENCHMARKS:dict[str,Kernel] = {}
+
+def register_kernel(name:str, scalar, inputs, reference=None, batch=None):
+    """Adds a kernel to BENCHMARKS, for those without a batched form"""
+    BENCHMARKS[name] = Kernel(name, scalar, batch, inputs, reference)
+
+def benchmark(name:str, scalar, inputs, reference=None):
+    """Registers the decorated batched form of scalar"""
+    def decorator(batch):
+        register_kernel(name, scalar, inputs, reference, batch)
+        return batch
+    return decorator
+
+def eisenstein_order(a:int, b:int, offset_eisenstein_c:int, offset_eisenstein_d:int) -> tuple[int,int]:
+    """Returns (p, q) given Cornacchia p = a^2 + 3b^2 and the Eisenstein offsets of a curve order q"""
+    p = a**2 + 3 * b**2
+    q_c = a + b + offset_eisenstein_c
+    q_d = 2 * b + offset_eisenstein_d
+    return p, q_c**2 + q_d**2 - (q_c * q_d)
+
+# Coefficients of (c, d) in the trace of each twist, p + 1 + x_0*c + x_1*d
+TRACE_TERMS = [(-2,1), (-1,-1), (1,-2), (2,-1), (1,1), (-1,2)]
+
+# The (c, d) offset from p's Eisenstein integer to each twist order, same order as TRACE_TERMS
+EISENSTEIN_OFFSETS = [(-1,0), (-1,-1), (0,-1), (1,0), (1,1), (0,1)]
+
+# Which of TRACE_TERMS is the order of y^2 = x^3 + g^i for i = 0..5, indexed by u0*2 + u1
+ALL_SUB_PATTERNS = [
+    (0, 1, 2, 3, 4, 5),
+    (0, 5, 4, 3, 2, 1),
+    (3, 4, 5, 0, 1, 2),
+    (3, 2, 1, 0, 5, 4),
+]
+
+def ZETA_gmpy2(n, x, p):
+    """x^((p-1)/n) mod p, a primitive n-th root of unity when x is a generator of F_p*"""
+    p = gmpy2.mpz(int(p))
+    return gmpy2.powmod(int(x), (p - 1) // n, p)
+
+def MODSQRT_gmpy2(n, p):
+    """A square root of n mod p, if there is one, for p = 3 (mod 4)"""
+    p = gmpy2.mpz(int(p))
+    return gmpy2.powmod(int(n), (p + 1) // 4, p)
+
+def cornacchia_gmpy2(d, p, check:bool=True):
+    """Standard Cornacchia algorithm for x^2 + d*y^2 = p"""
+    assert p % 12 == 7
+    p = gmpy2.mpz(p)
+    if d <= 0 or d >= p:
+        raise ValueError("invalid input")
+    if check and ZETA_gmpy2(2, -d, p) != 1:
+        raise ValueError("no solution")
+    x0 = MODSQRT_gmpy2(-d, p)
+    # Choose the larger square root
+    if x0 < p // 2:
+        x0 = p - x0
+    # Extended Euclidean algorithm
+    a, b = p, x0
+    limit = gmpy2.isqrt(p)
+    while b > limit:
+        a, b = b, a % b
+        assert a > 0 and b > 0 # guaranteed positive integers
+    remainder = p - b * b
+    assert remainder % d == 0  # guaranteed congruence
+    c = remainder // d
+    t = gmpy2.isqrt(c)
+    assert t * t == c  # guaranteed exact squares
+    return b, t
+
+def make_terms_cd(c, d):
+    return [(x_0*c) + (x_1*d) for x_0, x_1 in TRACE_TERMS]
+
+def make_norms_cd(c, d, p):
+    return [p + 1 + _ for _ in make_terms_cd(c,d)]
+
+def calculate_curve_orders(p, g, a, b) -> list[int]:
+    """Orders of y^2 = x^3 + g^i for i = 0..5 given Cornacchia p = a^2 + 3b^2 and a generator g"""
+    assert p % 12 == 7
+    g = gmpy2.mpz(g)
+    p = gmpy2.mpz(p)
+    a = gmpy2.mpz(a)
+    b = gmpy2.mpz(b)
+    assert a%2 == 0 and b%2 == 1
+    c, d = a + b, 2 * b
+    assert c**2 - c*d + d**2 == p
+    assert p + 1 + a - (3*b) == p + 1 + c - (2*d)
+    u0 = int(((c+d) % 3) == 2)
+    u1 = int(gmpy2.mod(gmpy2.fma(ZETA_gmpy2(3,g,p), c, d), p) == 0)
+    idx = (u0 * 2) + u1
+    result = [0] * 6
+    norms_cd = make_norms_cd(c,d,p)
+    for i,j in enumerate(ALL_SUB_PATTERNS[idx]):
+        result[i] = norms_cd[j]
+    return result
+
+def find_generator(g, p, E=None):
+    """Find the first point (x,y) with even y that generates E: y^2 = x^3 + g
+
+    When the Sage curve E is omitted its order is assumed to be prime, so any point is a generator.
+    """
+    p, g, x = (gmpy2.mpz(int(_)) for _ in (p, g, 1))
+    while True:
+        yy = (gmpy2.powmod(x,3,p) + g) % p
+        y = MODSQRT_gmpy2(yy, p)
+        if (y*y) % p == yy:
+            if y & 1:
+                y = p - y
+            if E is None or E.point((x,y)).order() == E.order():
+                return int(x),int(y)
+        x += 1
+
+def sample_primes(bitlen:int, count:int, rng) -> list[int]:
+    """count random primes p = 7 (mod 12) of bitlen bits"""
+    primes = []
+    while len(primes) < count:
+        p = gmpy2.next_prime(rng.getrandbits(bitlen) | (1 << (bitlen - 1)))
+        if p % 12 == 7 and p.bit_length() == bitlen:
+            primes.append(p)
+    return primes
+
+def sample_non_residue(p:int) -> int:
+    """Smallest g that is neither a square nor a cube mod p, it stands in for a generator of F_p*
+
+    The twist orders only depend on g's class in F_p* / (F_p*)^6, where such a g is a generator.
+    """
+    g = 2
+    while ZETA_gmpy2(2, g, p) == 1 or ZETA_gmpy2(3, g, p) == 1:
+        g += 1
+    return g
+
+def _cornacchia_inputs(bitlen:int, count:int, rng):
+    return [(3, p) for p in sample_primes(bitlen, count, rng)]
+
+def _curve_order_inputs(bitlen:int, count:int, rng):
+    return [(p, sample_non_residue(p), *cornacchia_gmpy2(3, p)) for p in sample_primes(bitlen, count, rng)]
+
+def sample_prime_order_curves(bitlen:int, count:int, rng) -> list[tuple[int,int,int,tuple[int,int]]]:
+    """(p, b, q, (a, b')) for count prime order curves y^2 = x^3 + b over F_p = a^2 + 3b'^2"""
+    curves = []
+    while len(curves) < count:
+        for p, g, a, b in _curve_order_inputs(bitlen, count, rng):
+            for i, q in enumerate(calculate_curve_orders(p, g, a, b)):
+                if len(curves) < count and gmpy2.is_prime(q):
+                    curves.append((p, gmpy2.powmod(g, i, p), q, (a, b)))
+    return curves
+
+def _find_generator_inputs(bitlen:int, count:int, rng):
+    # Prime order curves, so find_generator needn't check the point order with Sage
+    return [(b, p) for p, b, _, _ in sample_prime_order_curves(bitlen, count, rng)]
+
+def _sage_curve_orders(p, g, a, b) -> list[int]:
+    from sage.all import GF, EllipticCurve
+    return [EllipticCurve(GF(int(p)), [0, int(g)**i]).order() for i in range(6)]
+
+@benchmark('cornacchia', cornacchia_gmpy2, _cornacchia_inputs)
+def cornacchia_batch(d:list[int], p:list[int]) -> list[tuple[int,int]]:
+    """cornacchia_gmpy2 for each (d, p)
+
+    -3 is always a square mod p = 7 (mod 12), so for d = 3 the Legendre check is skipped,
+    that's one of the two powmods per prime.
+    """
+    return [cornacchia_gmpy2(d_i, p_i, check=(d_i != 3)) for d_i, p_i in zip(d, p)]
+
+@benchmark('find_generator', find_generator, _find_generator_inputs)
+def find_generator_batch(g:list[int], p:list[int]) -> list[tuple[int,int]]:
+    """find_generator for each prime order curve y^2 = x^3 + g"""
+    return [find_generator(g_i, p_i) for g_i, p_i in zip(g, p)]
+
+def calculate_curve_orders_batch(p, g, a, b) -> tuple[list[list[int]],np.ndarray,np.ndarray]:
+    """Twist orders of many primes p = a^2 + 3b^2 with multiplicative generators g
+
+    Returns (orders, idx, offsets): the orders of y^2 = x^3 + g^i for i = 0..5 of each
+    prime, the (N,) ALL_SUB_PATTERNS index and the (N, 6, 2) Eisenstein offsets of each
+    order. Only ZETA(3, g, p) is computed per prime, the pattern & offset lookups are
+    array operations and the orders a single pass of big integer arithmetic.
+    """
+    p = [gmpy2.mpz(_) for _ in p]
+    c = [gmpy2.mpz(a_i) + b_i for a_i, b_i in zip(a, b)]
+    d = [2 * gmpy2.mpz(b_i) for b_i in b]
+    assert all(p_i % 12 == 7 and c_i*c_i - c_i*d_i + d_i*d_i == p_i for p_i, c_i, d_i in zip(p, c, d))
+    u0 = np.fromiter(((c_i + d_i) % 3 == 2 for c_i, d_i in zip(c, d)), dtype=np.int64, count=len(p))
+    u1 = np.fromiter(((gmpy2.powmod(g_i, (p_i - 1) // 3, p_i) * c_i + d_i) % p_i == 0
+                      for p_i, g_i, c_i, d_i in zip(p, g, c, d)), dtype=np.int64, count=len(p))
+    idx = u0 * 2 + u1
+    patterns = np.array(ALL_SUB_PATTERNS, dtype=np.int64)[idx]
+    terms = np.array(TRACE_TERMS, dtype=np.int64)[patterns].tolist()
+    orders = [[p_i + 1 + x_0*c_i + x_1*d_i for x_0, x_1 in row]
+              for p_i, c_i, d_i, row in zip(p, c, d, terms)]
+    offsets = np.array(EISENSTEIN_OFFSETS, dtype=np.int64)[patterns]
+    return orders, idx, offsets
+
+@benchmark('curve_orders', calculate_curve_orders, _curve_order_inputs, _sage_curve_orders)
+def _curve_orders_batch(p, g, a, b) -> list[list[int]]:
+    return calculate_curve_orders_batch(p, g, a, b)[0]
+
+def multiplicative_order(x:int, n:int, factors:list[tuple[int,int]]) -> int:
+    """Order of x in (Z/nZ)* given the factorisation of the group order (e.g. n-1 for prime n)
+
+    Starts from the full group order and strips each prime as far as it will go,
+    that is one powmod per prime-power rather than re-factoring.
+    """
+    x = gmpy2.mpz(x)
+    n = gmpy2.mpz(n)
+    order = gmpy2.mpz(1)
+    for prime, power in factors:
+        order *= gmpy2.mpz(prime) ** power
+    for prime, power in factors:
+        prime = gmpy2.mpz(prime)
+        order //= prime ** power
+        y = gmpy2.powmod(x, order, n)
+        while y != 1:
+            y = gmpy2.powmod(y, prime, n)
+            order *= prime
+    return int(order)
+
+def embedding_degree(p:int, q:int, factors_q_minus_1:list[tuple[int,int]]) -> int:
+    """Smallest k where q | p^k - 1, i.e. the order of p mod q, for prime q"""
+    return multiplicative_order(p % q, q, factors_q_minus_1)
+
+def cm_discriminant(p:int, q:int) -> tuple[int,int,int]:
+    """Returns (trace, frobenius discriminant t^2 - 4p, conductor v) for a j-invariant 0 curve
+
+    For j = 0 the Frobenius discriminant must be -3v^2, which is verified here
+    rather than assumed, so the CM discriminant is -3.
+    """
+    t = p + 1 - q
+    disc = t * t - 4 * p
+    v2, rem = divmod(-disc, 3)
+    v = gmpy2.isqrt(v2)
+    assert rem == 0 and v * v == v2, "not a j-invariant 0 curve order"
+    return t, disc, int(v)
+
+def factor_digest(n:int) -> bytes:
+    n = int(n)
+    return hashlib.sha256(n.to_bytes(max(1, (n.bit_length() + 7) // 8), 'big')).digest()
+
+def sage_factor(n:int) -> list[tuple[int,int]]:
+    from sage.all import factor
+    return [(int(prime), int(power)) for prime, power in factor(n)]
+
+class FactorCache:
+    """Factorisations keyed by a hash of the integer, an in-process LRU in front of a sqlite table
+
+    Shared by every step & script using the same database, so the same integer
+    (e.g. q-1 of a curve seen by step 7, step 8 and results.py) is only factored once.
+    """
+    table_name = "factorcache"
+
+    def __init__(self, conn:sqlite3.Connection=None, size:int=4096):
+        self.conn = conn
+        self.size = size
+        self.lru = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if conn is not None:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table_name} (
+                    digest BLOB PRIMARY KEY,
+                    n TEXT NOT NULL,
+                    factors_json TEXT NOT NULL
+                )
+            """)
+            conn.commit()
+
+    def _remember(self, digest:bytes, factors:list[tuple[int,int]]):
+        self.lru[digest] = factors
+        self.lru.move_to_end(digest)
+        while len(self.lru) > self.size:
+            self.lru.popitem(last=False)
+
+    def get(self, n:int) -> list[tuple[int,int]]:
+        digest = factor_digest(n)
+        if digest in self.lru:
+            self.lru.move_to_end(digest)
+            self.hits += 1
+            return self.lru[digest]
+        if self.conn is not None:
+            row = self.conn.execute(f"SELECT n, factors_json FROM {self.table_name} WHERE digest = ?", (digest,)).fetchone()
+            if row is not None and int(row[0]) == n:
+                factors = factors_load(row[1])
+                self._remember(digest, factors)
+                self.hits += 1
+                return factors
+        self.misses += 1
+        return None
+
+    def put(self, n:int, factors:list[tuple[int,int]], commit:bool=True):
+        n = int(n)
+        factors = [(int(prime), int(power)) for prime, power in factors]
+        digest = factor_digest(n)
+        self._remember(digest, factors)
+        if self.conn is not None:
+            factors_json = json.dumps([[str(prime), power] for prime, power in factors])
+            self.conn.execute(f"INSERT OR IGNORE INTO {self.table_name} (digest, n, factors_json) VALUES (?, ?, ?)",
+                              (digest, str(n), factors_json))
+            if commit:
+                self.conn.commit()
+
+    def factor(self, n:int, factor_fn=sage_factor, commit:bool=True) -> list[tuple[int,int]]:
+        n = int(n)
+        factors = self.get(n)
+        if factors is None:
+            factors = factor_fn(n)
+            self.put(n, factors, commit)
+        return factors
+
+def primes_below(bound:int) -> list[int]:
+    sieve = bytearray([1]) * bound
+    sieve[0:2] = b'\x00\x00'
+    for i in range(2, int(bound ** 0.5) + 1):
+        if sieve[i]:
+            sieve[i*i::i] = bytearray(len(range(i*i, bound, i)))
+    return [i for i, is_p in enumerate(sieve) if is_p]
+
+def get_q_range(k:int, p_min:int, p_max:int) -> tuple[int,int]:
+    """Range of q where p_min <= k*q+1 <= p_max"""
+    q_min = (p_min - 1 + k - 1) // k  # Ceiling division trick
+    q_max = (p_max - 1) // k          # Floor division
+    if q_min <= q_max:
+        return q_min, q_max
+
+def analyze_k(k:int, m:int, r:int) -> list[int]:
+    """Residues of q mod m, coprime to m, where k*q+1 = r (mod m)"""
+    s = (r - 1) % m
+    d = math.gcd(k, m)
+    if s % d != 0:
+        return []
+    t = m // d
+    u = (pow(k // d, -1, t) * (s // d)) % t
+    a = [(u + i * t) % m for i in range(d)]
+    return [_ for _ in a if math.gcd(_,m) == 1]
+
+def sieve_kq1(k:int, mod:int, q_mods:list[int], q_min:int, q_max:int, rng, width:int=2**16, bound:int=2**12):
+    """Yields (p, q, tries) where q and p = k*q+1 are both prime and q mod `mod` is in q_mods
+
+    The range is cut into windows of `width` candidates per residue class, each round
+    sieves the next window out of q or k*q+1 having a prime factor below bound, and only
+    runs primality tests on what survives both. Windows are visited in a random order
+    without repeats and the generator ends once all are done. `tries` counts the
+    primality tests on q so far.
+    """
+    # (s, 1/mod, -1/k) mod s for each small prime, k*q+1 can't be divisible by s when s | k
+    small_primes = [(s, pow(mod, -1, s), -pow(k, -1, s) if k % s else None)
+                    for s in primes_below(bound) if mod % s != 0]
+    span = mod * width
+    q_lo = q_min - q_min % mod
+    n_windows = (q_max - q_lo) // span + 1
+    # Window i -> (a*i + b) mod n_windows is a permutation when a is coprime to n_windows
+    a = rng.randrange(1, n_windows) if n_windows > 1 else 1
+    while math.gcd(a, n_windows) != 1:
+        a = rng.randrange(1, n_windows)
+    b = rng.randrange(n_windows)
+    tries = 0
+    for i in range(n_windows):
+        q0 = q_lo + span * ((a * i + b) % n_windows)
+        for r in q_mods:
+            base = q0 + r
+            alive = bytearray([1]) * width
+            for s, mod_inv, k_neg_inv in small_primes:
+                # j where s divides q = base + mod*j
+                j = (-base * mod_inv) % s
+                alive[j::s] = bytes(len(range(j, width, s)))
+                if k_neg_inv is not None:
+                    # j where s divides k*q+1
+                    j = ((k_neg_inv - base) * mod_inv) % s
+                    alive[j::s] = bytes(len(range(j, width, s)))
+            for j in (j for j, ok in enumerate(alive) if ok):
+                q = base + mod * j
+                if q < q_min or q > q_max:
+                    continue
+                tries += 1
+                if gmpy2.is_prime(q) and gmpy2.is_prime(k * q + 1):
+                    yield k * q + 1, q, tries
+
+def product_tree(xs:list[int]) -> list[list]:
+    """Levels of pairwise products, tree[0] are the leaves & tree[-1] = [product of all]"""
+    tree = [[gmpy2.mpz(_) for _ in xs]]
+    while len(tree[-1]) > 1:
+        level = tree[-1]
+        tree.append([level[i] * level[i+1] if i + 1 < len(level) else level[i] for i in range(0, len(level), 2)])
+    return tree
+
+def batch_gcd(xs:list[int]) -> list[int]:
+    """gcd(x_i, product of all other x_j) for every x_i, via a product tree and remainder tree (Bernstein)"""
+    if not xs:
+        return []
+    tree = product_tree(xs)
+    rems = tree[-1]
+    for level in reversed(tree[:-1]):
+        rems = [rems[i // 2] % (x * x) for i, x in enumerate(level)]
+    return [int(gmpy2.gcd(r // x, x)) for r, x in zip(rems, tree[0])]
+
+def partial_factorisation(n:int, primes:list[int]) -> tuple[list[tuple[int,int]],int]:
+    """Divide n by each of the given primes as often as possible, returns (factors, cofactor)"""
+    n = gmpy2.mpz(n)
+    factors = []
+    for prime in primes:
+        power = 0
+        while n % prime == 0:
+            n //= prime
+            power += 1
+        if power:
+            factors.append((int(prime), power))
+    return factors, int(n)
+
+def strip_small_primes(n:int, primes:list[int], primorial:int=None) -> tuple[list[tuple[int,int]],int]:
+    """partial_factorisation by small primes, the gcd with their product avoids dividing by most of them"""
+    primorial = primorial or math.prod(primes)
+    g = gmpy2.gcd(n, primorial)
+    if g == 1:
+        return [], int(n)
+    dividing = []
+    for prime in primes:
+        if g % prime == 0:
+            dividing.append(prime)
+            g //= prime
+            if g == 1:
+                break
+    return partial_factorisation(n, dividing)
+
+def factor_with_partial(n:int, partial:list[tuple[int,int]], factor_fn=sage_factor) -> list[tuple[int,int]]:
+    """Complete factorisation of n given some of its prime factors, only the cofactor goes to factor_fn"""
+    factors, cofactor = partial_factorisation(n, [prime for prime, _ in partial])
+    if cofactor > 1:
+        factors += [(cofactor, 1)] if gmpy2.is_prime(cofactor) else factor_fn(cofactor)
+    return sorted(factors)
+
+def primes_7mod12_walk(start:int, width:int, next_prime=gmpy2.next_prime) -> list[int]:
+    """Primes p = 7 (mod 12) in [start, start + width), one next_prime after another like step 1"""
+    primes = []
+    p = next_prime(start - 1)
+    while p < start + width:
+        if p % 12 == 7:
+            primes.append(int(p))
+        p = next_prime(p)
+    return primes
+
+def primes_7mod12_window(start:int, width:int, bound:int=2**12) -> list[int]:
+    """Same as primes_7mod12_walk, candidates with a prime factor below bound are sieved out first"""
+    assert start > bound
+    n0 = start + (7 - start) % 12
+    alive = np.ones(max(0, (start + width - n0 + 11) // 12), dtype=bool)
+    for s in small_primes(bound)[2:]:
+        # j where s divides n0 + 12*j
+        alive[(-n0 * pow(12, -1, s)) % s::s] = False
+    return [n for n in (n0 + 12 * int(j) for j in np.flatnonzero(alive)) if gmpy2.is_prime(n)]
+
+def _sieve_inputs(bitlen:int, count:int, rng):
+    # A window is an item, of 2^10 candidates p = 7 (mod 12)
+    return [(rng.getrandbits(bitlen) | (1 << (bitlen - 1)), 12 * 2**10) for _ in range(max(1, count // 10))]
+
+def _sage_primes_7mod12(start:int, width:int) -> list[int]:
+    from sage.all import next_prime
+    return primes_7mod12_walk(start, width, lambda n: next_prime(int(n)))
+
+@benchmark('sieve', primes_7mod12_walk, _sieve_inputs, _sage_primes_7mod12)
+def primes_7mod12_batch(start:list[int], width:list[int]) -> list[list[int]]:
+    return [primes_7mod12_window(s_i, w_i) for s_i, w_i in zip(start, width)]
+
+@lru_cache
+def small_primes(bound:int) -> tuple[int]:
+    return tuple(primes_below(bound))
+
+@lru_cache
+def small_primorial(bound:int) -> int:
+    return gmpy2.mpz(math.prod(small_primes(bound)))
+
+def trial_division(n:int, bound:int=2**16) -> tuple[list[tuple[int,int]],int]:
+    """(factors below bound, cofactor) of n, dividing by every prime below bound"""
+    return partial_factorisation(n, small_primes(bound))
+
+def _trial_division_inputs(bitlen:int, count:int, rng):
+    return [(p - 1, 2**16) for p in sample_primes(bitlen, count, rng)]
+
+def _sage_trial_division(n:int, bound:int) -> tuple[list[tuple[int,int]],int]:
+    from sage.rings.factorint import factor_trial_division
+    factors = [(int(prime), int(power)) for prime, power in factor_trial_division(n, bound) if prime < bound]
+    return factors, int(n // math.prod(prime**power for prime, power in factors))
+
+@benchmark('trial_division', trial_division, _trial_division_inputs, _sage_trial_division)
+def trial_division_batch(n:list[int], bound:list[int]) -> list[tuple[list[tuple[int,int]],int]]:
+    """trial_division for each n, the gcd with the primorial skips the primes which don't divide it"""
+    return [strip_small_primes(n_i, small_primes(b_i), small_primorial(b_i)) for n_i, b_i in zip(n, bound)]
+
+def multiplicative_generator(p:int, primes:list[int]) -> int:
+    """Smallest generator of F_p* given the distinct primes dividing p-1"""
+    g = 2
+    while any(gmpy2.powmod(g, (p - 1) // f, p) == 1 for f in primes):
+        g += 1
+    return g
+
+def _multiplicative_generator_inputs(bitlen:int, count:int, rng):
+    # p = 6q+1, so p-1 is factored without factoring
+    q_min, q_max = get_q_range(6, 2**(bitlen - 1), 2**bitlen - 1)
+    safe = sieve_kq1(6, 12, analyze_k(6, 12, 7), q_min, q_max, rng)
+    return [(p, [2, 3, q]) for (p, q, _), _ in zip(safe, range(count))]
+
+def _sage_multiplicative_generator(p:int, primes:list[int]) -> int:
+    from sage.all import GF
+    return int(GF(int(p)).multiplicative_generator())
+
+register_kernel('multiplicative_generator', multiplicative_generator, _multiplicative_generator_inputs,
+                _sage_multiplicative_generator)
+
+def _factoring_inputs(bitlen:int, count:int, rng):
+    # No prime factor above 64 bits, so factoring time stays bounded up to 512 bits
+    inputs = []
+    for _ in range(count):
+        n = 1
+        while n.bit_length() < bitlen:
+            n *= int(gmpy2.next_prime(rng.getrandbits(min(64, bitlen - n.bit_length() + 2))))
+        inputs.append((n,))
+    return inputs
+
+register_kernel('factoring', sage_factor, _factoring_inputs)
+
+# (B1, curves) from the GMP-ECM recommended parameters, finding factors of up to 15..50 digits
+ECM_LEVELS = ((2000, 25), (11000, 90), (50000, 300), (250000, 700),
+              (1000000, 1800), (3000000, 5100), (11000000, 10600), (43000000, 19300))
+
+def sage_ecm_find_factor(n:int, B1:int, curves:int):
+    """A non-trivial factor of n found by up to `curves` ECM curves at B1, or None"""
+    from sage.all import ecm
+    found = [int(_) for _ in ecm.find_factor(n, B1=B1, c=curves)]
+    return found[0] if len(found) > 1 else None
+
+def largest_prime_log2_bounds(factors:list[tuple[int,int]], cofactor:int, trial_bound:int) -> tuple[float,float]:
+    """Bounds on log2 of the largest prime factor given proven primes and a composite cofactor without factors below trial_bound"""
+    known = max((math.log2(prime) for prime, _ in factors), default=0.0)
+    cofactor_log2 = math.log2(cofactor)
+    # Every prime factor of the cofactor is >= trial_bound, so it has at most k of them
+    k = max(2, int(cofactor_log2 // math.log2(trial_bound)))
+    return max(known, cofactor_log2 / k), max(known, cofactor_log2 - math.log2(trial_bound))
+
+def adequate_factorisation(n:int, bitsize:int, tolerance:float, partial:list[tuple[int,int]]=None,
+                           trial_bound:int=2**16, factor_fn=sage_factor, find_factor=sage_ecm_find_factor,
+                           checkpoints:'ECMCheckpoints'=None, deadline:float=None):
+    """Factor n only until log2 of its largest prime factor is settled
+
+    Stops when the cofactor is 1 or prime, when it's smaller than the largest proven
+    prime (so can't contain the largest) or when the bounds on the largest prime are
+    within tolerance*bitsize of their midpoint. ECM is run at increasing B1 to split
+    the cofactor, if every level fails it's handed to factor_fn.
+
+    With checkpoints the factors, cofactor, level & curves done are saved after every
+    chunk of curves as ECMCheckpoints.factor does, and the next call for the same n
+    carries on from there. Returns None once time.monotonic() passes the deadline.
+
+    Returns (factors, cofactor, lower, upper): the proven prime factors, the unsplit
+    cofactor (1 when complete) and bounds on log2 of the largest prime factor.
+    """
+    n = int(n)
+    factors, cofactor, level, curves_done, seconds = checkpoints.load(n) if checkpoints else ([], n, 0, 0, 0.0)
+    # A resumed cofactor had these removed before it was saved, so they find nothing new
+    more, cofactor = partial_factorisation(cofactor, [prime for prime, _ in partial or []])
+    factors += more
+    more, cofactor = strip_small_primes(cofactor, primes_below(trial_bound))
+    factors += more
+    started = time.monotonic()
+    result = None
+    while cofactor > 1:
+        if gmpy2.is_prime(cofactor):
+            factors.append((cofactor, 1))
+            cofactor = 1
+            break
+        if factors and cofactor < max(prime for prime, _ in factors):
+            break
+        lower, upper = largest_prime_log2_bounds(factors, cofactor, trial_bound)
+        if upper - lower <= 2 * tolerance * bitsize:
+            result = sorted(factors), cofactor, lower, upper
+            break
+        if level < len(ECM_LEVELS):
+            B1, curves = ECM_LEVELS[level]
+            count = curves - curves_done
+            if checkpoints:
+                count = min(checkpoints.chunk, count)
+            found = find_factor(cofactor, B1, count)
+            curves_done += count
+            if curves_done >= curves:
+                level, curves_done = level + 1, 0
+        else:
+            found = cofactor
+        if found is not None:
+            split, cofactor = partial_factorisation(cofactor, [prime for prime, _ in factor_fn(found)])
+            factors += split
+        if checkpoints:
+            checkpoints.save(n, factors, cofactor, level, curves_done, seconds + time.monotonic() - started)
+        if deadline is not None and time.monotonic() > deadline:
+            return None
+    if checkpoints and (level or curves_done):
+        checkpoints.delete(n)
+    if result is not None:
+        return result
+    largest = math.log2(max(prime for prime, _ in factors))
+    return sorted(factors), cofactor, largest, largest
+
+class ECMCheckpoints:
+    """Resumable ECM, the state of each number is saved after every few curves
+
+    A hard cofactor goes through ECM_LEVELS a chunk of curves at a time, after each
+    chunk the prime factors found so far, the cofactor left, the level & curves done
+    are written to the `ecmstate` table and committed. If the process is interrupted
+    or the deadline passes the next attempt at the same number carries on from there,
+    once every level is exhausted the cofactor is handed to factor_fn.
+    """
+    table_name = "ecmstate"
+
+    def __init__(self, conn:sqlite3.Connection, chunk:int=25):
+        self.conn = conn
+        self.chunk = chunk
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table_name} (
+                digest BLOB PRIMARY KEY,
+                n TEXT NOT NULL,
+                factors_json TEXT NOT NULL,
+                cofactor TEXT NOT NULL,
+                level INTEGER NOT NULL,
+                curves_done INTEGER NOT NULL,
+                seconds REAL NOT NULL
+            )
+        """)
+        conn.commit()
+
+    def load(self, n:int):
+        """(factors, cofactor, level, curves_done, seconds) for n, from where it was left or from scratch"""
+        row = self.conn.execute(f"SELECT n, factors_json, cofactor, level, curves_done, seconds FROM {self.table_name} WHERE digest = ?",
+                                (factor_digest(n),)).fetchone()
+        if row is None or int(row[0]) != n:
+            return [], n, 0, 0, 0.0
+        return factors_load(row[1]), int(row[2]), row[3], row[4], row[5]
+
+    def save(self, n:int, factors:list[tuple[int,int]], cofactor:int, level:int, curves_done:int, seconds:float):
+        self.conn.execute(f"""INSERT OR REPLACE INTO {self.table_name}
+            (digest, n, factors_json, cofactor, level, curves_done, seconds)
+            VALUES (?, ?, ?, ?, ?, ?, ?)""", (
+            factor_digest(n), str(n), json.dumps([[str(prime), power] for prime, power in factors]),
+            str(cofactor), level, curves_done, seconds))
+        self.conn.commit()
+
+    def delete(self, n:int):
+        self.conn.execute(f"DELETE FROM {self.table_name} WHERE digest = ?", (factor_digest(n),))
+        self.conn.commit()
+
+    def factor(self, n:int, deadline:float=None, factor_fn=sage_factor, find_factor=sage_ecm_find_factor):
+        """Complete factorisation of n, or None if time.monotonic() passed the deadline first"""
+        n = int(n)
+        factors, cofactor, level, curves_done, seconds = self.load(n)
+        started = time.monotonic()
+        while cofactor > 1 and not gmpy2.is_prime(cofactor):
+            if level >= len(ECM_LEVELS):
+                split, cofactor = partial_factorisation(cofactor, [prime for prime, _ in factor_fn(cofactor)])
+                factors += split
+                break
+            B1, curves = ECM_LEVELS[level]
+            count = min(self.chunk, curves - curves_done)
+            found = find_factor(cofactor, B1, count)
+            if found is not None:
+                # Curves run so far still count for what's left of the cofactor
+                split, cofactor = partial_factorisation(cofactor, [prime for prime, _ in factor_fn(found)])
+                factors += split
+            curves_done += count
+            if curves_done >= curves:
+                level, curves_done = level + 1, 0
+            self.save(n, factors, cofactor, level, curves_done, seconds + time.monotonic() - started)
+            if deadline is not None and time.monotonic() > deadline:
+                return None
+        if cofactor > 1:
+            factors.append((cofactor, 1))
+        if level or curves_done:
+            self.delete(n)
+        return sorted(factors)
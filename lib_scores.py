@@ -0,0 +1,318 @@
+# Materialised curve scores, see results.get_scores for the same ranking computed from scratch
+#
+# Facets of each twist factorisation and of p-1 come from the metrics table below, the
+# per-facet normalisation bounds only ever widen so when they don't change only the
+# families with new factorisations need to be re-scored. New curvefactor rows are
+# found by rowid, step 7 only ever appends.
+
+import json
+import sqlite3
+import numpy as np
+from collections import defaultdict
+from lib_eta import eta_np, eta_norm_np, eta_groupby, factors_load, factors_load_bounded, factors_metrics, factors_metrics_np, Metric, METRICS, DEFAULT_METRICS
+from lib_nt import benchmark, sample_primes, trial_division
+
+def _scoring_inputs(bitlen:int, count:int, rng):
+    # Trial factors & cofactor of p-1 stand in for a complete factorisation
+    inputs = []
+    for p in sample_primes(bitlen, count, rng):
+        factors, cofactor = trial_division(p - 1)
+        inputs.append((factors + ([(cofactor, 1)] if cofactor > 1 else []), bitlen, tuple(METRICS)))
+    return inputs
+
+@benchmark('scoring', factors_metrics, _scoring_inputs)
+def _scoring_batch(factors:list[list[tuple[int,int]]], bitsize:list[int], names:list[tuple[str]]) -> list[list[float]]:
+    return factors_metrics_np(factors, bitsize[0], names[0]).tolist()
+
+def create_scores_tables(conn:sqlite3.Connection, bitsize:int):
+    scores_table = f"scores_2p{bitsize}_m2p32_mx"
+    bounds_table = f"scorebounds_2p{bitsize}_m2p32_mx"
+    state_table = f"scorestate_2p{bitsize}_m2p32_mx"
+    # Earlier versions kept their own copy of the facets, start again from the metrics table
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({scores_table})")}
+    if 'prime_facets_json' in existing:
+        for table_name in (scores_table, bounds_table, state_table, f"scorefacets_2p{bitsize}_m2p32_mx"):
+            conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {state_table} (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {scores_table} (
+            mx INTEGER PRIMARY KEY,
+            score REAL NOT NULL
+        )
+    """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {scores_table}_score ON {scores_table} (score)")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {bounds_table} (
+            facet INTEGER PRIMARY KEY,
+            xmin REAL NOT NULL,
+            xmax REAL NOT NULL
+        )
+    """)
+    conn.commit()
+    create_metrics_table(conn, bitsize)
+    return scores_table, bounds_table
+
+def _chunked(seq:list, size:int=500):
+    for i in range(0, len(seq), size):
+        yield seq[i:i+size]
+
+# Added by step 7's adequate mode, absent from databases it hasn't run on since
+BOUNDS_COLUMNS = ('cofactor', 'largest_prime_log2_lower', 'largest_prime_log2_upper')
+
+def bounds_columns(conn:sqlite3.Connection, bitsize:int, alias:str='cft', names:tuple[str]=BOUNDS_COLUMNS) -> str:
+    """SELECT expressions for the columns factors_load_bounded needs after factors_json"""
+    curvefactor_table = f"curvefactor_2p{bitsize}_m2p32_mx"
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({curvefactor_table})")}
+    return ', '.join(f"{alias}.{name}" if name in existing else 'NULL' for name in names)
+
+def match_prime_facets(mx:np.ndarray, primes:dict[str,np.ndarray]) -> tuple[np.ndarray,np.ndarray]:
+    """(found, idx) where primes['facets'][idx[found]] are the p-1 facets of mx[found]
+
+    mx without a trial_division row (step 3 hasn't done them) have no p-1 facets.
+    """
+    if len(primes['mx']) == 0:
+        return np.zeros(len(mx), dtype=bool), np.zeros(len(mx), dtype=np.int64)
+    idx = np.minimum(np.searchsorted(primes['mx'], mx), len(primes['mx']) - 1)
+    return primes['mx'][idx] == mx, idx
+
+def update_scores(conn:sqlite3.Connection, bitsize:int) -> int:
+    """Add metrics for any new factorisations and re-score the affected families, returns how many were scored"""
+    scores_table, bounds_table = create_scores_tables(conn, bitsize)
+    metrics_table = f"metrics_2p{bitsize}_m2p32_mx"
+    state_table = f"scorestate_2p{bitsize}_m2p32_mx"
+    curvefactor_table = f"curvefactor_2p{bitsize}_m2p32_mx"
+    row = conn.execute(f"SELECT value FROM {state_table} WHERE name = 'curvefactor_rowid'").fetchone()
+    last_rowid = row[0] if row is not None else 0
+    max_rowid = conn.execute(f"SELECT MAX(rowid) FROM {curvefactor_table}").fetchone()[0]
+    has_new = max_rowid is not None and max_rowid > last_rowid
+    affected = set()
+    if has_new:
+        affected.update(mx for (mx,) in conn.execute(f"SELECT DISTINCT mx FROM {curvefactor_table} WHERE rowid > ? AND order_offset <= 0", (last_rowid,)))
+    # Families left unscored before because p-1 had no trial_division row are retried
+    first = METRICS[DEFAULT_METRICS[0]]
+    affected.update(mx for (mx,) in conn.execute(f"""
+        SELECT DISTINCT m.mx FROM {metrics_table} m
+         WHERE m.metric = ? AND m.version = ? AND m.generator_power != {PRIME_KEY}
+           AND m.mx NOT IN (SELECT mx FROM {scores_table})
+    """, (first.name, first.version)))
+    affected = sorted(affected)
+    if not affected:
+        return 0
+    update_metrics(conn, bitsize, DEFAULT_METRICS, affected)
+    if has_new:
+        conn.execute(f"INSERT OR REPLACE INTO {state_table} (name, value) VALUES ('curvefactor_rowid', ?)", (max_rowid,))
+    twists, primes = load_metric_columns(conn, bitsize, DEFAULT_METRICS, affected)
+    if len(twists['mx']) == 0:
+        conn.commit()
+        return 0
+
+    # Widen the normalisation bounds, if they move every family must be re-scored
+    bounds = dict((facet, (xmin, xmax)) for facet, xmin, xmax in conn.execute(f"SELECT facet, xmin, xmax FROM {bounds_table}"))
+    rescore_all = False
+    for facet, (xmin, xmax) in enumerate(zip(twists['facets'].min(axis=0).tolist(), twists['facets'].max(axis=0).tolist())):
+        old_min, old_max = bounds.get(facet, (xmin, xmax))
+        new_bounds = (min(xmin, old_min), max(xmax, old_max))
+        if facet not in bounds or new_bounds != bounds[facet]:
+            bounds[facet] = new_bounds
+            rescore_all = True
+    conn.executemany(f"INSERT OR REPLACE INTO {bounds_table} (facet, xmin, xmax) VALUES (?, ?, ?)",
+                     [(facet, xmin, xmax) for facet, (xmin, xmax) in bounds.items()])
+    if rescore_all:
+        twists, primes = load_metric_columns(conn, bitsize, DEFAULT_METRICS)
+
+    facets = twists['facets']
+    xmin = np.array([bounds[_][0] for _ in range(facets.shape[1])])
+    xmax = np.array([bounds[_][1] for _ in range(facets.shape[1])])
+    group_keys, group_eta = eta_groupby(twists['mx'] * 2 + twists['is_prime'], eta_np(eta_norm_np(facets, xmin, xmax)))
+    mx, curve_scores = eta_groupby(group_keys // 2, group_eta)
+    found, idx = match_prime_facets(mx, primes)
+    if not found.all():
+        # No trial_division row for p-1 yet, retried by later updates until step 3 has done them
+        print(f"  Not scoring {int((~found).sum())} mx without prime facets, e.g. {mx[~found][:5].tolist()}")
+        mx, curve_scores, idx = mx[found], curve_scores[found], idx[found]
+    scores = eta_np(np.column_stack([curve_scores, primes['facets'][idx]]))
+    conn.executemany(f"INSERT OR REPLACE INTO {scores_table} (mx, score) VALUES (?, ?)", zip(mx.tolist(), scores.tolist()))
+    conn.commit()
+    return len(mx)
+
+def top_scores(conn:sqlite3.Connection, bitsize:int, n:int) -> list[tuple[int,float]]:
+    scores_table = f"scores_2p{bitsize}_m2p32_mx"
+    sql = f"SELECT mx, score FROM {scores_table} WHERE score IS NOT NULL ORDER BY score DESC, mx ASC LIMIT ?"
+    return [tuple(_) for _ in conn.execute(sql, (n,)).fetchall()]
+
+def bottom_scores(conn:sqlite3.Connection, bitsize:int, n:int) -> list[tuple[int,float]]:
+    """Lowest n scores, in the same (descending) order as top_scores"""
+    scores_table = f"scores_2p{bitsize}_m2p32_mx"
+    sql = f"SELECT mx, score FROM {scores_table} WHERE score IS NOT NULL ORDER BY score ASC, mx DESC LIMIT ?"
+    return [tuple(_) for _ in conn.execute(sql, (n,)).fetchall()][::-1]
+
+def score_rank(conn:sqlite3.Connection, bitsize:int, mx:int) -> tuple[int,float]:
+    """Returns (rank, score) of mx where rank 1 is the best, or None if it isn't scored"""
+    scores_table = f"scores_2p{bitsize}_m2p32_mx"
+    row = conn.execute(f"SELECT score FROM {scores_table} WHERE mx = ? AND score IS NOT NULL", (mx,)).fetchone()
+    if row is None:
+        return None
+    score = row[0]
+    better = conn.execute(f"""SELECT COUNT(*) FROM {scores_table}
+        WHERE score > ? OR (score = ? AND mx < ?)""", (score, score, mx)).fetchone()[0]
+    return better + 1, score
+
+def score_range(conn:sqlite3.Connection, bitsize:int) -> tuple[float,float]:
+    scores_table = f"scores_2p{bitsize}_m2p32_mx"
+    return tuple(conn.execute(f"SELECT MIN(score), MAX(score) FROM {scores_table}").fetchone())
+
+def score_histogram(conn:sqlite3.Connection, bitsize:int, buckets:int=100) -> dict[int,int]:
+    scores_table = f"scores_2p{bitsize}_m2p32_mx"
+    sql = f"""SELECT CAST(score * ? AS INTEGER) AS bucket, COUNT(*)
+                FROM {scores_table} WHERE score IS NOT NULL
+               GROUP BY bucket ORDER BY bucket"""
+    return dict(conn.execute(sql, (buckets,)).fetchall())
+
+# Cache of named metrics (lib_eta.METRICS) per factorisation, so any subset can be
+# composed into the eta tree without parsing factors_json again. The p-1 factorisation
+# of each prime is stored with generator_power = order_offset = PRIME_KEY.
+PRIME_KEY = -1
+
+def create_metrics_table(conn:sqlite3.Connection, bitsize:int):
+    metrics_table = f"metrics_2p{bitsize}_m2p32_mx"
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {metrics_table} (
+            metric TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            mx INTEGER NOT NULL,
+            generator_power INTEGER NOT NULL,
+            order_offset INTEGER NOT NULL,
+            value REAL NOT NULL,
+            PRIMARY KEY (metric, version, mx, generator_power, order_offset)
+        ) WITHOUT ROWID
+    """)
+    conn.commit()
+    return metrics_table
+
+def _expected_metric_count(conn:sqlite3.Connection, bitsize:int) -> int:
+    """How many values each metric has once it is complete, matches the rows of _missing_metrics"""
+    curvefactor_table = f"curvefactor_2p{bitsize}_m2p32_mx"
+    curves_table = f"curves_2p{bitsize}_m2p32_mx"
+    trial_div_table = f"trial_division_2p{bitsize}_m2p32_mx"
+    prime_mx = f"SELECT DISTINCT mx FROM {curves_table} WHERE is_prime = 1"
+    twists = conn.execute(f"SELECT COUNT(*) FROM {curvefactor_table} WHERE order_offset <= 0 AND mx IN ({prime_mx})").fetchone()[0]
+    primes = conn.execute(f"SELECT COUNT(*) FROM {trial_div_table} WHERE mx IN ({prime_mx})").fetchone()[0]
+    return twists + primes
+
+def _missing_metrics(conn:sqlite3.Connection, bitsize:int, m:Metric, mx_list:list[int]=None):
+    """(mx, generator_power, order_offset, factors_row) which don't have a value for this metric & version"""
+    metrics_table = f"metrics_2p{bitsize}_m2p32_mx"
+    curvefactor_table = f"curvefactor_2p{bitsize}_m2p32_mx"
+    curves_table = f"curves_2p{bitsize}_m2p32_mx"
+    trial_div_table = f"trial_division_2p{bitsize}_m2p32_mx"
+    missing = f"""NOT EXISTS (SELECT 1 FROM {metrics_table} m
+                   WHERE m.metric = ? AND m.version = ? AND m.mx = {{0}}.mx
+                     AND m.generator_power = {{1}} AND m.order_offset = {{2}})"""
+    twist_sql = f"""
+        SELECT cft.mx, cft.generator_power, cft.order_offset, cft.factors_json, {bounds_columns(conn, bitsize)}
+        FROM {curvefactor_table} cft
+        WHERE cft.order_offset <= 0
+          AND EXISTS (SELECT 1 FROM {curves_table} ct WHERE ct.mx = cft.mx AND ct.is_prime = 1)
+          AND {missing.format('cft', 'cft.generator_power', 'cft.order_offset')}
+    """
+    prime_sql = f"""
+        SELECT td.mx, {PRIME_KEY}, {PRIME_KEY}, td.factors_json, NULL, NULL, NULL
+        FROM {trial_div_table} td
+        WHERE EXISTS (SELECT 1 FROM {curves_table} ct WHERE ct.mx = td.mx AND ct.is_prime = 1)
+          AND {missing.format('td', PRIME_KEY, PRIME_KEY)}
+    """
+    for sql, alias in ((twist_sql, 'cft'), (prime_sql, 'td')):
+        for chunk in ([None] if mx_list is None else _chunked(mx_list)):
+            params = (m.name, m.version)
+            if chunk is not None:
+                sql_chunk = f"{sql} AND {alias}.mx IN ({','.join('?' * len(chunk))})"
+                params += tuple(chunk)
+            for mx, g_i, order_offset, *factors_row in conn.execute(sql if chunk is None else sql_chunk, params).fetchall():
+                yield mx, g_i, order_offset, factors_row
+
+def update_metrics(conn:sqlite3.Connection, bitsize:int, names:tuple[str]=DEFAULT_METRICS, mx_list:list[int]=None) -> int:
+    """Compute any missing metric values (only for mx_list if given), each factorisation is parsed at most once. Returns how many were added"""
+    metrics_table = create_metrics_table(conn, bitsize)
+    work = defaultdict(list)
+    factors_by_key = {}
+    expected = _expected_metric_count(conn, bitsize) if mx_list is None else None
+    count_sql = f"SELECT COUNT(*) FROM {metrics_table} WHERE metric = ? AND version = ?"
+    for name in names:
+        m = METRICS[name]
+        if expected is not None and conn.execute(count_sql, (m.name, m.version)).fetchone()[0] == expected:
+            continue
+        for mx, g_i, order_offset, factors_row in _missing_metrics(conn, bitsize, m, mx_list):
+            work[mx, g_i, order_offset].append(m)
+            factors_by_key[mx, g_i, order_offset] = factors_row
+    batch = []
+    for key, todo in work.items():
+        factors = factors_load_bounded(*factors_by_key[key])
+        batch += [(m.name, m.version, *key, m.fn(factors, bitsize)) for m in todo]
+    conn.executemany(f"""INSERT OR IGNORE INTO {metrics_table}
+        (metric, version, mx, generator_power, order_offset, value)
+        VALUES (?, ?, ?, ?, ?, ?)""", batch)
+    conn.commit()
+    return len(batch)
+
+def _ordered_rows(conn:sqlite3.Connection, sql:str, params:tuple, order:str, mx_list:list[int]=None) -> list[tuple]:
+    """Rows of sql (which has a WHERE clause) ordered by order, only of mx_list if given"""
+    if mx_list is None:
+        return conn.execute(f"{sql} ORDER BY {order}", params).fetchall()
+    rows = []
+    # Chunks of an ascending mx_list, so the concatenation stays in order
+    for chunk in _chunked(sorted(mx_list)):
+        rows += conn.execute(f"{sql} AND mx IN ({','.join('?' * len(chunk))}) ORDER BY {order}", params + tuple(chunk)).fetchall()
+    return rows
+
+def load_metric_columns(conn:sqlite3.Connection, bitsize:int, names:tuple[str]=DEFAULT_METRICS, mx_list:list[int]=None):
+    """Cached metrics as (twists, primes) column dicts (only of mx_list if given), see results.score_columns"""
+    metrics_table = f"metrics_2p{bitsize}_m2p32_mx"
+    curves_table = f"curves_2p{bitsize}_m2p32_mx"
+    twist_sql = f"""
+        SELECT mx, generator_power, order_offset, value FROM {metrics_table}
+         WHERE metric = ? AND version = ? AND generator_power != {PRIME_KEY}
+    """
+    prime_sql = f"""
+        SELECT mx, value FROM {metrics_table}
+         WHERE metric = ? AND version = ? AND generator_power = {PRIME_KEY}
+    """
+    keys = prime_mx = None
+    twist_facets, prime_facets = [], []
+    for name in names:
+        m = METRICS[name]
+        rows = np.array(_ordered_rows(conn, twist_sql, (m.name, m.version), 'mx, generator_power, order_offset', mx_list), dtype=np.float64).reshape(-1, 4)
+        # Every metric must have the same keys in the same order as the first
+        if keys is None:
+            keys = rows[:, :3].astype(np.int64)
+        elif not np.array_equal(keys, rows[:, :3].astype(np.int64)):
+            raise ValueError(f"metric {m.name} v{m.version} doesn't cover the same factorisations as {names[0]}, run update_metrics")
+        twist_facets.append(rows[:, 3])
+        rows = np.array(_ordered_rows(conn, prime_sql, (m.name, m.version), 'mx, generator_power, order_offset', mx_list), dtype=np.float64).reshape(-1, 2)
+        if prime_mx is None:
+            prime_mx = rows[:, 0].astype(np.int64)
+        elif not np.array_equal(prime_mx, rows[:, 0].astype(np.int64)):
+            raise ValueError(f"metric {m.name} v{m.version} doesn't cover the same primes as {names[0]}, run update_metrics")
+        prime_facets.append(rows[:, 1])
+
+    curve_sql = f"SELECT mx, generator_power, is_prime FROM {curves_table} WHERE mx > 0"
+    curves = np.array(_ordered_rows(conn, curve_sql, (), 'mx, generator_power', mx_list), dtype=np.int64).reshape(-1, 3)
+    curve_keys = curves[:, 0] * 64 + curves[:, 1]
+    twist_keys = keys[:, 0] * 64 + keys[:, 1]
+    idx = np.minimum(np.searchsorted(curve_keys, twist_keys), max(len(curve_keys) - 1, 0))
+    if len(twist_keys) and (len(curve_keys) == 0 or not np.array_equal(curve_keys[idx], twist_keys)):
+        bad = keys[curve_keys[idx] != twist_keys][:5].tolist() if len(curve_keys) else keys[:5].tolist()
+        raise ValueError(f"metrics for twists missing from {curves_table}, e.g. (mx, generator_power, order_offset) {bad}")
+    twists = {
+        'mx': keys[:, 0],
+        'is_prime': curves[idx, 2],
+        'generator_power': keys[:, 1],
+        'order_offset': keys[:, 2],
+        'facets': np.column_stack(twist_facets),
+    }
+    primes = {'mx': prime_mx, 'facets': np.column_stack(prime_facets)}
+    return twists, primes
@@ -0,0 +1,74 @@
+# Schnorr & ECDSA signatures over Curve256GLV, used to benchmark candidate curves
+#
+# These are reference implementations for measuring relative performance, nonces
+# are derived deterministically from the secret key & message via a tagged hash
+# rather than RFC6979, do not use them to protect anything of value.
+
+import random
+import hashlib
+from lib_glv import Curve256GLV, Point
+
+def tagged_hash(tag:str, *parts:bytes) -> bytes:
+    tag_digest = hashlib.sha256(tag.encode()).digest()
+    return hashlib.sha256(tag_digest + tag_digest + b''.join(parts)).digest()
+
+def int_to_bytes(curve:Curve256GLV, x:int) -> bytes:
+    return int(x).to_bytes((curve.p.bit_length() + 7) // 8, 'big')
+
+def hash_to_scalar(curve:Curve256GLV, tag:str, *parts:bytes) -> int:
+    return int.from_bytes(tagged_hash(tag, *parts), 'big') % curve.n
+
+def pubkey(curve:Curve256GLV, d:int) -> Point:
+    return curve.scalar_mul_glv(curve.G, d)
+
+def keygen(curve:Curve256GLV, rng:random.Random=random) -> tuple[int,Point]:
+    d = rng.randint(1, curve.n - 1)
+    return d, pubkey(curve, d)
+
+def schnorr_challenge(curve:Curve256GLV, R:Point, P:Point, msg:bytes) -> int:
+    return hash_to_scalar(curve, "Schnorr/challenge", int_to_bytes(curve, R.x), int_to_bytes(curve, P.x), msg)
+
+def schnorr_sign(curve:Curve256GLV, d:int, P:Point, msg:bytes) -> tuple[Point,int]:
+    k = hash_to_scalar(curve, "Schnorr/nonce", int_to_bytes(curve, d), msg)
+    R = curve.scalar_mul_glv(curve.G, k)
+    e = schnorr_challenge(curve, R, P, msg)
+    return R, (k + e * d) % curve.n
+
+def schnorr_verify(curve:Curve256GLV, P:Point, msg:bytes, sig:tuple[Point,int]) -> bool:
+    """Check s·G == R + e·P"""
+    R, s = sig
+    e = schnorr_challenge(curve, R, P, msg)
+    return curve.scalar_mul_glv(curve.G, s) == R + curve.scalar_mul_glv(P, e)
+
+def schnorr_batch_verify(curve:Curve256GLV, items:list[tuple[Point,bytes,tuple[Point,int]]], rng:random.Random=random) -> bool:
+    """Check (Σ a_i·s_i)·G == Σ a_i·R_i + (a_i·e_i)·P_i with random weights a_i, a_0 = 1
+
+    Each term is computed with Shamir's trick, so the batch costs one multiplication
+    by G plus one double-scalar multiplication per signature.
+    """
+    s_sum = 0
+    rhs = curve.infinity()
+    for i, (P, msg, (R, s)) in enumerate(items):
+        a = 1 if i == 0 else rng.randint(1, curve.n - 1)
+        e = schnorr_challenge(curve, R, P, msg)
+        s_sum = (s_sum + a * s) % curve.n
+        rhs = rhs + curve.simultaneous_scalar_mul(R, a, P, (a * e) % curve.n)
+    return curve.scalar_mul_glv(curve.G, s_sum) == rhs
+
+def ecdsa_sign(curve:Curve256GLV, d:int, msg:bytes) -> tuple[int,int]:
+    z = hash_to_scalar(curve, "ECDSA/message", msg)
+    k = hash_to_scalar(curve, "ECDSA/nonce", int_to_bytes(curve, d), msg)
+    r = curve.scalar_mul_glv(curve.G, k).x % curve.n
+    s = (pow(k, -1, curve.n) * (z + r * d)) % curve.n
+    assert r != 0 and s != 0
+    return r, s
+
+def ecdsa_verify(curve:Curve256GLV, Q:Point, msg:bytes, sig:tuple[int,int]) -> bool:
+    """Check (z·s⁻¹)·G + (r·s⁻¹)·Q has x-coordinate r"""
+    r, s = sig
+    if not (0 < r < curve.n and 0 < s < curve.n):
+        return False
+    z = hash_to_scalar(curve, "ECDSA/message", msg)
+    s_inv = pow(s, -1, curve.n)
+    X = curve.simultaneous_scalar_mul(curve.G, (z * s_inv) % curve.n, Q, (r * s_inv) % curve.n)
+    return not X.is_infinity and X.x % curve.n == r
@@ -1,15 +1,21 @@
 #!/usr/bin/env python3
 import os
 import sys
+import json
 import math
 import random
 import sqlite3
+import multiprocessing
 import numpy as np
 import matplotlib.pyplot as plt
 from collections import defaultdict
-from sage.all import EllipticCurve, GF, is_prime
+from sage.all import is_prime
 from lib_glv import Curve256GLV, find_generator, test_curve
-from lib_eta import eta, eta_norm, eta_map, factors_load, factors_metrics, factors_metrics_map, minmax, factors_str
+from lib_nt import eisenstein_order, embedding_degree, FactorCache, factor_with_partial
+from lib_eta import eta, eta_norm, eta_map, factors_load, factors_load_bounded, factors_metrics, factors_metrics_map, minmax, factors_str
+from lib_eta import eta_np, eta_norm_np, eta_groupby, factors_metrics_np, METRICS, DEFAULT_METRICS
+from lib_scores import update_scores, top_scores, bottom_scores, score_rank, score_range, score_histogram
+from lib_scores import update_metrics, load_metric_columns, match_prime_facets, bounds_columns
 
 def db_open(bitsize) -> sqlite3.Connection:
     # Database setup
@@ -27,16 +33,21 @@ def get_curves_by_mx(conn:sqlite3.Connection, bitsize, mx) -> sqlite3.Row:
     curves_table = f"curves_2p{bitsize}_m2p32_mx"
     generator_table = f"generator_2p{bitsize}_m2p32_mx"
     glv_table = f"glv_2p{bitsize}_m2p32_mx"
+    curvefactor_table = f"curvefactor_2p{bitsize}_m2p32_mx"
     sql = f"""
         SELECT cu.generator_power, cu.offset_eisenstein_c, cu.offset_eisenstein_d,
                cor.a, cor.b,
                gt.g AS prime_gen,
                glv.lambda_val, glv.lambda_i,
-               glv.beta_val, glv.beta_i
+               glv.beta_val, glv.beta_i,
+               cft.factors_json AS q_minus_1_factors_json,
+               {bounds_columns(conn, bitsize, names=('cofactor',))} AS q_minus_1_cofactor
          FROM {curves_table} cu
          JOIN {cornacchia_table} cor ON cor.mx = cu.mx
          JOIN {generator_table} gt ON gt.mx = cu.mx
          JOIN {glv_table} glv ON glv.mx = cu.mx AND glv.generator_power = cu.generator_power
+         LEFT JOIN {curvefactor_table} cft
+              ON cft.mx = cu.mx AND cft.generator_power = cu.generator_power AND cft.order_offset = -1
         WHERE cu.mx = ?
           AND cu.is_prime = 1
          LIMIT 1
@@ -47,7 +58,7 @@ def twist_factors_by_mx(conn:sqlite3.Connection,bitsize:int,mx):
     curvefactor_table = f"curvefactor_2p{bitsize}_m2p32_mx"
     curves_table = f"curves_2p{bitsize}_m2p32_mx"
     sql = f"""
-        SELECT ct.mx, ct.is_prime, ct.generator_power, cft.order_offset, cft.factors_json
+        SELECT ct.mx, ct.is_prime, ct.generator_power, cft.order_offset, cft.factors_json, {bounds_columns(conn, bitsize)}
         FROM {curvefactor_table} cft
         JOIN {curves_table} ct
              ON ct.mx = cft.mx
@@ -63,7 +74,7 @@ def twist_factors(conn:sqlite3.Connection,bitsize:int):
     curvefactor_table = f"curvefactor_2p{bitsize}_m2p32_mx"
     curves_table = f"curves_2p{bitsize}_m2p32_mx"
     sql = f"""
-        SELECT ct.mx, ct.is_prime, cft.generator_power, cft.order_offset, cft.factors_json
+        SELECT ct.mx, ct.is_prime, cft.generator_power, cft.order_offset, cft.factors_json, {bounds_columns(conn, bitsize)}
         FROM {curvefactor_table} cft
         JOIN {curves_table} ct ON ct.mx = cft.mx
         WHERE cft.generator_power = ct.generator_power
@@ -76,8 +87,8 @@ def twist_factors(conn:sqlite3.Connection,bitsize:int):
 
 def curve_metrics(conn:sqlite3.Connection,bitsize:int):
     results = eta_map(eta_norm({
-        (mx,is_prime,g_i,order_offset): factors_metrics(factors_load(factors_json), bitsize)
-        for mx, is_prime, g_i, order_offset, factors_json in twist_factors(conn,bitsize)
+        (mx,is_prime,g_i,order_offset): factors_metrics(factors_load_bounded(*factors_row), bitsize)
+        for mx, is_prime, g_i, order_offset, *factors_row in twist_factors(conn,bitsize)
     }))
     # Then split the pime and non-prime orders
     new_results = defaultdict(list)
@@ -89,6 +100,31 @@ def curve_metrics(conn:sqlite3.Connection,bitsize:int):
         new_results[mx] += v if is_prime else [min(v)]
     return eta_map(new_results)
 
+def twist_columns(conn:sqlite3.Connection, bitsize:int, metrics:tuple[str]=DEFAULT_METRICS) -> dict[str,np.ndarray]:
+    """Same rows as twist_factors, as columns with a (rows, facets) array of factors_metrics, uncached"""
+    rows = twist_factors(conn, bitsize)
+    column = lambda i: np.fromiter((_[i] for _ in rows), dtype=np.int64, count=len(rows))
+    return {
+        'mx': column(0),
+        'is_prime': column(1),
+        'generator_power': column(2),
+        'order_offset': column(3),
+        'facets': factors_metrics_np([factors_load_bounded(*_[4:]) for _ in rows], bitsize, metrics),
+    }
+
+def curve_metrics_columns(twists:dict[str,np.ndarray], weights:np.ndarray=None) -> tuple[np.ndarray,np.ndarray]:
+    """Vectorised curve_metrics, returns (mx, score) arrays ordered by mx
+
+    The eta tree is: facets of each twist -> (mx, is_prime) group -> mx.
+    Optional weights scale each normalised facet column.
+    """
+    facets = eta_norm_np(twists['facets'])
+    if weights is not None:
+        facets = facets * weights
+    keys = twists['mx'] * 2 + twists['is_prime']
+    group_keys, group_eta = eta_groupby(keys, eta_np(facets))
+    return eta_groupby(group_keys // 2, group_eta)
+
 def rank_primes(conn: sqlite3.Connection, bitsize: int) -> dict[int, dict[str, float]]:
     trial_div_table = f"trial_division_2p{bitsize}_m2p32_mx"
     curves_table = f"curves_2p{bitsize}_m2p32_mx"
@@ -105,62 +141,163 @@ SELECT td.mx, td.factors_json
     prime_ranks = factors_metrics_map(prime_factors, bitsize)
     return prime_ranks, prime_factors
 
-def show_curve(bitsize, mx, curve:sqlite3.Row, rank, is_interesting):
-    p_a, p_b = int(curve['a']), int(curve['b'])
-    p = p_a**2 + 3 * p_b**2
+def prime_factors_by_mx(conn:sqlite3.Connection, bitsize:int, mx) -> list[tuple[int,int]]:
+    trial_div_table = f"trial_division_2p{bitsize}_m2p32_mx"
+    row = conn.execute(f"SELECT factors_json FROM {trial_div_table} WHERE mx = ?", (mx,)).fetchone()
+    return factors_load(row[0])
+
+def curve_params(curve:sqlite3.Row) -> tuple[int,int,int]:
+    """Returns (p, b, q) for the prime order curve y^2 = x^3 + b over F_p, where |E| = q"""
+    p, q = eisenstein_order(int(curve['a']), int(curve['b']), curve['offset_eisenstein_c'], curve['offset_eisenstein_d'])
+    b = pow(int(curve['prime_gen']), curve['generator_power'], p)
+    return p, b, q
+
+REPORT_VERSION = 2
+
+_factor_cache = None
+
+def factor_cache(bitsize) -> FactorCache:
+    """One shared factorisation cache per process, workers included"""
+    global _factor_cache
+    if _factor_cache is None:
+        _factor_cache = FactorCache(sqlite3.connect(f"data/{bitsize}.sqlite3", timeout=60))
+    return _factor_cache
+
+def analyze_curve(bitsize, mx, curve:dict) -> dict:
+    """The slow part of a curve report, runs in a worker process and returns JSON-able values"""
+    p, b, q = curve_params(curve)
     assert is_prime(p)
-    F_p = GF(p)
-    p_g = F_p(curve['prime_gen'])
-    p_c = p_a + p_b
-    p_d = 2 * p_b
-    q_c = p_c + curve['offset_eisenstein_c']
-    q_d = p_d + curve['offset_eisenstein_d']
-    q = q_c**2 + q_d**2 - (q_c*q_d)
-    g_i = curve['generator_power']
     assert is_prime(q)
-    E = EllipticCurve(F_p, [0, p_g**g_i])
+    g_i = curve['generator_power']
+    G = find_generator(b, p)
+    if curve.get('q_minus_1_factors_json') is not None:
+        q_minus_1_factors = factors_load(curve['q_minus_1_factors_json'])
+        if curve.get('q_minus_1_cofactor') is not None:
+            # Only adequately factored by step 7
+            q_minus_1_factors = factor_with_partial(q - 1, q_minus_1_factors, factor_cache(bitsize).factor)
+    else:
+        q_minus_1_factors = factor_cache(bitsize).factor(q - 1)
+    embedding_k = embedding_degree(p, q, q_minus_1_factors)
+    glv_curve:Curve256GLV
+    glv_curve, scores = test_curve(p, b, q=q, cornacchia=(int(curve['a']), int(curve['b'])))
+    glv = glv_curve.glv
+    # Fixed per mx so cached reports don't change between runs
+    k = random.Random(mx).randint(1, glv_curve.n)
+    k1,k2 = glv_curve.decompose_scalar(k)
+    return {
+        'version': REPORT_VERSION,
+        'mx': mx,
+        'p': hex(p),
+        'a': str(curve['a']),
+        'b': str(curve['b']),
+        'generator_power': g_i,
+        'prime_gen': int(curve['prime_gen']),
+        'curve_b': str(b),
+        'q': hex(q),
+        'G': [hex(G[0]), hex(G[1])],
+        'embedding_degree_log2': round(math.log2(embedding_k),2),
+        'lambda_i': int(glv.lambda_i),
+        'lambda_val': hex(int(glv.lambda_val)),
+        'beta_i': int(glv.beta_i),
+        'beta': hex(int(glv.beta)),
+        'b1': str(glv.b1),
+        'b2': str(glv.b2),
+        'g1': str(glv.g1),
+        'g2': str(glv.g2),
+        'k1_log2': round(math.log2(abs(k1))) if k1 != 0 else 0,
+        'k2_log2': round(math.log2(abs(k2))) if k2 != 0 else 0,
+        'glv_speedup': scores[0],
+        'decomposition_score': scores[1],
+    }
+
+def print_curve(bitsize, report:dict):
+    mx = report['mx']
+    g_i = report['generator_power']
     print(f"p = 2^{bitsize} - 2^32 - {mx} = a^2 + 3b^2 = c^2 + d^2 - cd")
-    print(f"  =", hex(p))
-    #print(f"mx: {mx}")
-    print(f"(a,b):", (int(curve['a']), int(curve['b'])))
-    #print(f"\tp%i for i in 2..12 = ", [(i, p%i) for i in range(2,13)])
-    #print(f"F_p* g:", p_g)
-    print(f"curve: y^2 = x^3 + g^{g_i}   note: g={p_g}, g^{g_i} = {p_g**g_i}")
-    #print(f"\t CM discriminant:", E.cm_discriminant())
-    print(f"|E_p_{g_i}|=q:", hex(q))
-    #print(f"\tgcd(p-1,q-1)", math.gcd(p-1,q-1))
-    #print(f"\tlog2(lcm(p-1,q-1))", math.log2(math.lcm(p-1,q-1)))
-    #print(f"\tq%i for i in 2..12 = ", [(i, q%i) for i in range(2,13)])
-    G = find_generator(p_g**g_i, p, E)
-    print(f" E_p_{g_i} G: ({hex(G[0])},{hex(G[1])})")
-    #print(f"\tGLV endomorphism: lambda * k * G = k * Phi(G) = k * (beta * G.x, G.y)")
-
-    print("embedding degree log2:", round(math.log2(GF(q)(p).multiplicative_order()),2))
-    curve:Curve256GLV
-    curve, scores = test_curve(p, p_g**g_i)
-    #print(f"glv     scores:", scores)
-    glv = curve.glv
-    print(f"glv     lambda: {glv.lambda_i}^((q-1)/3) =", hex(int(glv.lambda_val)))
-    print(f"\t  beta: {glv.beta_i}^((p-1)/3) =", hex(int(glv.beta)))
-    print(f"\t   b_1: {glv.b1}")
-    print(f"\t   b_2: {glv.b2}")
-    print(f"\t   g_1: {glv.g1}")
-    print(f"\t   g_2: {glv.g2}")
-
-    #print(f"\t   decomposition score: {scores}")
-    k = random.randint(1, curve.n)
-    k1,k2 = curve.decompose_scalar(k)
-    #print("k1,k2",k1,k2)
-    k1_log2 = round(math.log2(abs(k1))) if k1 != 0 else 0
-    k2_log2 = round(math.log2(abs(k2))) if k2 != 0 else 0
-    print(f"\t   decomposition: log2(k1)={k1_log2} log2(k2)={k2_log2} score={scores[1]}")
-
-    if is_interesting or rank == 0.0 or rank == 1.0:
-        # Embedding degrees of each curve order to others
-        #for a in []
-        pass
-
-def get_scores(conn, bitsize):
+    print(f"  =", report['p'])
+    print(f"(a,b):", (int(report['a']), int(report['b'])))
+    print(f"curve: y^2 = x^3 + g^{g_i}   note: g={report['prime_gen']}, g^{g_i} = {report['curve_b']}")
+    print(f"|E_p_{g_i}|=q:", report['q'])
+    print(f" E_p_{g_i} G: ({report['G'][0]},{report['G'][1]})")
+    print("embedding degree log2:", report['embedding_degree_log2'])
+    print(f"glv     lambda: {report['lambda_i']}^((q-1)/3) =", report['lambda_val'])
+    print(f"\t  beta: {report['beta_i']}^((p-1)/3) =", report['beta'])
+    print(f"\t   b_1: {report['b1']}")
+    print(f"\t   b_2: {report['b2']}")
+    print(f"\t   g_1: {report['g1']}")
+    print(f"\t   g_2: {report['g2']}")
+    print(f"\t   decomposition: log2(k1)={report['k1_log2']} log2(k2)={report['k2_log2']} score={report['decomposition_score']}")
+
+def show_curve(bitsize, mx, curve:sqlite3.Row, rank, is_interesting):
+    print_curve(bitsize, analyze_curve(bitsize, mx, dict(curve)))
+
+def _analyze_curve_job(job):
+    bitsize, mx, curve = job
+    return mx, analyze_curve(bitsize, mx, curve)
+
+def create_reports_table(conn:sqlite3.Connection, bitsize:int):
+    reports_table = f"reports_2p{bitsize}_m2p32_mx"
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {reports_table} (
+            mx INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL,
+            report_json TEXT NOT NULL
+        )
+    """)
+    conn.commit()
+    return reports_table
+
+def curve_reports(conn:sqlite3.Connection, bitsize:int, mx_list:list[int], workers:int=None) -> dict[int,dict]:
+    """Reports for each mx, missing ones are analysed across a process pool and cached"""
+    reports_table = create_reports_table(conn, bitsize)
+    reports = {}
+    sql = f"SELECT report_json FROM {reports_table} WHERE mx = ? AND version = ?"
+    for mx in set(mx_list):
+        row = conn.execute(sql, (mx, REPORT_VERSION)).fetchone()
+        if row is not None:
+            reports[mx] = json.loads(row[0])
+    jobs = [(bitsize, mx, dict(curve))
+            for mx in sorted(set(mx_list) - reports.keys())
+            for curve in get_curves_by_mx(conn, bitsize, mx)]
+    if jobs:
+        print(f"Analysing {len(jobs)} curves ({len(reports)} cached)")
+        with multiprocessing.Pool(workers) as pool:
+            for mx, report in pool.imap_unordered(_analyze_curve_job, jobs):
+                conn.execute(f"INSERT OR REPLACE INTO {reports_table} (mx, version, report_json) VALUES (?, ?, ?)",
+                             (mx, REPORT_VERSION, json.dumps(report)))
+                conn.commit()
+                reports[mx] = report
+    return reports
+
+def load_score_columns(conn:sqlite3.Connection, bitsize:int, metrics:tuple[str]=DEFAULT_METRICS):
+    """Everything needed by score_columns, load once then re-score with different weights
+
+    Metric values come from the metrics table, only missing ones are computed.
+    """
+    update_metrics(conn, bitsize, metrics)
+    return load_metric_columns(conn, bitsize, metrics)
+
+def score_columns(twists:dict[str,np.ndarray], primes:dict[str,np.ndarray], weights:np.ndarray=None) -> tuple[np.ndarray,np.ndarray]:
+    """Returns (mx, score) arrays, best score first"""
+    mx, curve_scores = curve_metrics_columns(twists, weights)
+    found, idx = match_prime_facets(mx, primes)
+    if not found.all():
+        # No trial_division row for p-1 (step 3 hasn't run for them), they can't be scored
+        print(f"  Not scoring {int((~found).sum())} mx without prime facets, e.g. {mx[~found][:5].tolist()}")
+        mx, curve_scores, idx = mx[found], curve_scores[found], idx[found]
+    prime_facets = primes['facets'][idx]
+    scores = eta_np(np.column_stack([curve_scores, prime_facets]))
+    order = np.argsort(-scores, kind='stable')
+    return mx[order], scores[order]
+
+def get_scores(conn, bitsize, metrics:tuple[str]=DEFAULT_METRICS) -> list[tuple[int,float]]:
+    """Returns [(mx, score), ...] best first, see lib_scores for the stored ranking of the default metrics"""
+    twists, primes = load_score_columns(conn, bitsize, metrics)
+    mx, scores = score_columns(twists, primes)
+    return list(zip(mx.tolist(), scores.tolist()))
+
+def get_scores_legacy(conn, bitsize):
+    """Dict based scoring, kept as a reference for get_scores"""
     prime_scores, prime_factors = rank_primes(conn, bitsize)
     total_scores = []
     for mx,curve_scores in curve_metrics(conn, bitsize).items():
@@ -169,22 +306,32 @@ def get_scores(conn, bitsize):
     total_scores = sorted(total_scores, key=lambda _: _[1], reverse=True)
     return total_scores, prime_factors
 
-def process(bitsize, interest:list[int]):
+def process(bitsize, interest:list[int], metrics:tuple[str]=None, top_n:int=3, workers:int=None):
     conn = db_open(bitsize)
-    total_scores,prime_factors = get_scores(conn, bitsize)
-    tsd = dict(total_scores)
-    interest_mx_ids = set(interest)
-    interest = [(mx,tsd[mx]) for mx in interest]
-    xmin,xmax = minmax([_[1] for _ in total_scores])
-    hist = defaultdict(int)
-    for mx,score in total_scores:
-        hist[int(score*100)] += 1
-    for mx,score in total_scores[:3] + total_scores[-3:] + interest:
+    if metrics is None:
+        # Stored ranking of the default metrics
+        update_scores(conn, bitsize)
+        ranked = top_scores(conn, bitsize, top_n) + bottom_scores(conn, bitsize, 3)
+        rank_of = lambda mx: score_rank(conn, bitsize, mx)
+        xmin,xmax = score_range(conn, bitsize)
+        hist = score_histogram(conn, bitsize)
+    else:
+        total_scores = get_scores(conn, bitsize, metrics)
+        positions = {mx: (i + 1, score) for i, (mx, score) in enumerate(total_scores)}
+        ranked = total_scores[:top_n] + total_scores[-3:]
+        rank_of = positions.get
+        xmin,xmax = minmax([_[1] for _ in total_scores])
+        hist = defaultdict(int)
+        for mx,score in total_scores:
+            hist[int(score*100)] += 1
+    interest = [(mx,rank_of(mx)[1]) for mx in interest]
+    reports = curve_reports(conn, bitsize, [mx for mx, _ in ranked + interest], workers)
+    for mx,score in ranked + interest:
         rank = (score - xmin) / (xmax - xmin) if xmax != xmin else 0.0
-        for curve in get_curves_by_mx(conn, bitsize, mx):
-            show_curve(bitsize, mx, curve, rank, mx in interest_mx_ids)
-        print("factor(p-1) =", factors_str(prime_factors[mx]))
-        for _, is_prime, generator_power, order_offset, factors_json in twist_factors_by_mx(conn,bitsize,mx):
+        if mx in reports:
+            print_curve(bitsize, reports[mx])
+        print("factor(p-1) =", factors_str(prime_factors_by_mx(conn, bitsize, mx)))
+        for _, is_prime, generator_power, order_offset, factors_json, cofactor, lower, upper in twist_factors_by_mx(conn,bitsize,mx):
             offset_str = ''
             if order_offset != 0:
                 if order_offset < 0:
@@ -193,9 +340,10 @@ def process(bitsize, interest:list[int]):
                     offset_str = f' + {order_offset}'
             print(f"twist g^{generator_power}{offset_str} =",
                   factors_str(factors_load(factors_json)),
-                  'prime' if (is_prime and order_offset == 0) else '')
+                  'prime' if (is_prime and order_offset == 0) else '',
+                  f'* composite {hex(int(cofactor))} (largest prime 2^{lower:.1f}..2^{upper:.1f})' if cofactor else '')
         print("score:", score)
-        print("rank:", rank)
+        print("rank:", rank, f"(#{rank_of(mx)[0]} of {sum(hist.values())})")
         print()
     print()
     print(" Score range", xmin, xmax)
@@ -216,25 +364,33 @@ def process(bitsize, interest:list[int]):
     plt.savefig(f"{filename}.svg", dpi=300)
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python results.py <bitsize>")
+    args = [_ for _ in sys.argv[1:] if not _.startswith('--')]
+    options = dict(_[2:].split('=', 1) for _ in sys.argv[1:] if _.startswith('--') and '=' in _)
+    metrics = tuple(options['metrics'].split(',')) if 'metrics' in options else None
+    if len(args) < 1 or (metrics is not None and not set(metrics) <= METRICS.keys()):
+        print("Usage: python results.py <bitsize> [mx ...] [--metrics=name,...] [--top=N] [--workers=N]")
         print("Example: python results.py 256")
+        print("Example: python results.py 256 977 --metrics=largest_factor_ratio,second_largest_ratio")
+        print("Example: python results.py 256 --top=100 --workers=8")
+        print("Metrics:", ', '.join(f"{m.name} (v{m.version})" for m in METRICS.values()))
         sys.exit(1)
 
     try:
-        bitsize = int(sys.argv[1])
+        bitsize = int(args[0])
         if not (33 <= bitsize <= 512):
             print("Bitsize must be between 33 and 512")
             sys.exit(1)
+        top_n = int(options.get('top', 3))
+        workers = int(options['workers']) if 'workers' in options else None
     except ValueError:
-        print("Bitsize must be an integer")
+        print("Bitsize, top and workers must be integers")
         sys.exit(1)
 
     interests = []
-    if len(sys.argv) > 2:
-        interests = [int(_) for _ in sys.argv[2:]]
+    if len(args) > 1:
+        interests = [int(_) for _ in args[1:]]
 
-    process(bitsize, interests)
+    process(bitsize, interests, metrics, top_n, workers)
 
 if __name__ == "__main__":
     main()
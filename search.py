@@ -1,104 +1,116 @@
 #!/usr/bin/env python3
 
+# Mines random p = 6q+1 for curves where both prime-order twists are prime
+#
+# Workers sample safe primes with the sieve from lib_nt, each task with its own
+# seeded RNG so a run is reproducible, and compute the six twist orders without Sage.
+# Hits & per-task sampling statistics go in data/{bitlen}.sqlite3, only the hits
+# have their composite twist orders factored, by the worker that found them, and the
+# parent adds those to the factor cache.
+
+import os
 import sys
+import json
+import time
+import random
+import sqlite3
+import itertools
+import multiprocessing
 import gmpy2
-import math
-from sage.all import random_prime, is_prime, GF
-from sage.rings.factorint import factor_trial_division
 from lib_eta import factors_metrics, factors_str
+from lib_nt import FactorCache, sage_factor, sieve_kq1, get_q_range, analyze_k, cornacchia_gmpy2, calculate_curve_orders, multiplicative_generator
 
-gmpy2.get_context().precision = 256
-
-ZETA_gmpy2 = lambda n,x,p: pow(x%p, ((p-1)//n), p)
-MODSQRT_gmpy2 = lambda n, p: pow(n%p, (p + 1) // 4, p)
-
-def cornacchia_gmpy2(d, p):
-    """Standard Cornacchia algorithm for x^2 + d*y^2 = p"""
-    assert p % 12 == 7
-    p = gmpy2.mpz(p)
-    if d <= 0 or d >= p:
-        raise ValueError("invalid input")
-    if ZETA_gmpy2(2, -d, p) != 1:
-        raise ValueError("no solution")
-    x0 = MODSQRT_gmpy2(-d, p)
-    # Choose the larger square root
-    if x0 < p // 2:
-        x0 = p - x0
-    # Extended Euclidean algorithm
-    a, b = p, x0
-    limit = math.isqrt(p) # Python 3.8+
-    while b > limit:
-        a, b = b, a % b
-        assert a > 0 and b > 0 # guaranteed positive integers
-    remainder = p - b * b
-    assert remainder % d == 0  # guaranteed congruence
-    c = remainder // d
-    t = math.isqrt(c) # Python 3.8+
-    assert t * t == c  # guaranteed exact squares
-    return b, t
+def create_search_tables(conn:sqlite3.Connection, bitlen:int):
+    hits_table = f"minedcurves_2p{bitlen}"
+    stats_table = f"minestats_2p{bitlen}"
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {hits_table} (
+            p TEXT PRIMARY KEY,
+            a TEXT NOT NULL,
+            b TEXT NOT NULL,
+            g INTEGER NOT NULL,
+            orders_json TEXT NOT NULL,
+            metrics_json TEXT,
+            seed INTEGER NOT NULL
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {stats_table} (
+            seed INTEGER PRIMARY KEY,
+            pid INTEGER NOT NULL,
+            tests INTEGER NOT NULL,
+            safe_primes INTEGER NOT NULL,
+            hits INTEGER NOT NULL,
+            seconds REAL NOT NULL
+        )
+    """)
+    conn.commit()
+    return hits_table, stats_table
 
-def make_terms_cd(c,d):
-    return [(x_0*c) + (x_1*d) for x_0, x_1 in [
-        (-2,1), (-1,-1), (1,-2), (2,-1), (1,1), (-1,2)
-    ]]
+def mine(task:tuple[int,int,int]):
+    """Sample `count` safe primes p = 6q+1 of bitlen bits from an RNG seeded with seed, returns (stats, hits)
 
-def make_norms_cd(c,d,p):
-    return [p + 1 + _ for _ in make_terms_cd(c,d)]
-
-ALL_SUB_PATTERNS = [
-    (0, 1, 2, 3, 4, 5),
-    (0, 5, 4, 3, 2, 1),
-    (3, 4, 5, 0, 1, 2),
-    (3, 2, 1, 0, 5, 4),
-]
+    Each hit is (row, twist factorisations), the row as it goes in the hits table.
+    """
+    bitlen, seed, count = task
+    start = time.perf_counter()
+    rng = random.Random(seed)
+    q_min, q_max = get_q_range(6, 2**(bitlen - 1), 2**bitlen - 1)
+    hits = []
+    tests = n_safe = 0
+    for n_safe, (p, q, tests) in enumerate(sieve_kq1(6, 12, analyze_k(6, 12, 7), q_min, q_max, rng), start=1):
+        a, b = cornacchia_gmpy2(3, p)
+        g = multiplicative_generator(p, [2, 3, q])
+        orders = [int(_) for _ in calculate_curve_orders(p, g, a, b)]
+        if gmpy2.is_prime(orders[1]) and gmpy2.is_prime(orders[5]):
+            twists_factors, metrics = hit_metrics(bitlen, orders)
+            hits.append(((str(p), str(a), str(b), g, json.dumps([str(_) for _ in orders]), json.dumps(metrics), seed),
+                         twists_factors))
+        if n_safe >= count:
+            break
+    # The sieve ends early if the range holds fewer than count
+    stats = (seed, os.getpid(), tests, n_safe, len(hits), time.perf_counter() - start)
+    return stats, hits
 
-def calculate_curve_orders(p, g, a, b):
-    assert p % 12 == 7
-    g = gmpy2.mpz(g)
-    p = gmpy2.mpz(p)
-    a = gmpy2.mpz(a)
-    b = gmpy2.mpz(b)
-    assert a%2 == 0 and b%2 == 1
-    c, d = a + b, 2 * b
-    assert c**2 - c*d + d**2 == p
-    assert p + 1 + a - (3*b) == p + 1 + c - (2*d)
-    u0 = int(((c+d) % 3) == 2)
-    u1 = int(gmpy2.mod(gmpy2.fma(ZETA_gmpy2(3,g,p), c, d), p) == 0)
-    idx = (u0 * 2) + u1
-    result = [0] * 6
-    norms_cd = make_norms_cd(c,d,p)
-    for i,j in enumerate(ALL_SUB_PATTERNS[idx]):
-        result[i] = norms_cd[j]
-    return result
+def hit_metrics(bitlen:int, orders:list[int]):
+    """Factors the twist orders of a hit, skipping prime ones, returns (factorisations, largest_factor_ratio of each)"""
+    twists_factors = [[(n, 1)] if gmpy2.is_prime(n) else sage_factor(n) for n in orders]
+    return twists_factors, [factors_metrics(factors, bitlen)[0] for factors in twists_factors]
 
-def main(bitlen):
+def main(bitlen, workers=None, tasks=None, count=64):
     bitlen = int(bitlen)
-    i,j = 0, 0
-    avg_i = set()
-    max_fs = 0
-    while True:
-        i += 1
-        p = random_prime(2**bitlen)
-        if (p-1) % 6 != 0:
-            continue
-        pd6 = p//6
-        if not is_prime(pd6):
-            continue
-        avg_i.add(i)
-        j += 1
-        i = 0
-        a,b = cornacchia_gmpy2(3, p)
-        Fp = GF(p)
-        g = int(Fp.multiplicative_generator())
-        orders = [int(_) for _ in calculate_curve_orders(p, g, a, b)]
-        if is_prime(orders[1]) and is_prime(orders[5]):
-            twists_factors = []
-            print((i,j), p, 0 if len(avg_i) == 0 else sum(avg_i) / len(avg_i))
-            for i,(ip,n) in enumerate([(is_prime(int(_)),_) for _ in orders]):
-                factors = [(int(prime),int(power)) for prime,power in factor(n)]
-                twists_factors.append(factors_metrics(factors)[0])
-                factors_metrics(factors)
-                print("\t", ip, n, factors_str)
+    workers = int(workers) if workers else None
+    tasks = int(tasks) if tasks else None
+    os.makedirs("data", exist_ok=True)
+    conn = sqlite3.connect(f"data/{bitlen}.sqlite3")
+    hits_table, stats_table = create_search_tables(conn, bitlen)
+    cache = FactorCache(conn)
+    # Tasks finish out of order, so an interrupted run can leave gaps below the last seed.
+    # Carry on with the seeds that aren't done, lowest first, so none is skipped or repeated
+    done = {seed for (seed,) in conn.execute(f"SELECT seed FROM {stats_table}")}
+    seeds = itertools.filterfalse(done.__contains__, itertools.count())
+    if tasks:
+        seeds = itertools.islice(seeds, tasks)
+    total_safe = total_hits = 0
+    with multiprocessing.Pool(workers) as pool:
+        for stats, hits in pool.imap_unordered(mine, ((bitlen, seed, count) for seed in seeds)):
+            conn.execute(f"INSERT OR IGNORE INTO {stats_table} (seed, pid, tests, safe_primes, hits, seconds) VALUES (?, ?, ?, ?, ?, ?)", stats)
+            total_safe += stats[3]
+            for hit, twists_factors in hits:
+                conn.execute(f"INSERT OR IGNORE INTO {hits_table} (p, a, b, g, orders_json, metrics_json, seed) VALUES (?, ?, ?, ?, ?, ?, ?)", hit)
+                orders = [int(_) for _ in json.loads(hit[4])]
+                for n, factors in zip(orders, twists_factors):
+                    cache.put(n, factors, commit=False)
+                total_hits += 1
+                print(f"seed {hit[6]}: p = {hit[0]} ({total_hits} hits in {total_safe} safe primes)")
+                for n, factors in zip(orders, twists_factors):
+                    print("\t", bool(gmpy2.is_prime(n)), n, factors_str(factors))
+            conn.commit()
+    conn.close()
 
 if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python search.py <bitlen> [workers] [tasks]")
+        print("Example: python search.py 256 8 1000")
+        sys.exit(1)
     sys.exit(main(*sys.argv[1:]))
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Walks the Eisenstein lattice for p = c^2 - cd + d^2 = 2^L - 2^32 - mx, mx in [1, 2^31)
+
+Rather than finding primes then decomposing them with Cornacchia (steps 1 → 5), each
+(c, d) in the Cornacchia slice (d = 2b, c = a + b, a even, b odd) whose norm falls in
+the window is enumerated directly. The norms of the centre and its six neighbours (the
+twist orders) are sieved by small primes together, only those where the centre and at
+least one neighbour survive are tested for primality.
+
+The window is a thin annulus, every d up to ~2^(L/2) has to be visited while steps 1 → 5
+always enumerate 2^31 values of mx. So this only wins for small L, norms are computed
+in int64 which limits it to L <= 62, at 256 bits walking the lattice is infeasible.
+
+The walk records the next d to search in latticestate_2p{L}_m2p32_mx with each batch, a
+restarted run carries on from there.
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import gmpy2
+import numpy as np
+from lib_nt import primes_below
+
+NEIGHBOURS = [(0,1), (1,1), (1,0), (-1,0), (-1,-1), (0,-1)]
+
+SIEVE_BOUND = 2**10
+
+def create_lattice_table(conn:sqlite3.Connection, bitsize:int):
+    table_name = f"lattice_2p{bitsize}_m2p32_mx"
+    # Where to resume the walk, d_next is the first d not yet searched
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS latticestate_2p{bitsize}_m2p32_mx (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            mx INTEGER PRIMARY KEY,
+            a INTEGER NOT NULL,
+            b INTEGER NOT NULL,
+            prime_neighbours_json TEXT NOT NULL
+        )
+    """)
+    conn.commit()
+    return table_name
+
+def norm(c:np.ndarray, d:np.ndarray) -> np.ndarray:
+    return c*c - c*d + d*d
+
+def window_ranges(d:np.ndarray, n_lo:int, n_hi:int) -> tuple[np.ndarray,np.ndarray,np.ndarray]:
+    """(d, c_lo, count) covering every c where n_lo <= norm(c, d) <= n_hi and a = c - d/2 >= 0"""
+    # c = (d + sqrt(4N - 3d^2)) / 2 is the root with a = c - d/2 >= 0
+    disc_lo = np.maximum(4.0 * n_lo - 3.0 * d.astype(np.float64)**2, 0)
+    disc_hi = 4.0 * n_hi - 3.0 * d.astype(np.float64)**2
+    keep = disc_hi >= 0
+    d, disc_lo, disc_hi = d[keep], disc_lo[keep], disc_hi[keep]
+    # Widened by one either side, float rounding is corrected by the exact norm check
+    c_lo = np.floor((d + np.sqrt(disc_lo)) / 2).astype(np.int64) - 1
+    c_hi = np.ceil((d + np.sqrt(disc_hi)) / 2).astype(np.int64) + 1
+    return d, c_lo, np.maximum(c_hi - c_lo + 1, 0)
+
+def window_candidates(d:np.ndarray, c_lo:np.ndarray, counts:np.ndarray, n_lo:int, n_hi:int) -> tuple[np.ndarray,np.ndarray]:
+    """Every (c, d) in the ranges from window_ranges with a norm in the window and p = 7 (mod 12)"""
+    d = np.repeat(d, counts)
+    c = np.repeat(c_lo, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+    n = norm(c, d)
+    # c odd & c > d/2 so a = c - d/2 is even and positive
+    keep = (n >= n_lo) & (n <= n_hi) & (c % 2 == 1) & (2 * c > d) & (n % 12 == 7)
+    return c[keep], d[keep]
+
+def window_d_max(n_hi:int) -> int:
+    return int(np.sqrt(4 * n_hi / 3)) + 2
+
+def window_batches(n_lo:int, n_hi:int, batch_size:int, d_first:int=2):
+    """Yields (d_next, c, d) from about batch_size lattice points, walking d = 2 (mod 4) upwards from d_first
+
+    Batches hold every c of the d they cover, d_next is the d to resume from once a batch
+    is stored (None if the batch is empty).
+    """
+    d_max = window_d_max(n_hi)
+    d_step = 4 * 2**16
+    for d_start in range(d_first, d_max, d_step):
+        d_next = min(d_start + d_step, d_max)
+        d, c_lo, counts = window_ranges(np.arange(d_start, d_next, 4, dtype=np.int64), n_lo, n_hi)
+        # Split so each batch expands to about batch_size points
+        splits = np.searchsorted(np.cumsum(counts), np.arange(batch_size, counts.sum(), batch_size))
+        batches = list(zip(np.split(d, splits), np.split(c_lo, splits), np.split(counts, splits)))
+        for i, (d_i, c_lo_i, counts_i) in enumerate(batches):
+            # The last batch also covers the d past the window at the end of the chunk
+            resume = d_next if i == len(batches) - 1 else (int(d_i[-1]) + 4 if len(d_i) else None)
+            yield resume, *window_candidates(d_i, c_lo_i, counts_i, n_lo, n_hi)
+
+def sieve_candidates(c:np.ndarray, d:np.ndarray, primes:list[int]) -> np.ndarray:
+    """Indices of (c, d) where the centre and at least one neighbour have no factor in primes"""
+    alive = np.arange(len(c))
+    # The centre first (p = 7 mod 12 already), fewer survivors to sieve the six neighbours of
+    for s in primes[2:]:
+        alive = alive[norm(c[alive] % s, d[alive] % s) % s != 0]
+    c, d = c[alive], d[alive]
+    neighbours = np.ones((len(NEIGHBOURS), len(c)), dtype=bool)
+    for s in primes:
+        cm, dm = c % s, d % s
+        for i, (dc, dd) in enumerate(NEIGHBOURS):
+            neighbours[i] &= norm(cm + dc, dm + dd) % s != 0
+    return alive[neighbours.any(axis=0)]
+
+def search_lattice(bitsize:int, batch_size:int=2**20):
+    if not (33 <= bitsize <= 62):
+        print("Bitsize must be between 33 and 62, norms are computed in int64")
+        return 2
+    db_path = f"data/{bitsize}.sqlite3"
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    table_name = create_lattice_table(conn, bitsize)
+    state_table = f"latticestate_2p{bitsize}_m2p32_mx"
+
+    base = 2**bitsize - 2**32
+    n_lo, n_hi = base - (2**31 - 1), base - 1
+    primes = primes_below(SIEVE_BOUND)
+    d_max = window_d_max(n_hi)
+    row = conn.execute(f"SELECT value FROM {state_table} WHERE name = 'd_next'").fetchone()
+    d_first = row[0] if row is not None else 2
+    if d_first >= d_max:
+        print(f"Work already complete for {bitsize}-bit range")
+        conn.close()
+        return 0
+    if d_first > 2:
+        print(f"Resuming from d = {d_first} of {d_max}")
+    candidates = survivors = hits = 0
+    time_start = time.perf_counter()
+    for d_next, c, d in window_batches(n_lo, n_hi, batch_size, d_first):
+        candidates += len(c)
+        keep = sieve_candidates(c, d, primes)
+        survivors += len(keep)
+        batch = []
+        for c_i, d_i in zip(c[keep].tolist(), d[keep].tolist()):
+            p = c_i*c_i - c_i*d_i + d_i*d_i
+            if not gmpy2.is_prime(p):
+                continue
+            prime_neighbours = [i for i, (dc, dd) in enumerate(NEIGHBOURS)
+                                if gmpy2.is_prime(norm(c_i + dc, d_i + dd))]
+            if prime_neighbours:
+                b = d_i // 2
+                batch.append((base - p, c_i - b, b, json.dumps(prime_neighbours)))
+        if batch:
+            conn.executemany(f"INSERT OR IGNORE INTO {table_name} (mx, a, b, prime_neighbours_json) VALUES (?, ?, ?, ?)", batch)
+            hits += len(batch)
+        if d_next is not None:
+            # Same transaction as the batch's rows, a restart never skips or repeats a d
+            conn.execute(f"INSERT OR REPLACE INTO {state_table} (name, value) VALUES ('d_next', ?)", (d_next,))
+            elapsed = time.perf_counter() - time_start
+            print(f"d = {d_next} / {d_max} ({100 * d_next / d_max:.1f}%), {candidates} points, {survivors} survived, {hits} hits, {elapsed:.1f}s")
+        conn.commit()
+    time_end = time.perf_counter()
+    print(f"{candidates} lattice points in the window, {survivors} survived the sieve, {hits} primes with a prime neighbour")
+    print(f"  {time_end - time_start:.1f}s")
+    conn.close()
+    return 0
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python search_lattice.py <bitsize>")
+        print("Example: python search_lattice.py 48")
+        sys.exit(1)
+    sys.exit(search_lattice(int(sys.argv[1])))
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,12 @@
 import os
 import sys
 import time
+import itertools
 import sqlite3
 from sage.all import next_prime
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib_manifest import manifest_update
+from lib_bitmap import create_bitmap
 
 def create_database_and_table(db_path, bitsize):
     """Create database and table if they don't exist"""
@@ -26,17 +30,63 @@ def get_resume_point(conn, table_name):
     result = cursor.fetchone()[0]
     return (result - 1) if result is not None else 2**31
 
+def walk_primes(base, current_mx, min_mx=1):
+    """Yields (mx, p) for each prime p = base - mx ≡ 7 (mod 12), upwards from p = base - current_mx"""
+    current_prime = base - current_mx
+    while True:
+        # Find next prime (searching upwards)
+        p = next_prime(current_prime)
+
+        # Calculate mx for this prime
+        prime_mx = int(base - p)
+
+        # If mx has gone below our minimum, we're done
+        if prime_mx < min_mx:
+            return
+
+        # Check if p ≡ 7 (mod 12)
+        if p % 12 == 7:
+            yield prime_mx, p
+
+        # next_prime(p) is the prime after p, skipping ahead any further can miss one
+        current_prime = p
+
+def missing_primes(conn, table_name, base, count=1000):
+    """mx of the first `count` primes from the start of the walk that the table is missing
+
+    Before the walk carried on from p itself it skipped ahead to p + 12, losing any
+    prime in between. Databases written then have gaps behind the resume point which
+    resuming never fills, they need to be generated again.
+    """
+    done_mx = conn.execute(f"SELECT MIN(mx) FROM {table_name}").fetchone()[0]
+    if done_mx is None:
+        return []
+    walked = list(itertools.islice(walk_primes(base, 2**31, done_mx), count))
+    stored = {mx for (mx,) in conn.execute(f"SELECT mx FROM {table_name} WHERE mx >= ?", (walked[-1][0] if walked else done_mx,))}
+    return [mx for mx, _ in walked if mx not in stored]
+
 def find_primes_mod_7_12(bitsize):
     """Main function to find primes p ≡ 7 (mod 12) in the specified range"""
 
     # Database setup
     db_path = f"data/{bitsize}.sqlite3"
     conn, table_name = create_database_and_table(db_path, bitsize)
+    bitmap = create_bitmap(conn, bitsize)
 
     # Resume point - start from the largest mx (smallest prime)
     current_mx = get_resume_point(conn, table_name)
     min_mx = 1  # We stop when mx reaches 1
 
+    # Starting prime: 2^bitsize - 2^32 - current_mx
+    base = 2**bitsize - 2**32
+
+    missing = missing_primes(conn, table_name, base)
+    if missing:
+        print(f"{db_path} is missing primes, e.g. mx = {missing[0]}, it was made by the old walk which skipped some")
+        print(f"Remove it and run the steps again")
+        conn.close()
+        sys.exit(1)
+
     if current_mx < min_mx:
         print(f"Work already complete for {bitsize}-bit range")
         conn.close()
@@ -44,47 +94,34 @@ def find_primes_mod_7_12(bitsize):
 
     print(f"Starting from mx = {current_mx}, searching for {bitsize}-bit primes p ≡ 7 (mod 12)")
 
-    # Starting prime: 2^bitsize - 2^32 - current_mx
-    base = 2**bitsize - 2**32
-    current_prime = base - current_mx
-
     batch = []
     batch_size = 100 if bitsize > 64 else 100000
 
     time_start = time.perf_counter()
-    while current_mx >= min_mx:
-        # Find next prime (searching upwards)
-        p = next_prime(current_prime)
-
-        # Calculate mx for this prime
-        prime_mx = int(base - p)
-
-        # If mx has gone below our minimum, we're done
-        if prime_mx < min_mx:
-            break
-
-        # Check if p ≡ 7 (mod 12)
-        if p % 12 == 7:
-            batch.append((prime_mx,))
-
-            if len(batch) >= batch_size:
-                # Batch insert
-                time_db = time.perf_counter()
-                conn.executemany(f"INSERT OR IGNORE INTO {table_name} (mx) VALUES (?)", batch)
-                conn.commit()
-                time_end = time.perf_counter()
-                print(f"Inserted batch ending at mx = {prime_mx}, prime = {p} took {time_end-time_start}s ({(time_end-time_start)/len(batch)} each), db took {time_end-time_db}")
-                time_start = time_end
-                print(f"")
-                batch = []
-
-        # Skip ahead by 12 to next candidate that could be ≡ 7 (mod 12)
-        current_prime = p + 12
-        current_mx = base - current_prime
+    for prime_mx, p in walk_primes(base, current_mx, min_mx):
+        batch.append((prime_mx,))
+
+        if len(batch) >= batch_size:
+            # Batch insert
+            time_db = time.perf_counter()
+            # Bitmap first, after a crash it may be ahead of the table but never behind
+            bitmap.add([mx for (mx,) in batch])
+            bitmap.flush()
+            conn.executemany(f"INSERT OR IGNORE INTO {table_name} (mx) VALUES (?)", batch)
+            manifest_update(conn, table_name, [row[0] for row in batch])
+            conn.commit()
+            time_end = time.perf_counter()
+            print(f"Inserted batch ending at mx = {prime_mx}, prime = {p} took {time_end-time_start}s ({(time_end-time_start)/len(batch)} each), db took {time_end-time_db}")
+            time_start = time_end
+            print(f"")
+            batch = []
 
     # Insert remaining batch
     if batch:
+        bitmap.add([mx for (mx,) in batch])
+        bitmap.flush()
         conn.executemany(f"INSERT OR IGNORE INTO {table_name} (mx) VALUES (?)", batch)
+        manifest_update(conn, table_name, [row[0] for row in batch])
         conn.commit()
         print(f"Final batch inserted, {len(batch)} primes")
 
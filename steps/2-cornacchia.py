@@ -2,38 +2,10 @@
 import sys
 import sqlite3
 import os
-from math import isqrt
-import gmpy2
-
-gmpy2.get_context().precision = 256
-
-ZETA_gmpy2 = lambda n,x,p: pow(x%p, ((p-1)//n), p)
-MODSQRT_gmpy2 = lambda n, p: pow(n%p, (p + 1) // 4, p)
-
-def cornacchia_gmpy2(d, p):
-    """Standard Cornacchia algorithm for x^2 + d*y^2 = p"""
-    assert p % 12 == 7
-    p = gmpy2.mpz(p)
-    if d <= 0 or d >= p:
-        raise ValueError("invalid input")
-    if ZETA_gmpy2(2, -d, p) != 1:
-        raise ValueError("no solution")
-    x0 = MODSQRT_gmpy2(-d, p)
-    # Choose the larger square root
-    if x0 < p // 2:
-        x0 = p - x0
-    # Extended Euclidean algorithm
-    a, b = p, x0
-    limit = isqrt(p) # Python 3.8+
-    while b > limit:
-        a, b = b, a % b
-        assert a > 0 and b > 0 # guaranteed positive integers
-    remainder = p - b * b
-    assert remainder % d == 0  # guaranteed congruence
-    c = remainder // d
-    t = isqrt(c) # Python 3.8+
-    assert t * t == c  # guaranteed exact squares
-    return b, t
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib_nt import cornacchia_batch
+from lib_manifest import manifest_update
+from lib_bitmap import open_bitmap, bitmap_pending
 
 def create_cornacchia_table(db_path, bitsize):
     """Create cornacchia table if it doesn't exist"""
@@ -55,6 +27,11 @@ def get_pending_primes(conn, bitsize):
     primes_table = f"primes_2p{bitsize}_m2p32_mx"
     cornacchia_table = f"cornacchia_2p{bitsize}_m2p32_mx"
 
+    bitmap = open_bitmap(bitsize)
+    if bitmap is not None:
+        # Step 1's bitmap, rather than joining against the primes table
+        return bitmap_pending(bitmap, (mx for (mx,) in conn.execute(f"SELECT mx FROM {cornacchia_table}")))
+
     query = f"""
         SELECT p.mx FROM {primes_table} p
         LEFT JOIN {cornacchia_table} c ON p.mx = c.mx
@@ -64,6 +41,10 @@ def get_pending_primes(conn, bitsize):
     cursor = conn.execute(query)
     return [row[0] for row in cursor.fetchall()]
 
+def cornacchia_rows(base, chunk):
+    """(mx, a, b) rows where p = base - mx = a^2 + 3b^2"""
+    return [(mx, str(int(a)), str(int(b))) for mx, (a, b) in zip(chunk, cornacchia_batch([3] * len(chunk), [base - mx for mx in chunk]))]
+
 def process_cornacchia(bitsize):
     """Process Cornacchia algorithm for pending primes"""
 
@@ -90,28 +71,19 @@ def process_cornacchia(bitsize):
     batch_size = 1000 if bitsize > 64 else 200000
     processed = 0
 
-    for mx in pending_mx:
-        # Calculate prime from mx
-        p = base - mx
-
-        # Apply Cornacchia with d=3
-        a, b = cornacchia_gmpy2(3, p)
-
-        batch.append((mx, str(int(a)), str(int(b))))
-        processed += 1
-
-        if len(batch) >= batch_size:
-            # Batch insert
-            conn.executemany(f"INSERT OR IGNORE INTO {cornacchia_table} (mx, a, b) VALUES (?, ?, ?)", batch)
-            conn.commit()
-            print(f"Processed {processed} / {len(pending_mx)} - Latest: mx={mx}, a={a}, b={b}")
-            batch = []
+    for start in range(0, len(pending_mx), batch_size):
+        chunk = pending_mx[start:start + batch_size]
+        # Apply Cornacchia with d=3 to p = base - mx
+        batch = cornacchia_rows(base, chunk)
+        mx, a, b = batch[-1]
+        processed += len(chunk)
 
-    # Insert remaining batch
-    if batch:
+        # Batch insert
         conn.executemany(f"INSERT OR IGNORE INTO {cornacchia_table} (mx, a, b) VALUES (?, ?, ?)", batch)
+        manifest_update(conn, cornacchia_table, [row[0] for row in batch])
         conn.commit()
-        print(f"Final batch processed - {len(batch)} items")
+        print(f"Processed {processed} / {len(pending_mx)} - Latest: mx={mx}, a={a}, b={b}")
+        batch = []
 
     print(f"Cornacchia processing complete: {processed} items processed")
     conn.close()
@@ -6,6 +6,10 @@ import sqlite3
 from math import log2
 from sage.all import is_prime
 from sage.rings.factorint import factor_trial_division
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib_nt import FactorCache
+from lib_manifest import manifest_update
+from lib_bitmap import open_bitmap, bitmap_pending
 
 def create_trial_division_table(conn, bitsize):
     """Create trial division table if it doesn't exist"""
@@ -26,6 +30,11 @@ def get_pending_trial_division(conn, bitsize):
     primes_table = f"primes_2p{bitsize}_m2p32_mx"
     trial_table = f"trial_division_2p{bitsize}_m2p32_mx"
 
+    bitmap = open_bitmap(bitsize)
+    if bitmap is not None:
+        # Step 1's bitmap, rather than joining against the primes table
+        return bitmap_pending(bitmap, (mx for (mx,) in conn.execute(f"SELECT mx FROM {trial_table}")))
+
     query = f"""
         SELECT p.mx FROM {primes_table} p
         LEFT JOIN {trial_table} t ON p.mx = t.mx
@@ -35,9 +44,21 @@ def get_pending_trial_division(conn, bitsize):
     cursor = conn.execute(query)
     return [row[0] for row in cursor.fetchall()]
 
-def analyze_prime_minus_one(p, small_bits=16):
+def cached_trial_division(cache:FactorCache, n, bound):
+    """Same shape as factor_trial_division, from a cached complete factorisation if there is one"""
+    factors = cache.get(n)
+    if factors is None:
+        return factor_trial_division(n, bound)
+    small = [(prime, power) for prime, power in factors if prime < bound]
+    remaining = n
+    for prime, power in small:
+        remaining //= prime ** power
+    return small + ([(remaining, 1)] if remaining > 1 else [])
+
+def analyze_prime_minus_one(p, small_bits=16, cache:FactorCache=None):
     p_minus_one = p - 1
-    trial_factors = factor_trial_division(p_minus_one, 2**small_bits)
+    cache = cache or FactorCache()
+    trial_factors = cached_trial_division(cache, p_minus_one, 2**small_bits)
 
     # Convert to list of [prime, power] pairs
     small_factors = []
@@ -60,8 +81,18 @@ def analyze_prime_minus_one(p, small_bits=16):
     else:
         remaining_is_prime = is_prime(remaining)
 
+    # Then the factorisation is complete, share it
+    if remaining_is_prime:
+        complete = [(int(prime), power) for prime, power in small_factors]
+        cache.put(p_minus_one, complete + ([(int(remaining), 1)] if remaining > 1 else []), commit=False)
+
     return small_factors, remaining_is_prime, int(remaining)
 
+def trial_division_row(base, mx, trial_div_size, cache:FactorCache=None):
+    """(mx, factors_json, remaining_is_prime, remaining_log2) for p = base - mx"""
+    small_factors, remaining_is_prime, remaining = analyze_prime_minus_one(base - mx, trial_div_size, cache)
+    return (mx, json.dumps(small_factors), 1 if remaining_is_prime else 0, log2(remaining))
+
 def process_trial_division(bitsize):
     """Process trial division for pending primes"""
 
@@ -73,6 +104,7 @@ def process_trial_division(bitsize):
 
     conn = sqlite3.connect(db_path)
     trial_table = create_trial_division_table(conn, bitsize)
+    cache = FactorCache(conn)
 
     # Get pending mx values
     pending_mx = get_pending_trial_division(conn, bitsize)
@@ -94,18 +126,9 @@ def process_trial_division(bitsize):
     sql = f"INSERT OR IGNORE INTO {trial_table} (mx, factors_json, remaining_is_prime, remaining_log2) VALUES (?, ?, ?, ?)"
 
     for mx in pending_mx:
-        # Calculate prime from mx
-        p = base - mx
-
-        # Analyze p-1
-        small_factors, remaining_is_prime, remaining = analyze_prime_minus_one(p, trial_div_size)
-
-        # Store results
-        factors_json = json.dumps(small_factors)
-        remaining_is_prime_int = 1 if remaining_is_prime else 0
-        remaining_log2 = log2(remaining)
-
-        record = (mx, factors_json, remaining_is_prime_int, remaining_log2)
+        # Analyze p-1 of p = base - mx
+        record = trial_division_row(base, mx, trial_div_size, cache)
+        _, _, remaining_is_prime, remaining_log2 = record
         batch.append(record)
         processed += 1
 
@@ -114,13 +137,15 @@ def process_trial_division(bitsize):
 
         if len(batch) >= batch_size:
             conn.executemany(sql, batch)
+            manifest_update(conn, trial_table, [row[0] for row in batch])
             conn.commit()
-            print(f"Processed {processed} / {len(pending_mx)} - Satisfying condition: {satisfying_condition} - Latest: mx={mx}, remaining={remaining}, prime={remaining_is_prime}")
+            print(f"Processed {processed} / {len(pending_mx)} - Satisfying condition: {satisfying_condition} - Latest: mx={mx}, remaining=2^{remaining_log2:.1f}, prime={remaining_is_prime}")
             batch = []
 
     # Insert remaining batch
     if batch:
         conn.executemany(sql, batch)
+        manifest_update(conn, trial_table, [row[0] for row in batch])
         conn.commit()
         print(f"Final batch processed - {len(batch)} items")
 
@@ -4,6 +4,8 @@ import sqlite3
 import time
 import os
 from sage.all import GF
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib_manifest import manifest_update
 
 def create_table(db_path, bitsize):
     conn = sqlite3.connect(db_path)
@@ -31,6 +33,10 @@ def get_pending_primes(conn, bitsize):
     cursor = conn.execute(query)
     return [row[0] for row in cursor.fetchall()]
 
+def generator_row(base, mx):
+    """(mx, g) where g generates F_p*, p = base - mx"""
+    return (mx, int(GF(base - mx).multiplicative_generator()))
+
 def process_generator(bitsize):
     db_path = f"data/{bitsize}.sqlite3"
     if not os.path.exists(db_path):
@@ -51,13 +57,12 @@ def process_generator(bitsize):
     sql = f"INSERT OR IGNORE INTO {generator_table} (mx, g) VALUES (?, ?)"
     time_start = time.perf_counter()
     for mx in pending_mx:
-        p = base - mx
-        F = GF(p)
-        g = F.multiplicative_generator()
-        batch.append((mx, int(g)))
+        _, g = row = generator_row(base, mx)
+        batch.append(row)
         processed += 1
         if len(batch) >= batch_size:
             conn.executemany(sql, batch)
+            manifest_update(conn, generator_table, [row[0] for row in batch])
             conn.commit()
             time_end = time.perf_counter()
             print(f"Processed {processed} / {len(pending_mx)} - Latest: mx={mx}, g={g}, Time: {time_end-time_start} ({round((time_end-time_start)/len(batch),3)} each)")
@@ -66,6 +71,7 @@ def process_generator(bitsize):
 
     if batch:
         conn.executemany(sql, batch)
+        manifest_update(conn, generator_table, [row[0] for row in batch])
         conn.commit()
         print(f"Final batch processed - {len(batch)} items")
 
@@ -1,75 +1,23 @@
 #!/usr/bin/env python3
 import sys
 import os
-import gmpy2
 import sqlite3
 from sage.all import is_prime
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib_nt import calculate_curve_orders_batch
+from lib_manifest import manifest_update
 
-gmpy2.get_context().precision = 256
-
-ZETA_gmpy2 = lambda n,x,p: pow(x%p, ((p-1)//n), p)
-
-def curve_orders_eisenstein_offsets():
-    return [(-1,0), (-1,-1), (0,-1), (1,0), (1,1), (0,1)]
-
-def curve_orders_eisenstein_coords(c,d):
-    return [(c+i, d+j) for i,j in curve_orders_eisenstein_offsets()]
-
-def make_terms_cd(c,d):
-    return [(x_0*c) + (x_1*d) for x_0, x_1 in [
-        (-2,1), (-1,-1), (1,-2), (2,-1), (1,1), (-1,2)
-    ]]
-
-def make_norms_cd(c,d,p):
-    return [p + 1 + _ for _ in make_terms_cd(c,d)]
-
-ALL_SUB_PATTERNS = [
-    (0, 1, 2, 3, 4, 5),
-    (0, 5, 4, 3, 2, 1),
-    (3, 4, 5, 0, 1, 2),
-    (3, 2, 1, 0, 5, 4),
-]
-
-def calculate_curve_orders(p, g, a, b):
-    assert p % 12 == 7
-    g = gmpy2.mpz(g)
-    p = gmpy2.mpz(p)
-    a = gmpy2.mpz(a)
-    b = gmpy2.mpz(b)
-    assert a%2 == 0 and b%2 == 1
-    c, d = a + b, 2 * b
-    assert c**2 - c*d + d**2 == p
-    assert p + 1 + a - (3*b) == p + 1 + c - (2*d)
-    u0 = int(((c+d) % 3) == 2)
-    u1 = int(gmpy2.mod(gmpy2.fma(ZETA_gmpy2(3,g,p), c, d), p) == 0)
-    idx = (u0 * 2) + u1
-    result = [0] * 6
-    result_eisenstein_offsets = [0] * 7
-    norms_cd = make_norms_cd(c,d,p)
-    orders_eisenstein_offsets = curve_orders_eisenstein_offsets()
-    for i,j in enumerate(ALL_SUB_PATTERNS[idx]):
-        result[i] = norms_cd[j]
-        result_eisenstein_offsets[i] = orders_eisenstein_offsets[j]
-        assert result_eisenstein_offsets[i] == result[i]
-    return result, result_eisenstein_offsets
-
-def generate_curves_from_cornacchia(mx, g, a, b, base):
+def generate_curves_batch(pending:list[tuple[int,int,int,int]], base:int):
+    """Yields (mx, generator_power, is_prime, offset_eisenstein_c, offset_eisenstein_d) for each (mx, a, b, g)"""
     # a, b: Cornacchia results where p = a² + 3b²
     # base: 2^bitsize - 2^32 (for calculating p = base - mx)
-    p = base - mx
-    orders, orders_eisenstein_offsets = calculate_curve_orders(p, g, a, b)
-    curves = []
-    for i in range(6):
-        offset_eisenstein_c, offset_eisenstein_d = orders_eisenstein_offsets[i]
-        q = int(orders[i])
-        curves.append({
-            'mx': mx,
-            'generator_power': i,
-            'is_prime': is_prime(q),
-            'offset_eisenstein_c': offset_eisenstein_c,
-            'offset_eisenstein_d': offset_eisenstein_d
-        })
-    return curves
+    mx_list = [mx for mx, _, _, _ in pending]
+    orders, _, offsets = calculate_curve_orders_batch(
+        [base - mx for mx in mx_list], [g for *_, g in pending],
+        [a for _, a, _, _ in pending], [b for _, _, b, _ in pending])
+    for mx, mx_orders, mx_offsets in zip(mx_list, orders, offsets.tolist()):
+        for i, (q, (offset_eisenstein_c, offset_eisenstein_d)) in enumerate(zip(mx_orders, mx_offsets)):
+            yield mx, i, is_prime(int(q)), offset_eisenstein_c, offset_eisenstein_d
 
 def create_curves_table(db_path, bitsize):
     """Create curves table if it doesn't exist"""
@@ -135,31 +83,20 @@ def process_curves(bitsize):
             VALUES
             (?,  ?,               ?,        ?,                   ?)
             """
-    for mx, a, b, g in pending_curves:
-        for curve in generate_curves_from_cornacchia(mx, g, a, b, base):
-            batch.append((
-                mx,
-                curve['generator_power'],
-                curve['is_prime'],
-                curve['offset_eisenstein_c'],
-                curve['offset_eisenstein_d']
-            ))
+    for start in range(0, len(pending_curves), batch_size // 6):
+        chunk = pending_curves[start:start + batch_size // 6]
+        for curve in generate_curves_batch(chunk, base):
+            batch.append(curve)
             total_curves += 1
-            if curve['is_prime']:
+            if curve[2]:
                 prime_order_curves += 1
-        processed += 1
-        if len(batch) >= batch_size:
-            # Batch insert
-            conn.executemany(sql, batch)
-            conn.commit()
-            print(f"Processed {processed} / {len(pending_curves)} - Total curves: {total_curves}, Prime order: {prime_order_curves}")
-            batch = []
-
-    # Insert remaining batch
-    if batch:
+        processed += len(chunk)
+        # Batch insert
         conn.executemany(sql, batch)
+        manifest_update(conn, curves_table, [row[0] for row in batch])
         conn.commit()
-        print(f"Final batch processed - {len(batch)} items")
+        print(f"Processed {processed} / {len(pending_curves)} - Total curves: {total_curves}, Prime order: {prime_order_curves}")
+        batch = []
 
     print(f"Curve processing complete:")
     print(f"  'nice' primes processed: {processed}")
@@ -1,14 +1,11 @@
 #!/usr/bin/env python3
 import sys
 import os
-import gmpy2
 import sqlite3
 from sage.all import GF, EllipticCurve
-
-gmpy2.get_context().precision = 256
-
-MODSQRT_gmpy2 = lambda n, p: gmpy2.powmod(n, (p + 1)//4, p)
-ZETA_gmpy2 = lambda n,x,p: gmpy2.powmod(x, ((p-1)//n), p)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib_nt import ZETA_gmpy2, find_generator
+from lib_manifest import manifest_update
 
 def check_glv_endomorphism(curve, p, n, generator):
     seen_betas = set()
@@ -68,19 +65,26 @@ def get_pending_curves(conn, bitsize):
              int(row[4]), int(row[5]), int(row[6]))
              for row in cursor.fetchall()]
 
-def find_generator(g,p,E):
-    p = gmpy2.mpz(p)
-    g = gmpy2.mpz(int(g))
-    x = gmpy2.mpz(1)
-    while True:
-        yy = (gmpy2.powmod(x,3,p) + g) % p
-        y = MODSQRT_gmpy2(yy, p)
-        if (y*y) % p == yy:
-            if y & 1:
-                y = p - y
-            if E.point((x,y)).order() == E.order():
-                return x,y
-        x += 1
+def glv_row(mx, a, b, g, g_i, off_c, off_d):
+    """(mx, generator_power, beta_val, lambda_val, beta_i, lambda_i) for the prime order curve y^2 = x^3 + g^g_i"""
+    p = (a**2) + (3*(b**2))
+    Fp = GF(p)
+    E = EllipticCurve(Fp, [0, g**g_i])
+    G = E.point(find_generator(g**g_i, p, E))
+    c = a + b
+    d = 2 * b
+    q_c = c + off_c
+    q_d = d + off_d
+    q = q_c**2 + q_d**2 - (q_c * q_d)
+    beta_i, beta_val, lambda_i, lambda_val = check_glv_endomorphism(E, p, q, G)
+    return (
+        mx,
+        g_i,
+        str(int(beta_val)),
+        str(int(lambda_val)),
+        int(beta_i),
+        int(lambda_i)
+    )
 
 def process_curves(bitsize):
     db_path = f"data/{bitsize}.sqlite3"
@@ -108,37 +112,23 @@ def process_curves(bitsize):
             VALUES
             (?,  ?,               ?,        ?,          ?,      ?)
             """
-    for mx, a, b, g, g_i, off_c, off_d in pending_curves:
-        p = (a**2) + (3*(b**2))
-        Fp = GF(p)
-        E = EllipticCurve(Fp, [0, g**g_i])
-        G = E.point(find_generator(g**g_i, p, E))
-        c = a + b
-        d = 2 * b
-        q_c = c + off_c
-        q_d = d + off_d
-        q = q_c**2 + q_d**2 - (q_c * q_d)
-        beta_i, beta_val, lambda_i, lambda_val = check_glv_endomorphism(E, p, q, G)
-        batch.append((
-            mx,
-            g_i,
-            str(int(beta_val)),
-            str(int(lambda_val)),
-            int(beta_i),
-            int(lambda_i)
-        ))
+    for pending in pending_curves:
+        row = glv_row(*pending)
+        batch.append(row)
         total_curves += 1
-        if beta_i is not None:
+        if row[4] is not None:
             glv_curves += 1
         processed += 1
         if len(batch) >= batch_size:
             conn.executemany(sql, batch)
+            manifest_update(conn, glv_table, [row[0] for row in batch])
             conn.commit()
             print(f"Processed {processed} / {len(pending_curves)} - Total curves: {total_curves}, GLV?: {glv_curves}")
             batch = []
 
     if batch:
         conn.executemany(sql, batch)
+        manifest_update(conn, glv_table, [row[0] for row in batch])
         conn.commit()
         print(f"Final batch processed - {len(batch)} items")
 
@@ -4,17 +4,61 @@ import os
 import json
 import time
 import sqlite3
-from math import log2
-from sage.all import factor
+from math import log2, prod
 import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib_scores import update_scores
+from lib_nt import FactorCache, ECMCheckpoints, primes_below, strip_small_primes, batch_gcd, partial_factorisation, factor_with_partial, adequate_factorisation, sage_factor
+from lib_eta import factors_load
+from lib_manifest import manifest_update
 
 ORDER_OFFSETS = set([-1,0])
 
-def analyze_factors(x):
+# Stripped before the batch GCD, otherwise nearly every number shares them
+SMALL_PRIME_BOUND = 2**16
+
+# With --adequate the factorisation stops once log2 of the largest prime is settled to
+# within this fraction of bitsize, the composite cofactor and bounds are stored instead
+DEFAULT_TOLERANCE = 0.02
+
+# Cofactors at least this large go through checkpointed ECM rather than straight to factor()
+CHECKPOINT_MIN_BITS = 128
+
+class TimeBoxExpired(Exception):
+    pass
+
+# NULL when fully factored
+ADEQUATE_COLUMNS = {
+    'cofactor': 'TEXT',
+    'largest_prime_log2_lower': 'REAL',
+    'largest_prime_log2_upper': 'REAL',
+}
+
+def analyze_factors(x, cache:FactorCache, partial:list[tuple[int,int]]=None, bitsize:int=None, tolerance:float=None, factor_fn=sage_factor,
+                    checkpoints:ECMCheckpoints=None, time_box:float=None):
     time_start = time.perf_counter()
-    factors = factor(x)
+    partial = partial or []
+    cofactor, lower, upper = 1, None, None
+    factors = cache.get(x)
+    if factors is None and tolerance is None:
+        factors = cache.factor(x, lambda n: factor_with_partial(n, partial, factor_fn), commit=False)
+    elif factors is None:
+        # ECM levels are checkpointed & time boxed like factor_fn, which still gets what ECM can't split
+        adequate = adequate_factorisation(x, bitsize, tolerance, partial, SMALL_PRIME_BOUND, factor_fn=factor_fn,
+                                          checkpoints=checkpoints if x.bit_length() >= CHECKPOINT_MIN_BITS else None,
+                                          deadline=time.monotonic() + time_box if time_box else None)
+        if adequate is None:
+            raise TimeBoxExpired(x)
+        factors, cofactor, lower, upper = adequate
+        if cofactor == 1:
+            cache.put(x, factors, commit=False)
+            lower, upper = None, None
     time_end = time.perf_counter()
     #print("  - ", (time_end-time_start), factors)
+    factors_json = [[str(prime), int(power)] for prime, power in factors]
+    if cofactor > 1:
+        # Statistics treat the unsplit cofactor as a prime, see lib_eta.factors_load_bounded
+        factors = sorted(factors + [(cofactor, 1)])
 
     factors_primes = [int(prime) for prime, _ in factors]
     factors_powered = [int(prime**power) for prime, power in factors]
@@ -27,16 +71,17 @@ def analyze_factors(x):
     entropy = -sum((power/total_powers) * log2(power/total_powers)
                    for power in factors_powers if power > 0)
 
-    factors_json = [[str(prime), int(power)] for prime, power in factors]
-
     return {
         'entropy': entropy,
         'n_factors': len(factors),
         'factors_json': json.dumps(factors_json),
+        'cofactor': str(cofactor) if cofactor > 1 else None,
+        'largest_prime_log2_lower': lower,
+        'largest_prime_log2_upper': upper,
 
         # Size metrics
         'largest_prime_powered_log2': max(log2_powered),
-        'largest_prime_log2': max(log2_primes),
+        'largest_prime_log2': max(log2_primes) if factors[-1][0] != cofactor else (lower + upper) / 2,
         'smallest_prime_log2': min(log2_primes),
         'smallest_prime_powered_log2': min(log2_powered),
 
@@ -58,6 +103,19 @@ def analyze_factors(x):
         'second_largest_prime_log2': sorted(log2_primes, reverse=True)[1] if len(factors) >= 2 else 0,
     }
 
+def curvefactor_row(mx, generator_power, order_offset, result):
+    """Values for a curvefactor row in the order of its columns, from analyze_factors"""
+    return [
+        mx, generator_power, order_offset,
+        result['factors_json'], int(result['n_factors']),
+        result['entropy'], result['largest_prime_powered_log2'], result['largest_prime_log2'],
+        result['smallest_prime_log2'], result['smallest_prime_powered_log2'], result['second_largest_prime_log2'],
+        result['avg_prime_powered_log2'], result['avg_prime_log2'], result['median_prime_powered_log2'],
+        result['median_prime_log2'], result['var_prime_powers_log2'], result['var_prime_log2'],
+        result['std_prime_powers_log2'], result['std_prime_log2'], int(result['max_prime_power']), int(result['total_prime_powers']),
+        result['cofactor'], result['largest_prime_log2_lower'], result['largest_prime_log2_upper']
+    ]
+
 def create_curvefactor_table(db_path, bitsize):
     conn = sqlite3.connect(db_path)
     curvefactor_table = f"curvefactor_2p{bitsize}_m2p32_mx"
@@ -98,22 +156,103 @@ def create_curvefactor_table(db_path, bitsize):
             PRIMARY KEY (mx, generator_power, order_offset)
         )
     """)
+    # Tables made by earlier versions of this step lack the adequate factorisation columns
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({curvefactor_table})")}
+    for name, kind in ADEQUATE_COLUMNS.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {curvefactor_table} ADD COLUMN {name} {kind}")
     conn.commit()
     return conn, curvefactor_table
 
-def factor_curve_order(a:int, b:int, offset_eisenstein_c:int, offset_eisenstein_d:int, existing_offsets:set[int]):
+def curve_order(a:int, b:int, offset_eisenstein_c:int, offset_eisenstein_d:int):
     c = a + b
     d = 2 * b
     q_c = c + offset_eisenstein_c
     q_d = d + offset_eisenstein_d
-    q = q_c**2 + q_d**2 - (q_c * q_d)
+    return q_c**2 + q_d**2 - (q_c * q_d)
+
+def factor_curve_order(a:int, b:int, offset_eisenstein_c:int, offset_eisenstein_d:int, existing_offsets:set[int], cache:FactorCache, partials:dict[int,list]=None, bitsize:int=None, tolerance:float=None, factor_fn=sage_factor,
+                      checkpoints:ECMCheckpoints=None, time_box:float=None):
+    q = curve_order(a, b, offset_eisenstein_c, offset_eisenstein_d)
     missing_offsets = ORDER_OFFSETS - existing_offsets
     #print(f"Processing mx={mx}, missing: {missing_offsets}")
     for order_offset in missing_offsets:
         #print("Dorp, curve", g_i, mx, q+order_offset, is_prime(q), existing_offsets, row_count)
-        yield order_offset, analyze_factors(q+order_offset)
+        try:
+            result = analyze_factors(q+order_offset, cache, (partials or {}).get(order_offset), bitsize, tolerance, factor_fn, checkpoints, time_box)
+        except TimeBoxExpired:
+            # Checkpointed, it carries on from there when picked again
+            result = None
+        yield order_offset, result
 
-def find_factoring_work(conn, bitsize, batch_size=6):
+def create_sharedfactor_table(conn, bitsize):
+    table_name = f"sharedfactor_2p{bitsize}_m2p32_mx"
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            mx INTEGER,
+            generator_power INTEGER NOT NULL,
+            order_offset INTEGER NOT NULL,
+            factors_json TEXT NOT NULL,
+            PRIMARY KEY (mx, generator_power, order_offset)
+        )
+    """)
+    conn.commit()
+    return table_name
+
+def batch_gcd_prepass(conn, bitsize, cache:FactorCache):
+    """Find prime factors shared between any two pending curve orders before factoring them one by one
+
+    Small primes are stripped first, then a batch GCD over all the cofactors finds
+    the shared part of each. Those are factored (they're much smaller) and the known
+    factors of every pending number stored, so only the residual goes to factor().
+    """
+    cornacchia_table = f"cornacchia_2p{bitsize}_m2p32_mx"
+    curves_table = f"curves_2p{bitsize}_m2p32_mx"
+    curvefactor_table = f"curvefactor_2p{bitsize}_m2p32_mx"
+    sharedfactor_table = create_sharedfactor_table(conn, bitsize)
+    done = set(conn.execute(f"SELECT mx, generator_power, order_offset FROM {curvefactor_table}").fetchall())
+    done.update(conn.execute(f"SELECT mx, generator_power, order_offset FROM {sharedfactor_table}").fetchall())
+    families_query = f"""
+        SELECT cu.mx, cu.generator_power, cu.offset_eisenstein_c, cu.offset_eisenstein_d, cor.a, cor.b
+        FROM {curves_table} cu
+        JOIN {cornacchia_table} cor ON cor.mx = cu.mx
+        WHERE cu.mx IN (SELECT DISTINCT mx FROM {curves_table} WHERE is_prime = 1)
+    """
+    keys, numbers = [], []
+    for mx, generator_power, offset_c, offset_d, a, b in conn.execute(families_query).fetchall():
+        q = curve_order(int(a), int(b), offset_c, offset_d)
+        for order_offset in sorted(ORDER_OFFSETS):
+            if (mx, generator_power, order_offset) not in done:
+                keys.append((mx, generator_power, order_offset))
+                numbers.append(q + order_offset)
+    if not numbers:
+        return
+
+    small_primes = primes_below(SMALL_PRIME_BOUND)
+    primorial = prod(small_primes)
+    partials, cofactors = [], []
+    for n in numbers:
+        factors, cofactor = strip_small_primes(n, small_primes, primorial)
+        partials.append(factors)
+        cofactors.append(cofactor)
+
+    print(f"Batch GCD over {len(numbers)} pending curve orders")
+    shared_count = 0
+    for i, g in enumerate(batch_gcd(cofactors)):
+        if g > 1 and cofactors[i] > 1:
+            shared = cache.factor(g, lambda n: factor_with_partial(n, []), commit=False)
+            more, _ = partial_factorisation(cofactors[i], [prime for prime, _ in shared])
+            partials[i] += more
+            shared_count += 1
+    conn.executemany(f"INSERT OR IGNORE INTO {sharedfactor_table} (mx, generator_power, order_offset, factors_json) VALUES (?, ?, ?, ?)", [
+        (*key, json.dumps([[str(prime), power] for prime, power in factors]))
+        for key, factors in zip(keys, partials)
+    ])
+    conn.commit()
+    print(f"  With factors shared by another curve order: {shared_count}")
+
+def find_factoring_work(conn, bitsize, cache:FactorCache, batch_size=6, tolerance:float=None, factor_fn=sage_factor,
+                        checkpoints:ECMCheckpoints=None, time_box:float=None):
     cornacchia_table = f"cornacchia_2p{bitsize}_m2p32_mx"
     curves_table = f"curves_2p{bitsize}_m2p32_mx"
     curvefactor_table = f"curvefactor_2p{bitsize}_m2p32_mx"
@@ -150,51 +289,76 @@ def find_factoring_work(conn, bitsize, batch_size=6):
             WHERE mx = ? AND generator_power = ?
         """
         existing_offsets = {row[0] for row in conn.execute(existing_offsets_query, (mx, generator_power)).fetchall()}
-        for order_offset, result in factor_curve_order(a, b, offset_eisenstein_c, offset_eisenstein_d, existing_offsets):
+        partials_query = f"""
+            SELECT order_offset, factors_json
+            FROM sharedfactor_2p{bitsize}_m2p32_mx
+            WHERE mx = ? AND generator_power = ?
+        """
+        partials = {order_offset: factors_load(factors_json) for order_offset, factors_json in conn.execute(partials_query, (mx, generator_power)).fetchall()}
+        for order_offset, result in factor_curve_order(a, b, offset_eisenstein_c, offset_eisenstein_d, existing_offsets, cache, partials, bitsize, tolerance, factor_fn, checkpoints, time_box):
             yield mx, generator_power, order_offset, result
 
-def process_curves(bitsize):
+def checkpointed_factor(checkpoints:ECMCheckpoints, time_box:float=None):
+    """factor_fn for hard cofactors, raises TimeBoxExpired after time_box seconds on one number"""
+    def factor_fn(n:int):
+        if n.bit_length() < CHECKPOINT_MIN_BITS:
+            return sage_factor(n)
+        factors = checkpoints.factor(n, time.monotonic() + time_box if time_box else None)
+        if factors is None:
+            raise TimeBoxExpired(n)
+        return factors
+    return factor_fn
+
+def process_curves(bitsize, tolerance:float=None, time_box:float=None):
     db_path = f"data/{bitsize}.sqlite3"
     if not os.path.exists(db_path):
         print(f"Database {db_path} does not exist. Run previous steps first.")
         return
 
     conn, curvefactor_table = create_curvefactor_table(db_path, bitsize)
+    cache = FactorCache(conn)
+    batch_gcd_prepass(conn, bitsize, cache)
+    checkpoints = ECMCheckpoints(conn)
+    factor_fn = checkpointed_factor(checkpoints, time_box)
     sql = f"""INSERT OR IGNORE INTO {curvefactor_table}
         (mx, generator_power, order_offset, factors_json, n_factors,
          entropy, largest_prime_powered_log2, largest_prime_log2,
          smallest_prime_log2, smallest_prime_powered_log2, second_largest_prime_log2,
          avg_prime_powered_log2, avg_prime_log2, median_prime_powered_log2,
          median_prime_log2, var_prime_powers_log2, var_prime_log2,
-         std_prime_powers_log2, std_prime_log2, max_prime_power, total_prime_powers)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+         std_prime_powers_log2, std_prime_log2, max_prime_power, total_prime_powers,
+         cofactor, largest_prime_log2_lower, largest_prime_log2_upper)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
 
     while True:
         batch = []
+        attempted = 0
+        time_boxed = 0
         batch_size = 1200*3 if bitsize <= 64 else 6
-        for mx, generator_power, order_offset, result in find_factoring_work(conn, bitsize, batch_size):
-            batch.append([
-                mx, generator_power, order_offset,
-                result['factors_json'], int(result['n_factors']),
-                result['entropy'], result['largest_prime_powered_log2'], result['largest_prime_log2'],
-                result['smallest_prime_log2'], result['smallest_prime_powered_log2'], result['second_largest_prime_log2'],
-                result['avg_prime_powered_log2'], result['avg_prime_log2'], result['median_prime_powered_log2'],
-                result['median_prime_log2'], result['var_prime_powers_log2'], result['var_prime_log2'],
-                result['std_prime_powers_log2'], result['std_prime_log2'], int(result['max_prime_power']), int(result['total_prime_powers'])
-            ])
+        for mx, generator_power, order_offset, result in find_factoring_work(conn, bitsize, cache, batch_size, tolerance, factor_fn, checkpoints, time_box):
+            attempted += 1
+            if result is None:
+                time_boxed += 1
+                continue
+            batch.append(curvefactor_row(mx, generator_power, order_offset, result))
         if len(batch) > 0:
             conn.executemany(sql, batch)
+            manifest_update(conn, curvefactor_table, [row[0] for row in batch])
             conn.commit()
-            print(f"Processed {len(batch)}")
+            print(f"Processed {len(batch)}, re-scored {update_scores(conn, bitsize)} families")
             batch = []
-        else:
+        elif attempted == 0:
             break
+        if time_boxed:
+            print(f"  Time boxed {time_boxed}, resuming later")
     conn.close()
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python 7-curvefactor.py <bitsize>")
+        print("Usage: python 7-curvefactor.py <bitsize> [--adequate[=tolerance]] [--time-box=seconds]")
         print("Example: python 7-curvefactor.py 256")
+        print("Example: python 7-curvefactor.py 256 --adequate=0.02")
+        print("Example: python 7-curvefactor.py 256 --time-box=600")
         sys.exit(1)
 
     bitsize = int(sys.argv[1])
@@ -202,7 +366,17 @@ def main():
         print("Bitsize must be between 33 and 512")
         sys.exit(2)
 
-    process_curves(bitsize)
+    tolerance = None
+    time_box = None
+    for arg in sys.argv[2:]:
+        if arg == '--adequate':
+            tolerance = DEFAULT_TOLERANCE
+        elif arg.startswith('--adequate='):
+            tolerance = float(arg.split('=', 1)[1])
+        elif arg.startswith('--time-box='):
+            time_box = float(arg.split('=', 1)[1])
+
+    process_curves(bitsize, tolerance, time_box)
 
 if __name__ == "__main__":
     main()
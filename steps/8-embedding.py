@@ -1,88 +1,151 @@
+#!/usr/bin/env python3
 import os
 import sys
 import json
 import sqlite3
-from sage.all import factor, Zmod, is_prime, prod, gcd, Integer, power_mod
+import multiprocessing
 from math import log2
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib_nt import eisenstein_order, embedding_degree, cm_discriminant, FactorCache, factor_with_partial
+from lib_scores import bounds_columns
+from lib_eta import factors_load, factors_to_int
+from lib_manifest import manifest_update
 
-def db_open(bitsize):
-    db_path = f"data/{bitsize}.sqlite3"
-    if not os.path.exists(db_path):
-        print(f"Database {db_path} does not exist. Run previous steps first.")
-        return
+# Pairings move the DLP into F_{p^k}*, below this embedding degree that is a real threat
+MOV_MIN_DEGREE = 20
+
+EMBEDDING_COLUMNS = {
+    'embedding_degree': 'TEXT',
+    'embedding_degree_log2': 'REAL',
+    'trace': 'TEXT',
+    'frobenius_discriminant': 'TEXT',
+    'frobenius_conductor': 'TEXT',
+    'cm_discriminant': 'INTEGER',
+    'mov_field_log2': 'REAL',
+    'mov_secure': 'INTEGER',
+}
+
+def create_embedding_table(db_path, bitsize):
     conn = sqlite3.connect(db_path)
-    curvefactor_table = f"curvefactor_2p{bitsize}_m2p32_mx"
-    return conn, curvefactor_table
+    table_name = f"embedding_2p{bitsize}_m2p32_mx"
+    columns = ''.join(f"{name} {kind},\n" for name, kind in EMBEDDING_COLUMNS.items())
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            mx INTEGER,
+            generator_power INTEGER NOT NULL,
+            {columns}
+            PRIMARY KEY (mx, generator_power)
+        )
+    """)
+    # Tables made by earlier versions of this step lack some columns
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")}
+    for name, kind in EMBEDDING_COLUMNS.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table_name} ADD COLUMN {name} {kind}")
+    conn.commit()
+    return conn, table_name
 
-def show_factored_curves(bitsize):
-    conn, curvefactor_table = db_open(bitsize)
+def get_pending_curves(conn, bitsize):
+    """Prime order curves without a complete embedding row, with the factorisation of q-1 from step 7 if it has one"""
     cornacchia_table = f"cornacchia_2p{bitsize}_m2p32_mx"
     curves_table = f"curves_2p{bitsize}_m2p32_mx"
-
-    random_mx_sql = f"""
-    SELECT cft.mx, COUNT(cft.order_offset) AS offset_count
-      FROM {curvefactor_table} cft
-      GROUP BY cft.mx
-      HAVING offset_count = 18
-      ORDER BY RANDOM()
-      LIMIT 1
+    curvefactor_table = f"curvefactor_2p{bitsize}_m2p32_mx"
+    embedding_table = f"embedding_2p{bitsize}_m2p32_mx"
+    incomplete = ' OR '.join(f"e.{name} IS NULL" for name in EMBEDDING_COLUMNS)
+    query = f"""
+        SELECT cu.mx, cu.generator_power, cu.offset_eisenstein_c, cu.offset_eisenstein_d,
+               cor.a, cor.b, cft.factors_json, {bounds_columns(conn, bitsize, names=('cofactor',))}
+          FROM {curves_table} cu
+          JOIN {cornacchia_table} cor ON cor.mx = cu.mx
+          LEFT JOIN {curvefactor_table} cft
+               ON cft.mx = cu.mx AND cft.generator_power = cu.generator_power AND cft.order_offset = -1
+          LEFT JOIN {embedding_table} e ON e.mx = cu.mx AND e.generator_power = cu.generator_power
+         WHERE cu.is_prime = 1
+           AND (e.mx IS NULL OR {incomplete})
     """
-    random_mx = conn.execute(random_mx_sql).fetchone()[0]
-    print(random_mx)
+    return conn.execute(query).fetchall()
 
-    sql = f"""
-    SELECT cft.factors_json, ct.generator_power, ct.offset_eisenstein_c, ct.offset_eisenstein_d,
-           cor.a, cor.b, cft.order_offset
-    FROM {curvefactor_table} cft
-    JOIN {curves_table} ct ON ct.mx = cft.mx
-    JOIN {cornacchia_table} cor ON cor.mx = cft.mx
-    WHERE cft.mx = {random_mx}
-      AND cft.generator_power = ct.generator_power
-      AND cft.order_offset = 0
-    GROUP BY cft.mx, ct.generator_power, ct.offset_eisenstein_c, ct.offset_eisenstein_d, cft.order_offset
-    """
-    p = 2**bitsize - 2**32 - random_mx
-    print('p = 2^256 - 2^32 -', random_mx, ' =', factor(p-1))
-    print()
-    for factors_json, g_i, offset_c, offset_d, a, b, order_offset in conn.execute(sql).fetchall():
-        a, b = int(a), int(b)
-        #p = a**2 + 3 * b**2
-        q_c, q_d = a + b + offset_c, (2 * b) + offset_d
-        q = q_c**2 + q_d**2 - (q_c * q_d)
-        factors_json = [(int(prime),int(power)) for prime,power in json.loads(factors_json)]
+def analyze_embedding(row):
+    """Embedding row for one curve, and the factorisation of q-1 if it had to be completed here (None otherwise)"""
+    mx, generator_power, offset_c, offset_d, a, b, factors_json, complete = row
+    p, q = eisenstein_order(int(a), int(b), offset_c, offset_d)
+    factored = None
+    if not complete:
+        # Factored in the worker, the parent only stores it in the shared cache
+        partial = factors_load(factors_json) if factors_json is not None else []
+        factors = factored = factor_with_partial(q - 1, partial)
+    else:
+        factors = factors_load(factors_json)
+    assert factors_to_int(factors) == q - 1
+    k = embedding_degree(p, q, factors)
+    t, disc, v = cm_discriminant(p, q)
+    return (mx, generator_power, str(k), log2(k), str(t), str(disc), str(v), -3,
+            k * log2(p), int(k > MOV_MIN_DEGREE)), q - 1, factored
+
+def process_embedding(bitsize, workers=None):
+    db_path = f"data/{bitsize}.sqlite3"
+    if not os.path.exists(db_path):
+        print(f"Database {db_path} does not exist. Run previous steps first.")
+        return
 
-        print('q', q, '+', order_offset)
-        print(f'y^2 = x^3 + g^{g_i}')
-        print('\tis_prime(q) ?', is_prime(q))
-        #print("\tp - q =", p-q)
-        #print("\tp % q =", p % q)
-        #print('\tfactor(p%q) =', factor(p%q))
-        #print("\tq % p =", q % p)
-        #print('\tfactor(q%p) =', factor(q%p))
+    conn, embedding_table = create_embedding_table(db_path, bitsize)
+    pending = get_pending_curves(conn, bitsize)
+    if not pending:
+        print(f"No pending embedding degrees for {bitsize}-bit range")
+        conn.close()
+        return
 
-        #print("\tp > q ?", p > q)
-        print("\tfactor(q) =", ' * '.join([''.join([str(prime), f'^{power}' if power != 1 else '']) for prime, power in factors_json]))
-        if order_offset == 0:
-            #ed_pq = Zmod(p)(q).multiplicative_order()
-            #print("\tq^k mod p = 1", '| log2(k) =', log2(ed_pq), '|', factor(ed_pq))
-            ed_qp = Zmod(q)(p).multiplicative_order()
-            print("\tp^k mod q = 1", '| log2(k) =', round(log2(ed_qp),2))
-            print("\t        k =", factor(ed_qp))
-        #print("\tfactor(p-q) =", factor(p - q))
-        print()
+    print(f"Processing {len(pending)} pending embedding degrees")
+    # Anything step 7 hasn't completely factored is looked up in the shared cache, or factored by the workers
+    cache = FactorCache(conn)
+    for i, (mx, generator_power, offset_c, offset_d, a, b, factors_json, cofactor) in enumerate(pending):
+        complete = factors_json is not None and cofactor is None
+        if not complete:
+            _, q = eisenstein_order(int(a), int(b), offset_c, offset_d)
+            factors = cache.get(q - 1)
+            if factors is not None:
+                factors_json = json.dumps([[str(prime), power] for prime, power in factors])
+                complete = True
+        pending[i] = (mx, generator_power, offset_c, offset_d, a, b, factors_json, complete)
+    sql = f"""INSERT OR REPLACE INTO {embedding_table}
+        (mx, generator_power, {', '.join(EMBEDDING_COLUMNS)})
+        VALUES ({', '.join('?' * (2 + len(EMBEDDING_COLUMNS)))})"""
+    batch = []
+    batch_size = 10000
+    insecure = 0
+    with multiprocessing.Pool(workers) as pool:
+        for result, q_minus_one, factored in pool.imap_unordered(analyze_embedding, pending, chunksize=64):
+            batch.append(result)
+            insecure += 1 - result[-1]
+            if factored is not None:
+                cache.put(q_minus_one, factored, commit=False)
+            if len(batch) >= batch_size:
+                conn.executemany(sql, batch)
+                manifest_update(conn, embedding_table, [row[0] for row in batch])
+                conn.commit()
+                print(f"Processed {len(batch)}")
+                batch = []
+    if batch:
+        conn.executemany(sql, batch)
+        manifest_update(conn, embedding_table, [row[0] for row in batch])
+        conn.commit()
+        print(f"Final batch processed - {len(batch)} items")
+    print(f"  Embedding degree <= {MOV_MIN_DEGREE} (MOV): {insecure}")
+    conn.close()
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python 8-embedding.py <bitsize>")
+        print("Usage: python 8-embedding.py <bitsize> [workers]")
         print("Example: python 8-embedding.py 256")
         sys.exit(1)
 
     bitsize = int(sys.argv[1])
-    if not (64 <= bitsize <= 512):
-        print("Bitsize must be between 64 and 512")
+    if not (33 <= bitsize <= 512):
+        print("Bitsize must be between 33 and 512")
         sys.exit(2)
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
 
-    show_factored_curves(bitsize)
+    process_embedding(bitsize, workers)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+# Cross-checks what the steps write against an independent implementation on small bit lengths
+#
+# The steps walk every mx below 2^31, so rather than running them whole each stage calls
+# the step's own row function over a window of the smallest primes (largest mx) and
+# writes the rows to the step's table, created by the step, in data/verify-{bitsize}.sqlite3.
+# The same rows are computed a second way into verify_{stage}_check: with Sage where the
+# step uses the lib_nt / lib_glv kernels, with the kernels where the step uses Sage. Every
+# column of the step table is diffed. Each stage takes its inputs from the step rows of
+# earlier stages, filtered like the step's pending query, so a difference shows up in the
+# stage which introduced it rather than in everything after it.
+#
+# Steps 4 onwards only see p where step 3 found p-1 = small primes * a prime. Its trial
+# division bound is 2^(L/64), below 1024 bits that would pass them next to nothing, so their
+# input is picked by step 3's row function with a bound of at least 2^16 instead. Any stage
+# which ends up with no rows, or is skipped, fails the run.
+
+import os
+import sys
+import json
+import sqlite3
+import importlib
+from math import log2
+from collections import namedtuple
+import gmpy2
+from lib_nt import primes_7mod12_window, trial_division, multiplicative_generator
+from lib_nt import eisenstein_order, EISENSTEIN_OFFSETS, ZETA_gmpy2, FactorCache, ECMCheckpoints
+from lib_glv import glv_constants
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'steps'))
+
+Stage = namedtuple('Stage', ['name', 'module', 'create', 'step', 'check'])
+
+# Trial division bound for picking the p steps 4 onwards are verified on
+INPUT_TRIAL_BITS = 16
+
+def load_step(module:str):
+    """The step script steps/{module}.py, raises ImportError if it needs Sage and there isn't any"""
+    return importlib.import_module(module)
+
+def window_primes(ctx:dict) -> list[int]:
+    return [ctx['base'] - mx for (mx,) in ctx['primes']]
+
+def cornacchia(ctx:dict) -> dict[int,tuple[int,int]]:
+    return {mx: (int(a), int(b)) for mx, a, b in ctx['cornacchia']}
+
+def family_curves(ctx:dict):
+    """(mx, generator_power, is_prime, offset_c, offset_d, a, b, g) of each curve step 5 wrote"""
+    ab = cornacchia(ctx)
+    generators = dict(ctx['generator'])
+    for mx, generator_power, is_prime, offset_c, offset_d in ctx['curves']:
+        yield (mx, generator_power, is_prime, offset_c, offset_d, *ab[mx], generators[mx])
+
+def prime_curves(ctx:dict):
+    return [curve for curve in family_curves(ctx) if curve[2]]
+
+def primes_step(step, ctx:dict):
+    return [(mx,) for mx, _ in step.walk_primes(ctx['base'], 2**31, 2**31 - ctx['width'])]
+
+def primes_check(step, ctx:dict):
+    return [(ctx['base'] - p,) for p in primes_7mod12_window(ctx['base'] - 2**31 + 1, ctx['width'])]
+
+def cornacchia_step(step, ctx:dict):
+    return step.cornacchia_rows(ctx['base'], [mx for (mx,) in ctx['primes']])
+
+def cornacchia_check(step, ctx:dict):
+    from sage.all import BinaryQF
+    form = BinaryQF([1, 0, 3])
+    rows = []
+    for (mx,), p in zip(ctx['primes'], window_primes(ctx)):
+        a, b = form.solve_integer(p)
+        rows.append((mx, str(abs(int(a))), str(abs(int(b)))))
+    return rows
+
+def trial_division_step(step, ctx:dict):
+    return [step.trial_division_row(ctx['base'], mx, int(ctx['bitsize']/64), FactorCache()) for (mx,) in ctx['primes']]
+
+def trial_division_check(step, ctx:dict):
+    rows = []
+    for (mx,), p in zip(ctx['primes'], window_primes(ctx)):
+        factors, cofactor = trial_division(p - 1, 2**int(ctx['bitsize']/64))
+        factors += [(cofactor, 1)] if cofactor > 1 else []
+        # Like step 3, factors are kept up to the first which isn't a prime to the power 1
+        kept = []
+        for prime, power in factors:
+            if power != 1 or not gmpy2.is_prime(prime):
+                break
+            kept.append([str(prime), power])
+        remaining = p - 1
+        for prime, _ in kept:
+            remaining //= int(prime)
+        rows.append((mx, json.dumps(kept), int(remaining == 1 or gmpy2.is_prime(remaining)), log2(remaining)))
+    return rows
+
+def input_trial_division(ctx:dict) -> list[tuple]:
+    """Step 3's rows for the window with a trial bound of at least 2^16, what steps 4 onwards take"""
+    if 'inputs' not in ctx:
+        step = load_step('3-trial-division')
+        bits = max(int(ctx['bitsize']/64), INPUT_TRIAL_BITS)
+        ctx['inputs'] = [step.trial_division_row(ctx['base'], mx, bits, FactorCache()) for (mx,) in ctx['primes']]
+    return ctx['inputs']
+
+def generator_pending(ctx:dict) -> list[int]:
+    """Step 4 only takes p where step 3 left a prime"""
+    return [mx for mx, _, remaining_is_prime, _ in input_trial_division(ctx) if remaining_is_prime]
+
+def generator_step(step, ctx:dict):
+    return [step.generator_row(ctx['base'], mx) for mx in generator_pending(ctx)]
+
+def generator_check(step, ctx:dict):
+    rows = []
+    trial = {mx: factors_json for mx, factors_json, _, _ in input_trial_division(ctx)}
+    for mx in generator_pending(ctx):
+        p = ctx['base'] - mx
+        primes = [int(prime) for prime, _ in json.loads(trial[mx])]
+        remaining = p - 1
+        for prime in primes:
+            remaining //= prime
+        rows.append((mx, multiplicative_generator(p, primes + ([remaining] if remaining > 1 else []))))
+    return rows
+
+def curves_pending(ctx:dict):
+    ab = cornacchia(ctx)
+    return [(mx, *ab[mx], g) for mx, g in ctx['generator']]
+
+def curves_step(step, ctx:dict):
+    return [(mx, i, int(is_prime), offset_c, offset_d)
+            for mx, i, is_prime, offset_c, offset_d in step.generate_curves_batch(curves_pending(ctx), ctx['base'])]
+
+def curves_check(step, ctx:dict):
+    from sage.all import GF, EllipticCurve
+    rows = []
+    for mx, a, b, g in curves_pending(ctx):
+        p = ctx['base'] - mx
+        # The twist whose Eisenstein order is the one Sage counts
+        offsets = {eisenstein_order(a, b, *offset)[1]: offset for offset in EISENSTEIN_OFFSETS}
+        for i in range(6):
+            q = int(EllipticCurve(GF(p), [0, pow(g, i, p)]).order())
+            rows.append((mx, i, int(gmpy2.is_prime(q)), *offsets.get(q, (None, None))))
+    return rows
+
+def glv_step(step, ctx:dict):
+    return [step.glv_row(mx, a, b, g, generator_power, offset_c, offset_d)
+            for mx, generator_power, _, offset_c, offset_d, a, b, g in prime_curves(ctx)]
+
+def first_index(n:int, value:int) -> int:
+    """Smallest i >= 2 where ZETA_gmpy2(3, i, n) == value, how step 6 numbers the roots it tries"""
+    return next(i for i in range(2, 1000) if ZETA_gmpy2(3, i, n) == value)
+
+def glv_check(step, ctx:dict):
+    rows = []
+    for mx, generator_power, _, offset_c, offset_d, a, b, g in prime_curves(ctx):
+        p, q = eisenstein_order(a, b, offset_c, offset_d)
+        beta, lambda_val = glv_constants(p, pow(g, generator_power, p), q, (a, b))[:2]
+        # Step 6 takes the first cube root of unity mod p it tries, and the lambda paired with it
+        beta_i = next(i for i in range(2, 1000) if ZETA_gmpy2(3, i, p) != 1)
+        if ZETA_gmpy2(3, beta_i, p) != beta:
+            beta, lambda_val = p - 1 - beta, q - 1 - lambda_val
+        rows.append((mx, generator_power, str(beta), str(lambda_val), beta_i, first_index(q, lambda_val)))
+    return rows
+
+def curvefactor_rows(step, ctx:dict, factor_fn) -> list[list]:
+    """Step 7's rows for every curve of a family with a prime order curve, factoring with factor_fn"""
+    families = {curve[0] for curve in prime_curves(ctx)}
+    rows = []
+    for mx, generator_power, _, offset_c, offset_d, a, b, _ in family_curves(ctx):
+        if mx in families:
+            for order_offset, result in step.factor_curve_order(a, b, offset_c, offset_d, set(), FactorCache(), factor_fn=factor_fn):
+                rows.append(step.curvefactor_row(mx, generator_power, order_offset, result))
+    return rows
+
+def curvefactor_step(step, ctx:dict):
+    return curvefactor_rows(step, ctx, step.sage_factor)
+
+def curvefactor_check(step, ctx:dict):
+    # Resumable ECM as with --time-box, rather than Sage's factor()
+    return curvefactor_rows(step, ctx, ECMCheckpoints(sqlite3.connect(':memory:')).factor)
+
+def embedding_step(step, ctx:dict):
+    factors = {(mx, generator_power): factors_json for mx, generator_power, order_offset, factors_json, *_ in ctx['curvefactor'] if order_offset == -1}
+    return [step.analyze_embedding((mx, generator_power, offset_c, offset_d, a, b, factors[(mx, generator_power)], True))[0]
+            for mx, generator_power, _, offset_c, offset_d, a, b, _ in prime_curves(ctx)]
+
+def embedding_check(step, ctx:dict):
+    # Everything from Sage's curve, rather than step 8's formulas for the Eisenstein orders
+    from sage.all import GF, EllipticCurve, QQ, cm_j_invariants_and_orders
+    cm_discriminants = {int(j): int(D) for D, _, j in cm_j_invariants_and_orders(QQ)}
+    rows = []
+    for mx, generator_power, _, _, _, _, _, g in prime_curves(ctx):
+        p = ctx['base'] - mx
+        E = EllipticCurve(GF(p), [0, pow(g, generator_power, p)])
+        q = int(E.order())
+        t = int(E.trace_of_frobenius())
+        k = int(GF(q)(p).multiplicative_order())
+        disc = int(E.frobenius_polynomial().discriminant())
+        D = cm_discriminants[int(E.j_invariant())]
+        # disc = D * v^2, v being the conductor of Z[Frobenius] in the CM field's maximal order
+        v = gmpy2.isqrt(disc // D)
+        rows.append((mx, generator_power, str(k), log2(k), str(t), str(disc), str(v), D,
+                     k * log2(p), int(k > step.MOV_MIN_DEGREE)))
+    return rows
+
+def create_step_table(step, create:str, db_path:str, bitsize:int) -> str:
+    """The step's table in db_path, made by the step's own create function"""
+    if create == 'create_trial_division_table':
+        # The one which takes a connection rather than opening the database itself
+        conn = sqlite3.connect(db_path)
+        table_name = step.create_trial_division_table(conn, bitsize)
+    else:
+        conn, table_name = getattr(step, create)(db_path, bitsize)
+    conn.close()
+    return table_name
+
+STAGES = [
+    Stage('primes', '1-primes', 'create_database_and_table', primes_step, primes_check),
+    Stage('cornacchia', '2-cornacchia', 'create_cornacchia_table', cornacchia_step, cornacchia_check),
+    Stage('trial_division', '3-trial-division', 'create_trial_division_table', trial_division_step, trial_division_check),
+    Stage('generator', '4-generator', 'create_table', generator_step, generator_check),
+    Stage('curves', '5-curves', 'create_curves_table', curves_step, curves_check),
+    Stage('glv', '6-glv', 'create_glv_table', glv_step, glv_check),
+    Stage('curvefactor', '7-curvefactor', 'create_curvefactor_table', curvefactor_step, curvefactor_check),
+    Stage('embedding', '8-embedding', 'create_embedding_table', embedding_step, embedding_check),
+]
+
+def store_rows(conn:sqlite3.Connection, table_name:str, columns:list[str], rows:list):
+    conn.executemany(f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+    conn.commit()
+
+def diff_rows(conn:sqlite3.Connection, left:str, right:str, columns:list[str]) -> list[tuple]:
+    """Rows of left which aren't in right"""
+    return conn.execute(f"SELECT {', '.join(columns)} FROM {left} EXCEPT SELECT {', '.join(columns)} FROM {right} ORDER BY 1").fetchall()
+
+def run_stage(conn:sqlite3.Connection, db_path:str, ctx:dict, stage:Stage) -> tuple[list,list,list,list]:
+    """(step rows, check rows, missing, extra), the step's rows in its own table & the check's beside it"""
+    step = load_step(stage.module)
+    step_rows = stage.step(step, ctx)
+    check_rows = stage.check(step, ctx)
+    step_table = f"{stage.name}_2p{ctx['bitsize']}_m2p32_mx"
+    check_table = f"verify_{stage.name}_check"
+    for table_name in (step_table, check_table):
+        conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+    conn.commit()
+    create_step_table(step, stage.create, db_path, ctx['bitsize'])
+    conn.execute(f"CREATE TABLE {check_table} AS SELECT * FROM {step_table} WHERE 0")
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({step_table})")]
+    store_rows(conn, step_table, columns, step_rows)
+    store_rows(conn, check_table, columns, check_rows)
+    missing = diff_rows(conn, step_table, check_table, columns)
+    extra = diff_rows(conn, check_table, step_table, columns)
+    return step_rows, check_rows, missing, extra
+
+def verify(bitsize:int, width:int=2**16) -> int:
+    os.makedirs('data', exist_ok=True)
+    db_path = f"data/verify-{bitsize}.sqlite3"
+    conn = sqlite3.connect(db_path)
+    # The same end step 1 starts from, mx just below 2^31
+    ctx = {'bitsize': bitsize, 'base': 2**bitsize - 2**32, 'width': width}
+    failed = 0
+    for stage in STAGES:
+        try:
+            step_rows, check_rows, missing, extra = run_stage(conn, db_path, ctx, stage)
+        except ImportError as e:
+            print(f"{stage.name:>16}: skipped, needs Sage ({e})")
+            failed += 1
+            continue
+        except KeyError as e:
+            print(f"{stage.name:>16}: skipped, needs the {e} stage")
+            failed += 1
+            continue
+        status = 'DIFFERS' if missing or extra else ('OK' if step_rows else 'no rows')
+        print(f"{stage.name:>16}: {len(step_rows)} step rows, {len(check_rows)} check, {status}")
+        for row in missing[:5]:
+            print(f"{'':>18}- {row}")
+        for row in extra[:5]:
+            print(f"{'':>18}+ {row}")
+        # A stage with nothing to compare hasn't verified anything
+        failed += bool(missing or extra or not (step_rows and check_rows))
+        ctx[stage.name] = step_rows
+    conn.close()
+    if failed:
+        print(f"{failed} of {len(STAGES)} stages failed")
+    return 1 if failed else 0
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python verify.py <bitsize> [width]")
+        print("Example: python verify.py 48")
+        print("Example: python verify.py 64 262144")
+        sys.exit(1)
+    try:
+        bitsize = int(sys.argv[1])
+        width = int(sys.argv[2]) if len(sys.argv) > 2 else 2**16
+    except ValueError:
+        print("Bitsize and width must be integers")
+        sys.exit(1)
+    if not (33 <= bitsize <= 128):
+        print("Bitsize must be between 33 and 128, Sage point counting & factoring are the check")
+        sys.exit(1)
+    sys.exit(verify(bitsize, width))
+
+if __name__ == "__main__":
+    main()